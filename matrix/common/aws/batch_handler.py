@@ -21,13 +21,14 @@ class BatchHandler:
         self._client = boto3.client("batch", region_name=os.environ['AWS_DEFAULT_REGION'])
 
     @retry(reraise=True, wait=wait_fixed(2), stop=stop_after_attempt(5))
-    def schedule_matrix_conversion(self, request_id: str, format: str, s3_results_key: str):
+    def schedule_matrix_conversion(self, request_id: str, format: str, s3_results_key: str, feature_table_url: str):
         """
         Schedule a matrix conversion job within aws batch infra
 
         :param request_id: UUID identifying a matrix service request.
         :param format: User requested output file format of final expression matrix.
         :param s3_results_key: S3 key where the matrix results will be written to.
+        :param feature_table_url: S3 url of the feature table of the request's data version and feature.
         """
         Logging.set_correlation_id(logger, value=request_id)
         job_name = "-".join(["conversion",
@@ -37,7 +38,6 @@ class BatchHandler:
 
         source_expression_manifest = f"s3://{self.s3_query_results_bucket}/{request_id}/expression_manifest"
         source_cell_manifest = f"s3://{self.s3_query_results_bucket}/{request_id}/cell_metadata_manifest"
-        source_gene_manifest = f"s3://{self.s3_query_results_bucket}/{request_id}/gene_metadata_manifest"
         target_path = f"s3://{self.s3_results_bucket}/{s3_results_key}"
         working_dir = f"/data/{request_id}"
         command = ['python3',
@@ -45,7 +45,7 @@ class BatchHandler:
                    request_id,
                    source_expression_manifest,
                    source_cell_manifest,
-                   source_gene_manifest,
+                   feature_table_url,
                    target_path,
                    format,
                    working_dir]
@@ -54,7 +54,9 @@ class BatchHandler:
             'DEPLOYMENT_STAGE': self.deployment_stage,
             'DYNAMO_DATA_VERSION_TABLE_NAME': DynamoTable.DATA_VERSION_TABLE.value,
             'DYNAMO_DEPLOYMENT_TABLE_NAME': DynamoTable.DEPLOYMENT_TABLE.value,
-            'DYNAMO_REQUEST_TABLE_NAME': DynamoTable.REQUEST_TABLE.value
+            'DYNAMO_REQUEST_TABLE_NAME': DynamoTable.REQUEST_TABLE.value,
+            'DYNAMO_IN_FLIGHT_REQUEST_TABLE_NAME': DynamoTable.IN_FLIGHT_REQUEST_TABLE.value,
+            'DYNAMO_RESULT_CACHE_TABLE_NAME': DynamoTable.RESULT_CACHE_TABLE.value
         }
 
         batch_job_id = self._enqueue_batch_job(job_name=job_name,
@@ -17,6 +17,18 @@ class MetricName(Enum):
     CACHE_HIT = "Matrix Cache Hit"
     CACHE_MISS = "Matrix Cache Miss"
     DURATION = "Matrix Request Duration"
+    CONVERSION_STAGE_DURATION = "Matrix Conversion Stage Duration"
+    CONVERSION_PEAK_MEMORY = "Matrix Conversion Peak Memory"
+    CONVERSION_OUTPUT_SIZE = "Matrix Conversion Output Size"
+    CONVERSION_ROWS = "Matrix Conversion Rows"
+    QUERY_DURATION = "Matrix Query Duration"
+    QUERY_QUEUE_TIME = "Matrix Query Queue Time"
+    QUERY_CONCURRENCY = "Matrix Query Concurrency"
+    QUERY_CONCURRENCY_LIMIT = "Matrix Query Concurrency Limit"
+
+
+# Maximum number of datapoints in a single PutMetricData call
+MAX_METRIC_DATA_PER_PUT = 20
 
 
 class CloudwatchHandler:
@@ -43,3 +55,26 @@ class CloudwatchHandler:
             metric_data['Dimensions'] = metric_dimensions
 
         self._client.put_metric_data(MetricData=[metric_data], Namespace=self.namespace)
+
+    def put_metric_data_batch(self,
+                              metrics: typing.List[typing.Tuple[MetricName,
+                                                                typing.Union[int, float],
+                                                                typing.List[dict]]]):
+        """
+        Puts several cloudwatch metric data points in as few requests as possible
+
+        :param metrics: (metric_name, metric_value, metric_dimensions) tuples of the metrics to put
+        """
+        metric_data = []
+        for metric_name, metric_value, metric_dimensions in metrics:
+            datum = {
+                'MetricName': metric_name.value,
+                'Value': metric_value
+            }
+            if metric_dimensions:
+                datum['Dimensions'] = metric_dimensions
+            metric_data.append(datum)
+
+        for start in range(0, len(metric_data), MAX_METRIC_DATA_PER_PUT):
+            self._client.put_metric_data(MetricData=metric_data[start:start + MAX_METRIC_DATA_PER_PUT],
+                                         Namespace=self.namespace)
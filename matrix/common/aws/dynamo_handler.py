@@ -21,6 +21,8 @@ class DynamoTable(Enum):
     DATA_VERSION_TABLE = os.getenv("DYNAMO_DATA_VERSION_TABLE_NAME")
     DEPLOYMENT_TABLE = os.getenv("DYNAMO_DEPLOYMENT_TABLE_NAME")
     REQUEST_TABLE = os.getenv("DYNAMO_REQUEST_TABLE_NAME")
+    IN_FLIGHT_REQUEST_TABLE = os.getenv("DYNAMO_IN_FLIGHT_REQUEST_TABLE_NAME")
+    RESULT_CACHE_TABLE = os.getenv("DYNAMO_RESULT_CACHE_TABLE_NAME")
 
 
 class TableField(Enum):
@@ -66,6 +68,28 @@ class RequestTableField(TableField):
     COMPLETED_CONVERTER_EXECUTIONS = "CompletedConverterExecutions"
     BATCH_JOB_ID = "BatchJobId"
     ERROR_MESSAGE = "ErrorMessage"
+    COALESCED_REQUEST_ID = "CoalescedRequestId"
+    REQUEST_KEY = "RequestKey"
+
+
+class InFlightRequestTableField(TableField):
+    """
+    Field names for In Flight Request table in DynamoDB.
+    """
+    REQUEST_KEY = "RequestKey"
+    REQUEST_ID = "RequestId"
+    CREATION_DATE = "CreationDate"
+    EXPIRATION_TIME = "ExpirationTime"
+
+
+class ResultCacheTableField(TableField):
+    """
+    Field names for Result Cache table in DynamoDB.
+    """
+    REQUEST_KEY = "RequestKey"
+    REQUEST_ID = "RequestId"
+    CREATION_DATE = "CreationDate"
+    EXPIRATION_TIME = "ExpirationTime"
 
 
 class DynamoHandler:
@@ -87,6 +111,14 @@ class DynamoHandler:
             DynamoTable.REQUEST_TABLE: {
                 'primary_key': RequestTableField.REQUEST_ID.value,
                 'resource': self._dynamo.Table(DynamoTable.REQUEST_TABLE.value)
+            },
+            DynamoTable.IN_FLIGHT_REQUEST_TABLE: {
+                'primary_key': InFlightRequestTableField.REQUEST_KEY.value,
+                'resource': self._dynamo.Table(DynamoTable.IN_FLIGHT_REQUEST_TABLE.value)
+            },
+            DynamoTable.RESULT_CACHE_TABLE: {
+                'primary_key': ResultCacheTableField.REQUEST_KEY.value,
+                'resource': self._dynamo.Table(DynamoTable.RESULT_CACHE_TABLE.value)
             }
         }
 
@@ -110,15 +142,17 @@ class DynamoHandler:
         """
         return self.tables[dynamo_table]['primary_key']
 
-    def create_data_version_table_entry(self, version: int):
+    def create_data_version_table_entry(self, version: int, project_cell_counts: dict = None):
         """
         Put a new item in the Data Version table responsible for describing the current and
         previous Redshift data versions for a deployment.
         If the new version already exists, it will be overwritten by the new entry.
         :param version: Version number to create
+        :param project_cell_counts: Number of cells of each project, fetched from the API if not given
         """
-        api_handler = V1ApiHandler()
-        project_cell_counts = api_handler.describe_filter("project.provenance.document_id")['cell_counts']
+        if project_cell_counts is None:
+            api_handler = V1ApiHandler()
+            project_cell_counts = api_handler.describe_filter("project.provenance.document_id")['cell_counts']
 
         metadata_schema_versions = {}
         for schema_name in SUPPORTED_METADATA_SCHEMA_VERSIONS:
@@ -164,12 +198,76 @@ class DynamoHandler:
                 RequestTableField.ROW_COUNT.value: 0,
                 RequestTableField.EXPECTED_DRIVER_EXECUTIONS.value: 1,
                 RequestTableField.COMPLETED_DRIVER_EXECUTIONS.value: 0,
-                RequestTableField.EXPECTED_QUERY_EXECUTIONS.value: 3,
+                RequestTableField.EXPECTED_QUERY_EXECUTIONS.value: 2,
                 RequestTableField.COMPLETED_QUERY_EXECUTIONS.value: 0,
                 RequestTableField.EXPECTED_CONVERTER_EXECUTIONS.value: 1,
                 RequestTableField.COMPLETED_CONVERTER_EXECUTIONS.value: 0,
                 RequestTableField.BATCH_JOB_ID.value: "N/A",
-                RequestTableField.ERROR_MESSAGE.value: 0
+                RequestTableField.ERROR_MESSAGE.value: 0,
+                RequestTableField.COALESCED_REQUEST_ID.value: "N/A",
+                RequestTableField.REQUEST_KEY.value: "N/A"
+            }
+        )
+
+    def put_in_flight_request_table_entry(self,
+                                          request_key: str,
+                                          request_id: str,
+                                          ttl_seconds: int,
+                                          replaced_request_id: str = None) -> str:
+        """
+        Register a request as the in flight request for a request key, unless another request already is.
+        The entry expires through the table's TTL after ttl_seconds.
+
+        :param request_key: Key identifying the normalized request parameters.
+        :param request_id: UUID of the request to register.
+        :param ttl_seconds: Number of seconds after which the entry expires.
+        :param replaced_request_id: If set, only replace the entry if it is registered to this request ID.
+        :return: str The request ID registered for the request key after the put
+        """
+        dynamo_table = self._get_dynamo_table_resource_from_enum(DynamoTable.IN_FLIGHT_REQUEST_TABLE)
+        request_key_field = InFlightRequestTableField.REQUEST_KEY.value
+        request_id_field = InFlightRequestTableField.REQUEST_ID.value
+
+        if replaced_request_id:
+            condition_kwargs = {
+                'ConditionExpression': f"{request_id_field} = :r",
+                'ExpressionAttributeValues': {":r": replaced_request_id}
+            }
+        else:
+            condition_kwargs = {'ConditionExpression': f"attribute_not_exists({request_key_field})"}
+
+        try:
+            dynamo_table.put_item(
+                Item={
+                    request_key_field: request_key,
+                    request_id_field: request_id,
+                    InFlightRequestTableField.CREATION_DATE.value: date.get_datetime_now(as_string=True),
+                    InFlightRequestTableField.EXPIRATION_TIME.value: int(time.time()) + ttl_seconds
+                },
+                **condition_kwargs
+            )
+        except botocore.exceptions.ClientError as exc:
+            if exc.response['Error']['Code'] != "ConditionalCheckFailedException":
+                raise
+            return self.get_table_item(DynamoTable.IN_FLIGHT_REQUEST_TABLE, key=request_key)[request_id_field]
+
+        return request_id
+
+    def put_result_cache_table_entry(self, request_key: str, request_id: str, ttl_seconds: int):
+        """
+        Record the request whose completed matrix serves requests with a request key,
+        overwriting any previously recorded request. The entry expires through the table's TTL after ttl_seconds.
+
+        :param request_key: Key identifying the normalized request parameters.
+        :param request_id: UUID of the completed request.
+        :param ttl_seconds: Number of seconds after which the entry expires.
+        """
+        self._get_dynamo_table_resource_from_enum(DynamoTable.RESULT_CACHE_TABLE).put_item(
+            Item={
+                ResultCacheTableField.REQUEST_KEY.value: request_key,
+                ResultCacheTableField.REQUEST_ID.value: request_id,
+                ResultCacheTableField.CREATION_DATE.value: date.get_datetime_now(as_string=True),
+                ResultCacheTableField.EXPIRATION_TIME.value: int(time.time()) + ttl_seconds
             }
         )
 
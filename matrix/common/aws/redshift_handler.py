@@ -1,8 +1,13 @@
 import psycopg2 as pg
+import threading
+import time
 import typing
 from enum import Enum
 
 from matrix.common.config import MatrixRedshiftConfig
+from matrix.common.logging import Logging
+
+logger = Logging.get_logger(__name__)
 
 
 class TableName(Enum):
@@ -21,6 +26,118 @@ class TableName(Enum):
     WRITE_LOCK = "write_lock"
 
 
+class ConnectionPool:
+    """
+    Pool of open connections to a database, reused across transactions.
+
+    Connections are checked out for the duration of a transaction and returned once it
+    commits, or closed if it fails. Idle connections older than max_idle_seconds are
+    closed rather than reused, since the network between Lambda or ECS and Redshift
+    drops idle connections, and connections idle for longer than health_check_seconds
+    are checked with a trivial query before they are reused. At most max_size idle
+    connections are kept; a transaction that finds none idle opens a new connection.
+    """
+
+    HEALTH_CHECK_QUERY = "SELECT 1;"
+
+    def __init__(self,
+                 database_uri: str,
+                 max_size: int = 4,
+                 max_idle_seconds: float = 5 * 60,
+                 health_check_seconds: float = 30):
+        self.database_uri = database_uri
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_seconds = health_check_seconds
+
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> typing.Tuple[typing.Any, bool]:
+        """
+        Checks out a healthy idle connection, or opens a new one if there is none.
+        :return: tuple of the connection and whether it was reused from the pool
+        """
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, released_at = self._idle.pop()
+
+            idle_seconds = time.time() - released_at
+            if conn.closed or idle_seconds >= self.max_idle_seconds:
+                self.discard(conn)
+            elif idle_seconds >= self.health_check_seconds and not self._is_healthy(conn):
+                self.discard(conn)
+            else:
+                return conn, True
+
+        return pg.connect(self.database_uri), False
+
+    def release(self, conn):
+        """
+        Returns a connection with no open transaction to the pool.
+        """
+        with self._lock:
+            if not conn.closed and len(self._idle) < self.max_size:
+                self._idle.append((conn, time.time()))
+                return
+        self.discard(conn)
+
+    @staticmethod
+    def discard(conn):
+        """
+        Closes a connection that won't be returned to the pool.
+        """
+        try:
+            conn.close()
+        except pg.Error:
+            pass
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self.discard(conn)
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.HEALTH_CHECK_QUERY)
+            conn.rollback()
+            return True
+        except pg.Error:
+            logger.info("Closing unhealthy idle Redshift connection")
+            return False
+
+
+# Connection pools by database URI, kept at module level so that they are shared by every
+# RedshiftHandler in a process and survive across warm Lambda invocations
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(database_uri: str) -> ConnectionPool:
+    with _connection_pools_lock:
+        if database_uri not in _connection_pools:
+            _connection_pools[database_uri] = ConnectionPool(database_uri)
+        return _connection_pools[database_uri]
+
+
+def close_connection_pools():
+    """
+    Closes the idle connections of every pool.
+    """
+    with _connection_pools_lock:
+        pools = list(_connection_pools.values())
+        _connection_pools.clear()
+    for pool in pools:
+        pool.close()
+
+
 class RedshiftHandler:
     """
     Interface for interacting with redshift cluster.
@@ -49,16 +166,61 @@ class RedshiftHandler:
         return self.redshift_config.readonly_database_uri
 
     def transaction(self, queries: typing.List[str], return_results=False, read_only=False):
-        if read_only:
-            conn = pg.connect(self.readonly_database_uri)
-        else:
-            conn = pg.connect(self.database_uri)
-        results = []
-        cursor = conn.cursor()
-        for query in queries:
-            cursor.execute(query)
-        if return_results:
-            results = cursor.fetchall()
-        conn.commit()
-        conn.close()
-        return results
+        def run(cursor):
+            for query in queries:
+                cursor.execute(query)
+            return cursor.fetchall() if return_results else []
+
+        return self._run_transaction(run, read_only)
+
+    def fetch_all(self, queries: typing.List[str], read_only=False) -> typing.List[list]:
+        """
+        Runs queries over a single connection, returning the results of each.
+        :param queries: Queries to run
+        :param read_only: Whether to connect as the read only user
+        :return: list of the results of each query, in order
+        """
+        def run(cursor):
+            results = []
+            for query in queries:
+                cursor.execute(query)
+                results.append(cursor.fetchall())
+            return results
+
+        return self._run_transaction(run, read_only)
+
+    def _run_transaction(self, run: typing.Callable, read_only: bool):
+        """
+        Runs and commits a transaction on a pooled connection. A transaction whose queries fail
+        because a reused connection was dropped is retried on another connection, as it can't
+        have been committed. A failure during the commit is never retried, since the commit may
+        have gone through before the connection was lost. Any failure that isn't retried closes
+        the connection and is raised.
+        :param run: Function of a cursor running the transaction's queries and returning its results
+        :param read_only: Whether to connect as the read only user
+        :return: The results returned by run
+        """
+        pool = get_connection_pool(self.readonly_database_uri if read_only else self.database_uri)
+
+        while True:
+            conn, reused = pool.acquire()
+            try:
+                results = run(conn.cursor())
+            except (pg.OperationalError, pg.InterfaceError):
+                lost_connection = bool(conn.closed)
+                pool.discard(conn)
+                if reused and lost_connection:
+                    logger.info("Reconnecting to Redshift after losing a pooled connection")
+                    continue
+                raise
+            except Exception:
+                pool.discard(conn)
+                raise
+
+            try:
+                conn.commit()
+            except Exception:
+                pool.discard(conn)
+                raise
+            pool.release(conn)
+            return results
@@ -1,5 +1,12 @@
+import collections
+import concurrent.futures
+
 import boto3
 
+# S3 requires every part of a multipart upload but the last to be at least 5MB
+MULTIPART_UPLOAD_PART_SIZE = 64 * 1024 * 1024
+MULTIPART_UPLOAD_CONCURRENCY = 4
+
 
 class S3Handler:
     """
@@ -31,6 +38,36 @@ class S3Handler:
         }
         self.s3_bucket.copy(src, dst_key)
 
+    def open_multipart_upload(self,
+                              obj_key: str,
+                              part_size: int = MULTIPART_UPLOAD_PART_SIZE,
+                              concurrency: int = MULTIPART_UPLOAD_CONCURRENCY):
+        """
+        Opens a write-only stream into a multipart upload to this S3 bucket.
+        :param obj_key: S3 key of the object to upload
+        :param part_size: Size in bytes of the uploaded parts
+        :param concurrency: Maximum number of parts uploaded at the same time
+        :return: S3MultipartUploadStream
+        """
+        return S3MultipartUploadStream(self.s3_client, self.s3_bucket.name, obj_key, part_size, concurrency)
+
+    def download_file(self, obj_key: str, path: str):
+        """
+        Downloads an object to a local file. Large objects are fetched in byte ranges
+        concurrently.
+        :param obj_key: S3 key of the object to download
+        :param path: Local path to download the object to
+        """
+        self.s3_bucket.download_file(obj_key, path)
+
+    def etag(self, obj_key: str) -> str:
+        """
+        Retrieves the ETag of an object, which changes whenever the object's content does.
+        :param obj_key: S3 key of the object
+        :return: ETag of the object
+        """
+        return self.s3_client.head_object(Bucket=self.s3_bucket.name, Key=obj_key)['ETag']
+
     def ls(self, key):
         response = self.s3_client.list_objects_v2(Bucket=self.s3_bucket.name, Prefix=key)
         return response.get('Contents', [])
@@ -52,3 +89,103 @@ class S3Handler:
         )
 
         return response['Deleted'] if 'Deleted' in response else []
+
+
+class S3MultipartUploadStream:
+    """
+    Write-only, unseekable file object that streams its content into an S3 multipart upload.
+
+    Written bytes are buffered into parts that are uploaded on a thread pool while the
+    caller keeps writing. At most twice the concurrency parts are buffered or in flight
+    at a time, so writes block when the upload falls behind. Closing the stream
+    completes the upload. Used as a context manager, the upload is aborted instead if
+    the block raises.
+    """
+
+    def __init__(self, s3_client, bucket: str, obj_key: str, part_size: int, concurrency: int):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.obj_key = obj_key
+        self.part_size = part_size
+        self.concurrency = concurrency
+
+        self.upload_id = self.s3_client.create_multipart_upload(Bucket=bucket, Key=obj_key)['UploadId']
+        self.closed = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        self._pending_parts = collections.deque()
+        self._uploaded_parts = []
+        self._buffer = bytearray()
+        self._position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data) -> int:
+        self._buffer.extend(data)
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """
+        Uploads the remaining buffered bytes as the last part and completes the upload.
+        """
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._uploaded_parts and not self._pending_parts:
+                self._upload_part(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending_parts:
+                self._wait_for_oldest_part()
+            self.s3_client.complete_multipart_upload(Bucket=self.bucket,
+                                                     Key=self.obj_key,
+                                                     UploadId=self.upload_id,
+                                                     MultipartUpload={'Parts': self._uploaded_parts})
+        except Exception:
+            self.abort()
+            raise
+        self.closed = True
+        self._executor.shutdown()
+
+    def abort(self):
+        """
+        Cancels the parts that haven't started uploading and aborts the upload.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for _, future in self._pending_parts:
+            future.cancel()
+        self._executor.shutdown()
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.obj_key, UploadId=self.upload_id)
+
+    def _upload_part(self, body: bytes):
+        if len(self._pending_parts) >= 2 * self.concurrency:
+            self._wait_for_oldest_part()
+        part_number = len(self._uploaded_parts) + len(self._pending_parts) + 1
+        future = self._executor.submit(self.s3_client.upload_part,
+                                       Bucket=self.bucket,
+                                       Key=self.obj_key,
+                                       UploadId=self.upload_id,
+                                       PartNumber=part_number,
+                                       Body=body)
+        self._pending_parts.append((part_number, future))
+
+    def _wait_for_oldest_part(self):
+        part_number, future = self._pending_parts.popleft()
+        self._uploaded_parts.append({'PartNumber': part_number, 'ETag': future.result()['ETag']})
@@ -1,8 +1,16 @@
 import json
+import threading
+import typing
 
 import boto3
 
 from matrix.common.exceptions import MatrixException
+from matrix.common.logging import Logging
+
+logger = Logging.get_logger(__name__)
+
+# Maximum number of messages a single receive or batch request handles
+MAX_BATCH_SIZE = 10
 
 
 class SQSHandler:
@@ -41,3 +49,94 @@ class SQSHandler:
             raise MatrixException(status=500, title="Internal error",
                                   detail=f"Deleting message with receipt handle {receipt_handle} from {queue_url} "
                                          f"was unsuccessful with status {status})")
+
+    def delete_messages_from_queue(self, queue_url: str, receipt_handles: typing.List[str]):
+        """
+        Deletes messages from a queue in as few requests as possible.
+        :param queue_url: URL of the queue
+        :param receipt_handles: Receipt handles of the messages to delete
+        """
+        for start in range(0, len(receipt_handles), MAX_BATCH_SIZE):
+            entries = [{'Id': str(idx), 'ReceiptHandle': receipt_handle}
+                       for idx, receipt_handle in enumerate(receipt_handles[start:start + MAX_BATCH_SIZE])]
+            response = self.sqs.meta.client.delete_message_batch(QueueUrl=queue_url, Entries=entries)
+            self._check_batch_response(response, f"Deleting messages from {queue_url}")
+
+    def change_message_visibility(self, queue_url: str, receipt_handles: typing.List[str], visibility_timeout: int):
+        """
+        Sets the time until messages become visible again to consumers of a queue, in as few requests as possible.
+        :param queue_url: URL of the queue
+        :param receipt_handles: Receipt handles of the messages
+        :param visibility_timeout: Seconds from now until the messages become visible
+        """
+        for start in range(0, len(receipt_handles), MAX_BATCH_SIZE):
+            entries = [{'Id': str(idx), 'ReceiptHandle': receipt_handle, 'VisibilityTimeout': visibility_timeout}
+                       for idx, receipt_handle in enumerate(receipt_handles[start:start + MAX_BATCH_SIZE])]
+            response = self.sqs.meta.client.change_message_visibility_batch(QueueUrl=queue_url, Entries=entries)
+            self._check_batch_response(response, f"Changing the visibility of messages in {queue_url}")
+
+    @staticmethod
+    def _check_batch_response(response: dict, action: str):
+        status = response['ResponseMetadata']['HTTPStatusCode']
+        failed = response.get('Failed', [])
+        if status != 200 or failed:
+            raise MatrixException(status=500, title="Internal error",
+                                  detail=f"{action} was unsuccessful with status {status} "
+                                         f"and failed entries {failed})")
+
+
+class VisibilityHeartbeat:
+    """
+    Keeps messages that are still being processed invisible to other consumers of a queue,
+    so that processing that outlives the queue's visibility timeout isn't repeated. While
+    started, the visibility timeout of every added message is extended to
+    visibility_timeout seconds every interval seconds, until the message is removed.
+    """
+
+    def __init__(self, sqs_handler: SQSHandler, queue_url: str, visibility_timeout: int = 600, interval: int = 120):
+        self.sqs_handler = sqs_handler
+        self.queue_url = queue_url
+        self.visibility_timeout = visibility_timeout
+        self.interval = interval
+
+        self._receipt_handles = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, receipt_handle: str):
+        with self._lock:
+            self._receipt_handles.add(receipt_handle)
+
+    def remove(self, receipt_handles: typing.Iterable[str]):
+        with self._lock:
+            self._receipt_handles.difference_update(receipt_handles)
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def beat(self):
+        """
+        Extends the visibility timeout of the messages being processed.
+        """
+        with self._lock:
+            receipt_handles = sorted(self._receipt_handles)
+        if not receipt_handles:
+            return
+        try:
+            self.sqs_handler.change_message_visibility(self.queue_url, receipt_handles, self.visibility_timeout)
+        except Exception as e:
+            logger.warning(f"Failed to extend the visibility of {len(receipt_handles)} messages in "
+                           f"{self.queue_url} with error {e}")
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.beat()
@@ -9,6 +9,9 @@ class MatrixFormat(Enum):
     LOOM = "loom"
     CSV = "csv"
     MTX = "mtx"
+    ZARR = "zarr"
+    H5AD = "h5ad"
+    PARQUET = "parquet"
 
 
 class MatrixFeature(Enum):
@@ -52,6 +55,10 @@ DEFAULT_FIELDS = ["cell.cell_suspension_id", "cell.genes_detected", "cell.file_u
 
 DEFAULT_FEATURE = MatrixFeature.GENE.value
 
+# Suffix of the conversion run report written next to a converted matrix. Reports share
+# the matrix's results prefix, so they must be skipped when looking up cached matrices.
+RUN_REPORT_SUFFIX = ".report.json"
+
 
 MATRIX_ENV_TO_DSS_ENV = {
     'predev': "prod",
@@ -453,6 +460,137 @@ Full descriptions of those fields are forthcoming.</p>
 <p>The gene metadata contains basic information about the genes in the count matrix.
 Each row is a gene, and each row corresponds to the same row in the expression mtx file.
 Note that <code>featurename</code> is not unique.</p>
+""",
+    MatrixFormat.ZARR.value: """
+<h2>HCA Matrix Service Zarr Output</h2>
+<p>The zarr-formatted output from the matrix service is a zip archive that contains a
+<a href="https://zarr.readthedocs.io/en/stable/">zarr</a> directory store with these arrays:</p>
+<table class="table table-striped table-bordered">
+<thead>
+<tr>
+<th>Array</th>
+<th>Description</th>
+</tr>
+</thead>
+<tbody>
+<tr>
+<td>&lt;directory_name&gt;/expression</td>
+<td>Expression values</td>
+</tr>
+<tr>
+<td>&lt;directory_name&gt;/cell_id</td>
+<td>Cell keys</td>
+</tr>
+<tr>
+<td>&lt;directory_name&gt;/cell_metadata/&lt;field&gt;</td>
+<td>Cell metadata, one array per field</td>
+</tr>
+<tr>
+<td>&lt;directory_name&gt;/gene_id</td>
+<td>Ensembl IDs of the genes (or transcripts)</td>
+</tr>
+<tr>
+<td>&lt;directory_name&gt;/gene_metadata/&lt;field&gt;</td>
+<td>Gene (or transcript) metadata, one array per field</td>
+</tr>
+</tbody>
+</table>
+
+<h3><code>expression</code></h3>
+<p>A two-dimensional float32 array where rows are cells and columns are genes or transcripts.
+The rows are aligned with <code>cell_id</code> and the cell metadata arrays, and the columns
+with <code>gene_id</code> and the gene metadata arrays. The array is chunked by cell and
+compressed, so a subset of cells can be read without reading the whole matrix.</p>
+
+<p>The expression values are meant to be a "raw" count, so for SmartSeq2 experiments, this
+is the <code>expected_count</code> field from
+<a href="http://deweylab.biostat.wisc.edu/rsem/rsem-calculate-expression.html#output">RSEM
+output</a>. For 10x experiments analyzed with Cell Ranger, this is read from the
+<code>matrix.mtx</code> file that Cell Ranger produces as its filtered feature-barcode matrix.</p>
+
+<h3><code>cell_metadata</code></h3>
+<p>Each array in the cell metadata group is a different metadata field. Descriptions of some of
+the metadata fields can be found at the
+<a href="https://prod.data.humancellatlas.org/metadata">HCA Data Browser</a>. Additional
+fields, <code>genes_detected</code> for example, are calculated during secondary analysis.
+Full descriptions of those fields are forthcoming.</p>
+
+<h3><code>gene_metadata</code></h3>
+<p>The gene metadata contains basic information about the genes in the count matrix.
+Note that <code>featurename</code> is not unique.</p>
+""",
+    MatrixFormat.H5AD.value: """
+<h2>HCA Matrix Service H5AD Output</h2>
+
+<p>The h5ad-formatted output from the matrix service is an
+<a href="https://anndata.readthedocs.io/en/stable/">AnnData</a> file with the cells and
+metadata fields specified in the query. It can be read directly with
+<code>scanpy.read_h5ad</code> or <code>anndata.read_h5ad</code>.</p>
+
+<p>Per AnnData conventions, the rows of the expression matrix <code>X</code> represent cells
+and the columns represent genes. <code>X</code> is a sparse CSR matrix of "raw" counts, so for
+SmartSeq2 experiments this is the <code>expected_count</code> field from
+<a href="http://deweylab.biostat.wisc.edu/rsem/rsem-calculate-expression.html#output">RSEM
+output</a>, and for 10x experiments analyzed with Cell Ranger it is read from the
+<code>matrix.mtx</code> file that Cell Ranger produces as its filtered feature-barcode matrix.</p>
+
+<p>The <code>obs</code> table is indexed by cellkey and holds the cell metadata fields.
+Descriptions of the metadata fields are available at the
+<a href="https://prod.data.humancellatlas.org/metadata">HCA Data Browser</a>. The
+<code>var</code> table is indexed by Ensembl ID and holds the gene (or transcript) metadata.
+Note that <code>featurename</code> is not unique.</p>
+""",
+    MatrixFormat.PARQUET.value: """
+<h2>HCA Matrix Service Parquet Output</h2>
+<p>The parquet-formatted output from the matrix service is a zip archive that contains three
+<a href="https://parquet.apache.org/">Apache Parquet</a> files:</p>
+<table class="table table-striped table-bordered">
+<thead>
+<tr>
+<th>Filename</th>
+<th>Description</th>
+</tr>
+</thead>
+<tbody>
+<tr>
+<td>&lt;directory_name&gt;/expression.parquet</td>
+<td>Expression values</td>
+</tr>
+<tr>
+<td>&lt;directory_name&gt;/cells.parquet</td>
+<td>Cell metadata</td>
+</tr>
+<tr>
+<td>&lt;directory_name&gt;/genes.parquet</td>
+<td>Gene (or transcript) metadata</td>
+</tr>
+</tbody>
+</table>
+
+<h3><code>expression.parquet</code></h3>
+<p>The expression table is in "long" format with three columns, <code>cellkey</code>,
+<code>featurekey</code> and <code>exprvalue</code>, and one row for each non-zero expression
+value. <code>cellkey</code> joins with the cell metadata table and <code>featurekey</code>, an
+Ensembl ID, joins with the gene metadata table. Files can be read with
+<code>pandas.read_parquet</code> or any other Parquet reader, and a subset of columns can be
+read without reading the whole table.</p>
+
+<p>The expression values are meant to be a "raw" count, so for SmartSeq2 experiments, this
+is the <code>expected_count</code> field from
+<a href="http://deweylab.biostat.wisc.edu/rsem/rsem-calculate-expression.html#output">RSEM
+output</a>. For 10x experiments analyzed with Cell Ranger, this is read from the
+<code>matrix.mtx</code> file that Cell Ranger produces as its filtered feature-barcode matrix.</p>
+
+<h3><code>cells.parquet</code></h3>
+<p>Each row of the cell metadata table represents a cell, and each column is a different metadata
+field. Descriptions of some of the metadata fields can be found at the
+<a href="https://prod.data.humancellatlas.org/metadata">HCA Data Browser</a>. Additional
+fields, <code>genes_detected</code> for example, are calculated during secondary analysis.
+Full descriptions of those fields are forthcoming.</p>
+
+<h3><code>genes.parquet</code></h3>
+<p>The gene metadata contains basic information about the genes in the count matrix.
+Note that <code>featurename</code> is not unique.</p>
 """
 }
 
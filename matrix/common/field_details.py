@@ -0,0 +1,205 @@
+"""Statistics of the metadata fields served by /filters/{name} and /fields/{name}."""
+
+import collections
+import decimal
+import json
+import os
+import threading
+import time
+import typing
+
+from botocore.exceptions import ClientError
+
+from matrix.common import constants
+from matrix.common import query_constructor
+from matrix.common.aws.dynamo_handler import DeploymentTableField, DynamoHandler, DynamoTable
+from matrix.common.aws.redshift_handler import RedshiftHandler, TableName
+from matrix.common.aws.s3_handler import S3Handler
+from matrix.common.logging import Logging
+
+logger = Logging.get_logger(__name__)
+
+FIELD_DETAILS_PREFIX = "field_details"
+
+# Name under which a data version's cell summary is stored alongside its field details
+CELL_SUMMARY = "cell_summary"
+
+# Number of field details kept in memory, and how long they and the current data version are
+# served from memory before being read again
+FIELD_DETAIL_CACHE_SIZE = 64
+FIELD_DETAIL_CACHE_TTL_SECONDS = 5 * 60
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries expire ttl_seconds after they are put.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key: Key of the entry
+        :return: The value of the entry, or None if there is none or it expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expiration_time = entry
+            if time.time() >= expiration_time:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_field_detail_cache = TTLCache(FIELD_DETAIL_CACHE_SIZE, FIELD_DETAIL_CACHE_TTL_SECONDS)
+
+
+def get_field_detail(name: str) -> dict:
+    """
+    Returns the details of a metadata field on the current data version. Details are served
+    from memory, then from the data version's FieldDetailStore, and are only computed in
+    Redshift if they are in neither.
+    :param name: Metadata field name (one of constants.FIELD_DETAIL), or CELL_SUMMARY
+    :return: dict Field details
+    """
+    data_version = _field_detail_cache.get("current_data_version")
+    if data_version is None:
+        data_version = DynamoHandler().get_table_item(
+            DynamoTable.DEPLOYMENT_TABLE,
+            key=os.environ['DEPLOYMENT_STAGE']
+        )[DeploymentTableField.CURRENT_DATA_VERSION.value]
+        _field_detail_cache.put("current_data_version", data_version)
+
+    detail = _field_detail_cache.get((data_version, name))
+    if detail is None:
+        store = FieldDetailStore(data_version)
+        detail = store.get(name)
+        if detail is None:
+            detail = store.build([name], RedshiftHandler())[name]
+        _field_detail_cache.put((data_version, name), detail)
+
+    return detail
+
+
+class FieldDetailStore:
+    """
+    Details of the metadata fields of a data version, stored in S3 as one JSON object per field.
+    Details are built in a single pass over all fields when a data version is created. The
+    query results bucket expires them like any other object, after which they are rebuilt
+    one field at a time as they are requested.
+    """
+
+    def __init__(self, data_version: int):
+        self.data_version = data_version
+        self.s3_handler = S3Handler(os.environ['MATRIX_QUERY_RESULTS_BUCKET'])
+
+    def s3_key(self, name: str) -> str:
+        return f"{FIELD_DETAILS_PREFIX}/{self.data_version}/{name}.json"
+
+    def get(self, name: str) -> typing.Optional[dict]:
+        """
+        :param name: Metadata field name
+        :return: dict Field details, or None if they aren't stored
+        """
+        try:
+            return json.loads(self.s3_handler.load_content_from_obj_key(self.s3_key(name)))
+        except ClientError as e:
+            if e.response['Error']['Code'] == "NoSuchKey":
+                return None
+            raise
+
+    def build(self, names: typing.List[str], redshift_handler: RedshiftHandler) -> typing.Dict[str, dict]:
+        """
+        Computes the details of metadata fields over a single Redshift connection and stores them.
+        :param names: Metadata field names
+        :param redshift_handler: RedshiftHandler to query the details with
+        :return: dict of field names to field details
+        """
+        logger.info(f"Building details of {len(names)} fields for data version {self.data_version}")
+        results = redshift_handler.fetch_all([_field_detail_query(name) for name in names], read_only=True)
+
+        details = {}
+        for name, rows in zip(names, results):
+            details[name] = _format_field_detail(name, rows)
+            self.s3_handler.store_content_in_s3(self.s3_key(name), json.dumps(details[name], default=_json_default))
+        return details
+
+    def build_all(self, redshift_handler: RedshiftHandler) -> typing.Dict[str, dict]:
+        """
+        Computes and stores the details of every metadata field and the cell summary.
+        :param redshift_handler: RedshiftHandler to query the details with
+        :return: dict of field names to field details
+        """
+        return self.build(list(constants.FIELD_DETAIL.keys()) + [CELL_SUMMARY], redshift_handler)
+
+
+def _field_detail_query(name: str) -> str:
+    if name == CELL_SUMMARY:
+        return query_constructor.CELL_SUMMARY_QUERY
+
+    type_ = constants.METADATA_FIELD_TO_TYPE[name]
+    column_name = constants.METADATA_FIELD_TO_TABLE_COLUMN[name]
+    table_name = constants.TABLE_COLUMN_TO_TABLE[column_name]
+    fq_name = table_name + "." + column_name
+
+    table_primary_key = RedshiftHandler.PRIMARY_KEY[TableName(table_name)]
+
+    return query_constructor.create_field_detail_query(fq_name, table_name, table_primary_key, type_)
+
+
+def _format_field_detail(name: str, rows: list) -> dict:
+    if name == CELL_SUMMARY:
+        return {
+            "cell_count": rows[0][0],
+            "mean_genes_detected": rows[0][1] or 0
+        }
+
+    type_ = constants.METADATA_FIELD_TO_TYPE[name]
+    detail = {
+        "field_name": name,
+        "field_description": constants.FIELD_DETAIL[name],
+        "field_type": type_
+    }
+
+    if type_ == "categorical":
+        results = dict(rows)
+        if None in results:
+            results[""] = results[None]
+            results.pop(None)
+        if True in results:
+            results["True"] = results[True]
+            results.pop(True)
+        if False in results:
+            results["False"] = results[False]
+            results.pop(False)
+        detail["cell_counts"] = results
+    else:
+        detail["minimum"] = rows[0][0]
+        detail["maximum"] = rows[0][1]
+
+    return detail
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -1,7 +1,12 @@
+import gzip
+
 import pandas
 
 from matrix.common.query.query_results_reader import QueryResultsReader
 
+# Size of the blocks of decompressed text cellkeys are streamed in
+CELLKEY_BLOCK_SIZE = 16 * 1024 * 1024
+
 
 class CellQueryResultsReader(QueryResultsReader):
     def load_results(self):
@@ -25,10 +30,39 @@ class CellQueryResultsReader(QueryResultsReader):
         cell_table_dtype["emptydrops_is_cell"] = "object"
         cell_table_dtype["cellkey"] = "object"
 
-        part_url = self.manifest["part_urls"][slice_idx]
-        df = pandas.read_csv(
-            part_url, sep='|', header=None, names=cell_table_columns,
-            dtype=cell_table_dtype, true_values=["t"], false_values=["f"],
-            index_col="cellkey")
+        with self._part_url(slice_idx) as part_url:
+            df = pandas.read_csv(
+                part_url, sep='|', header=None, names=cell_table_columns,
+                dtype=cell_table_dtype, true_values=["t"], false_values=["f"],
+                index_col="cellkey")
 
         return df
+
+    def load_cellkeys(self, slice_idx):
+        """Stream the cellkeys of a particular result slice, without parsing the metadata
+        columns.
+
+        The part file is read in blocks of CELLKEY_BLOCK_SIZE bytes and only the first
+        field of each line is kept, so memory use doesn't grow with the number of cells.
+
+        Args:
+            slice_idx: Index of the slice to get cellkeys for
+
+        Yields:
+            list of the bytes cellkeys in each block of the slice, in the order they
+            appear in the part file
+        """
+        with self._part_url(slice_idx) as part_url, self._open(part_url) as part_file:
+            if part_url.endswith(".gz"):
+                part_file = gzip.GzipFile(fileobj=part_file)
+
+            remainder = b""
+            while True:
+                block = part_file.read(CELLKEY_BLOCK_SIZE)
+                if not block:
+                    break
+                lines = (remainder + block).split(b"\n")
+                remainder = lines.pop()
+                yield [line.split(b"|", 1)[0] for line in lines if line]
+            if remainder:
+                yield [remainder.split(b"|", 1)[0]]
@@ -1,9 +1,34 @@
+import gzip
+from enum import Enum
+
+import numpy
 import pandas
+import pyarrow
+from pandas.api.types import union_categoricals
+import pyarrow.csv
 
 from matrix.common.query.query_results_reader import QueryResultsReader
 
+EXPRESSION_TABLE_COLUMNS = ["cellkey", "featurekey", "exprvalue"]
+
+# Number of uncompressed bytes of a part file the arrow parser reads at a time. With
+# ~55 byte lines, a block is roughly a million rows.
+ARROW_BLOCK_SIZE = 64 * 1024 * 1024
+
+
+class ExpressionParser(Enum):
+    """
+    Parsers that ExpressionQueryResultsReader can read part files with.
+    """
+    PANDAS = "pandas"
+    ARROW = "arrow"
+
 
 class ExpressionQueryResultsReader(QueryResultsReader):
+    def __init__(self, s3_manifest_key, parser: ExpressionParser = ExpressionParser.PANDAS):
+        super(ExpressionQueryResultsReader, self).__init__(s3_manifest_key)
+        self.parser = parser
+
     def load_results(self):
         raise NotImplementedError()
 
@@ -17,10 +42,12 @@ class ExpressionQueryResultsReader(QueryResultsReader):
         Yields:
             DataFrame of expression results slice
         """
+        if self.parser == ExpressionParser.ARROW:
+            return self._load_slice_arrow(slice_idx)
+        return self._load_slice_pandas(slice_idx)
 
+    def _load_slice_pandas(self, slice_idx):
         chunksize = 1000000
-        part_url = self.manifest["part_urls"][slice_idx]
-        expression_table_columns = ["cellkey", "featurekey", "exprvalue"]
         expression_dtype = {"cellkey": "object", "featurekey": "object", "exprvalue": "float32"}
 
         # Iterate over chunks of the remote file. We have to set a fixed set
@@ -29,25 +56,108 @@ class ExpressionQueryResultsReader(QueryResultsReader):
         # to keep track of the "remainder", rows from the end of a chunk for a
         # cell the spans a chunk boundary.
         remainder = None
-        for chunk in pandas.read_csv(
-                part_url, sep="|", names=expression_table_columns,
-                dtype=expression_dtype, header=None, chunksize=chunksize):
-
-            # If we have some rows from the previous chunk, prepend them to
-            # this one
-            if remainder is not None:
-                adjusted_chunk = pandas.concat([remainder, chunk], axis=0, copy=False)
-            else:
-                adjusted_chunk = chunk
-
-            # Now get the rows for the cell at the end of this chunk that spans
-            # the boundary. Remove them from the chunk we yield, but keep them
-            # in the remainder.
-            last_cellkey = adjusted_chunk.tail(1).cellkey.values[0]
-            remainder = adjusted_chunk.loc[adjusted_chunk['cellkey'] == last_cellkey]
-            adjusted_chunk = adjusted_chunk[adjusted_chunk.cellkey != last_cellkey]
-
-            yield adjusted_chunk
+        with self._part_url(slice_idx) as part_url:
+            for chunk in pandas.read_csv(
+                    part_url, sep="|", names=EXPRESSION_TABLE_COLUMNS,
+                    dtype=expression_dtype, header=None, chunksize=chunksize):
+
+                # If we have some rows from the previous chunk, prepend them to
+                # this one
+                if remainder is not None:
+                    adjusted_chunk = pandas.concat([remainder, chunk], axis=0, copy=False)
+                else:
+                    adjusted_chunk = chunk
+
+                # Now get the rows for the cell at the end of this chunk that spans
+                # the boundary. Remove them from the chunk we yield, but keep them
+                # in the remainder.
+                last_cellkey = adjusted_chunk.tail(1).cellkey.values[0]
+                remainder = adjusted_chunk.loc[adjusted_chunk['cellkey'] == last_cellkey]
+                adjusted_chunk = adjusted_chunk[adjusted_chunk.cellkey != last_cellkey]
+
+                yield adjusted_chunk
 
         if remainder is not None:
             yield remainder
+
+    def _load_slice_arrow(self, slice_idx):
+        """Parse a slice with arrow's multithreaded csv parser, a block of lines at a time.
+
+        Keys are converted to categoricals straight from arrow's dictionary encoding and
+        values are parsed as float32, so no Python string is created per row. The rows
+        of a slice are grouped by cell, so the dictionary codes of the cellkeys never
+        decrease and the rows of the block's last cell start at the first occurrence of
+        its code. Those rows are carried over to the next block as a DataFrame, and joined
+        to it by concatenating the categoricals.
+
+        The carried rows are never sliced out of the arrow table: pyarrow 0.13 ignores the
+        offset of a sliced string column when dictionary encoding it, which corrupts keys.
+        """
+        parse_options = pyarrow.csv.ParseOptions(delimiter="|")
+        convert_options = pyarrow.csv.ConvertOptions(column_types={"cellkey": pyarrow.string(),
+                                                                   "featurekey": pyarrow.string(),
+                                                                   "exprvalue": pyarrow.float32()})
+        read_options = pyarrow.csv.ReadOptions(use_threads=True)
+
+        remainder = None
+        with self._part_url(slice_idx) as part_url:
+            for block in self._read_blocks(part_url):
+                table = pyarrow.csv.read_csv(pyarrow.BufferReader(block),
+                                             read_options=read_options,
+                                             parse_options=parse_options,
+                                             convert_options=convert_options)
+                chunk = table.to_pandas(strings_to_categorical=True)
+                if remainder is not None:
+                    chunk = self._concat_chunks(remainder, chunk)
+
+                codes = chunk["cellkey"].cat.codes.values
+                boundary = int(numpy.searchsorted(codes, codes[-1])) if len(codes) else 0
+                remainder = self._remove_unused_keys(chunk.iloc[boundary:])
+
+                if boundary:
+                    yield self._remove_unused_keys(chunk.iloc[:boundary])
+
+        if remainder is not None and len(remainder):
+            yield remainder
+
+    @staticmethod
+    def _concat_chunks(first, second):
+        """Concatenate two chunks with categorical keys. The categories of the first chunk
+        come first, so the codes of its cellkeys stay below those of the second's."""
+        return pandas.DataFrame({"cellkey": union_categoricals([first["cellkey"], second["cellkey"]]),
+                                 "featurekey": union_categoricals([first["featurekey"], second["featurekey"]]),
+                                 "exprvalue": numpy.concatenate([first["exprvalue"].values,
+                                                                 second["exprvalue"].values])},
+                                columns=EXPRESSION_TABLE_COLUMNS)
+
+    def _read_blocks(self, part_url):
+        """Read a gzipped part file in blocks of whole lines, each prefixed with the
+        column header for the csv parser.
+
+        Yields:
+            bytes of a header line and whole pipe-delimited lines
+        """
+        header = ("|".join(EXPRESSION_TABLE_COLUMNS) + "\n").encode()
+        with self._open(part_url) as raw_part, gzip.GzipFile(fileobj=raw_part) as part:
+            partial_line = b""
+            while True:
+                data = part.read(ARROW_BLOCK_SIZE)
+                if not data:
+                    break
+                end = data.rfind(b"\n") + 1
+                if not end:
+                    partial_line += data
+                    continue
+                yield b"".join([header, partial_line, memoryview(data)[:end]])
+                partial_line = data[end:]
+            if partial_line.strip():
+                yield b"".join([header, partial_line, b"\n"])
+
+    @staticmethod
+    def _remove_unused_keys(chunk):
+        """Drop the categories of cellkeys that have no rows in a chunk, e.g. the cell
+        carried over to the next block."""
+        return pandas.DataFrame({"cellkey": chunk["cellkey"].cat.remove_unused_categories(),
+                                 "featurekey": chunk["featurekey"],
+                                 "exprvalue": chunk["exprvalue"]},
+                                columns=EXPRESSION_TABLE_COLUMNS)
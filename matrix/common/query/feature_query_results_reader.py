@@ -14,10 +14,11 @@ class FeatureQueryResultsReader(QueryResultsReader):
         gene_table_columns = self._map_columns(self.manifest["columns"])
 
         dfs = []
-        for part_url in self.manifest["part_urls"]:
-            df = pandas.read_csv(part_url, sep='|', header=None, names=gene_table_columns,
-                                 true_values=["t"], false_values=["f"],
-                                 index_col="featurekey")
+        for slice_idx in range(len(self.manifest["part_urls"])):
+            with self._part_url(slice_idx) as part_url:
+                df = pandas.read_csv(part_url, sep='|', header=None, names=gene_table_columns,
+                                     true_values=["t"], false_values=["f"],
+                                     index_col="featurekey")
 
             dfs.append(df)
         return pandas.concat(dfs)
@@ -0,0 +1,102 @@
+import io
+import os
+
+import pandas
+import pyarrow
+import pyarrow.parquet
+
+from matrix.common import constants
+from matrix.common.aws.redshift_handler import RedshiftHandler
+from matrix.common.aws.s3_handler import S3Handler
+from matrix.common.logging import Logging
+
+logger = Logging.get_logger(__name__)
+
+FEATURE_TABLE_COLUMNS = ["featurekey", "featurename", "featuretype", "chromosome",
+                         "featurestart", "featureend", "isgene"]
+
+FEATURE_TABLE_QUERY_TEMPLATE = """
+SELECT {columns}
+FROM feature
+WHERE {isgene_clause}
+ORDER BY featurekey
+;
+"""
+
+FEATURE_TABLE_PREFIX = "feature_tables"
+
+
+class FeatureTable:
+    """
+    The feature metadata of a data version, for one feature type, stored once in S3 as a
+    parquet file ordered by featurekey.
+
+    Feature metadata does not depend on the cells in a request, so requests read it from
+    here instead of each unloading the feature table from Redshift.
+    """
+
+    def __init__(self, data_version: int, feature: str):
+        """
+        :param data_version: Redshift data version the feature table is built from
+        :param feature: Feature type of the table (one of MatrixFeature)
+        """
+        self.data_version = data_version
+        self.feature = feature
+        self.bucket = os.environ['MATRIX_QUERY_RESULTS_BUCKET']
+        self.s3_handler = S3Handler(self.bucket)
+
+    @property
+    def s3_key(self) -> str:
+        return f"{FEATURE_TABLE_PREFIX}/{self.data_version}/{self.feature}.parquet"
+
+    @property
+    def url(self) -> str:
+        return f"s3://{self.bucket}/{self.s3_key}"
+
+    @property
+    def query(self) -> str:
+        if self.feature == constants.MatrixFeature.GENE.value:
+            isgene_clause = "feature.isgene"
+        elif self.feature == constants.MatrixFeature.TRANSCRIPT.value:
+            isgene_clause = "(NOT feature.isgene)"
+        else:
+            raise ValueError(f"Unknown feature type {self.feature}")
+        return FEATURE_TABLE_QUERY_TEMPLATE.format(columns=", ".join(FEATURE_TABLE_COLUMNS),
+                                                   isgene_clause=isgene_clause)
+
+    def exists(self) -> bool:
+        return self.s3_handler.exists(self.s3_key)
+
+    def build(self, redshift_handler: RedshiftHandler) -> str:
+        """
+        Queries the feature metadata from Redshift and stores it in S3.
+        :param redshift_handler: RedshiftHandler to query the feature table with
+        :return: str S3 url of the feature table
+        """
+        logger.info(f"Building {self.feature} feature table for data version {self.data_version}")
+        rows = redshift_handler.transaction([self.query], return_results=True, read_only=True)
+        df = pandas.DataFrame(rows, columns=FEATURE_TABLE_COLUMNS)
+
+        buffer = io.BytesIO()
+        pyarrow.parquet.write_table(pyarrow.Table.from_pandas(df, preserve_index=False), buffer)
+        self.s3_handler.store_content_in_s3(self.s3_key, buffer.getvalue())
+        logger.info(f"Stored {len(df)} features at {self.url}")
+        return self.url
+
+    def get_or_build(self, redshift_handler: RedshiftHandler) -> str:
+        """
+        Builds the feature table unless it is already stored in S3. Feature tables are
+        built when a data version is created, but expire along with the other query results.
+        :param redshift_handler: RedshiftHandler to query the feature table with
+        :return: str S3 url of the feature table
+        """
+        if self.exists():
+            return self.url
+        return self.build(redshift_handler)
+
+
+def is_feature_table_url(url: str) -> bool:
+    """
+    Whether the url points at a feature table rather than a feature query results manifest.
+    """
+    return url.endswith(".parquet") and f"/{FEATURE_TABLE_PREFIX}/" in url
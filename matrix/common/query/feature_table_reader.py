@@ -0,0 +1,41 @@
+import pyarrow.parquet
+
+from matrix.common.query.query_results_reader import QueryResultsReader
+
+
+class FeatureTableReader(QueryResultsReader):
+    """
+    Loads a per data version feature table (see FeatureTable) in place of the results of
+    a feature query. The table is a single parquet file, read as the only part of its results.
+    """
+
+    def load_results(self):
+        """Load the feature metadata table.
+
+        Returns:
+            DataFrame of feature metadata. Index is "featurekey"
+        """
+        with self._part_url(0) as part_url, self._open(part_url) as part:
+            df = pyarrow.parquet.read_table(part).to_pandas()
+
+        df.columns = self._map_columns(list(df.columns))
+        return df.set_index("featurekey")
+
+    def load_slice(self, slice_idx):
+        raise NotImplementedError()
+
+    def _parse_manifest(self, manifest_key):
+        """Describe the feature table as the results of an UNLOAD with a single part.
+
+        Args:
+            manifest_key: S3 url of the feature table.
+
+        Returns:
+            dict in the format of QueryResultsReader._parse_manifest
+        """
+        return {
+            "columns": [],
+            "part_urls": [manifest_key],
+            "record_count": None,
+            "part_content_lengths": None
+        }
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from matrix.common.aws.s3_handler import S3Handler
+
+# Default size cap of the part cache
+PART_CACHE_BYTES = 16 * 1024 ** 3
+
+# Parts used this recently are never evicted, as a reader, possibly in another process,
+# may have been handed the part's path and not opened it yet
+EVICTION_GRACE_SECONDS = 10 * 60
+
+_part_cache = None
+_part_cache_lock = threading.Lock()
+
+
+def get_part_cache():
+    """
+    Returns the part cache shared by all query results readers in this process. The cache
+    lives in the MATRIX_PART_CACHE_DIR directory, so processes on the same instance share
+    it too, and is capped at MATRIX_PART_CACHE_BYTES bytes.
+    :return: PartCache, or None if MATRIX_PART_CACHE_DIR isn't set
+    """
+    global _part_cache
+    with _part_cache_lock:
+        cache_dir = os.environ.get('MATRIX_PART_CACHE_DIR')
+        if not cache_dir:
+            return None
+        if _part_cache is None or _part_cache.cache_dir != cache_dir:
+            _part_cache = PartCache(cache_dir, int(os.environ.get('MATRIX_PART_CACHE_BYTES', PART_CACHE_BYTES)))
+        return _part_cache
+
+
+class PartCache:
+    """
+    Content-addressed local disk cache of Redshift UNLOAD part files.
+
+    Parts are keyed by the url of the manifest they belong to and their S3 ETag, so a
+    part rewritten by a new UNLOAD to the same url is fetched again. Parts are stored
+    as they are in S3, so the readers parse cached and uncached parts the same way.
+    Once the cache grows past max_bytes, the least recently used parts are evicted,
+    except those used within the last EVICTION_GRACE_SECONDS.
+    Entries are written to a temporary file and renamed into place, so concurrent
+    processes sharing the cache never read a partial part.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = PART_CACHE_BYTES):
+        """
+        :param cache_dir: Directory to store the cached parts in
+        :param max_bytes: Size the cache is evicted down to
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._s3_handlers = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def local_path(self, manifest_url: str, part_url: str) -> str:
+        """
+        Returns the path of a cached copy of a part, downloading it on a miss.
+        :param manifest_url: S3 url of the manifest that lists the part
+        :param part_url: S3 url of the part
+        :return: Local path of the part
+        """
+        bucket, key = part_url[len("s3://"):].split("/", 1)
+        s3_handler = self._s3_handler(bucket)
+
+        entry_key = hashlib.sha256(f"{manifest_url}\n{s3_handler.etag(key)}".encode()).hexdigest()
+        # Keep the extension, which pandas infers the compression of the part from
+        path = os.path.join(self.cache_dir, entry_key + os.path.splitext(key)[1])
+
+        if os.path.exists(path):
+            try:
+                # Mark the part as recently used
+                os.utime(path)
+                with self._lock:
+                    self.hits += 1
+                return path
+            except FileNotFoundError:
+                # Evicted by another process in the meantime
+                pass
+
+        with self._lock:
+            self.misses += 1
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            s3_handler.download_file(key, temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._evict(keep=path)
+        return path
+
+    def _s3_handler(self, bucket: str) -> S3Handler:
+        # boto3 sessions aren't thread safe, so handlers are created one at a time
+        with self._lock:
+            if bucket not in self._s3_handlers:
+                self._s3_handlers[bucket] = S3Handler(bucket)
+            return self._s3_handlers[bucket]
+
+    def _evict(self, keep: str):
+        """
+        Remove the least recently used parts until the cache fits in max_bytes. Parts used
+        within EVICTION_GRACE_SECONDS are kept, so the cache may exceed max_bytes for a while.
+        """
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        grace_cutoff = time.time() - EVICTION_GRACE_SECONDS
+        for mtime, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes or mtime >= grace_cutoff:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
@@ -0,0 +1,145 @@
+import collections
+import concurrent.futures
+import os
+import shutil
+import time
+
+from matrix.common.aws.s3_handler import S3Handler
+from matrix.common.query.part_cache import PartCache
+
+
+class PartPrefetcher:
+    """
+    Downloads the part files of Redshift UNLOAD query results to local scratch space on a
+    thread pool, ahead of a reader loading them in order, so that S3 transfers overlap
+    with the work done on the previous parts.
+
+    At most max_parts downloaded or downloading parts, totalling at most max_bytes, are
+    kept on disk at a time. A part is deleted when it's released, which makes room for
+    the next one. Downloads are streamed to disk in fixed-size ranges, so memory use
+    doesn't grow with the size of the parts. The time spent waiting for parts that were
+    not downloaded yet is recorded in wait_seconds.
+
+    Given a PartCache, parts are fetched through it instead of to scratch space, and are
+    left in the cache when released.
+    """
+
+    def __init__(self, scratch_dir: str, max_parts: int = 2, max_bytes: int = 4 * 1024 ** 3, threads: int = 2,
+                 part_cache: PartCache = None):
+        """
+        :param scratch_dir: Directory to download parts to, removed on close
+        :param max_parts: Maximum number of parts on disk at a time
+        :param max_bytes: Maximum total size of the parts on disk at a time. A part larger
+            than this is still downloaded once no other part is on disk.
+        :param threads: Number of concurrent downloads
+        :param part_cache: Cache to fetch parts through, if any
+        """
+        self.scratch_dir = scratch_dir
+        self.max_parts = max_parts
+        self.max_bytes = max_bytes
+        self.part_cache = part_cache
+        self.wait_seconds = 0.0
+        self.downloaded_bytes = 0
+
+        self._s3_handlers = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self._manifest_urls = {}
+        self._queued = collections.OrderedDict()
+        self._downloads = collections.OrderedDict()
+        self._bytes = 0
+        self._n_downloads = 0
+        os.makedirs(scratch_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def prefetch(self, urls: list, sizes: list = None, manifest_url: str = None):
+        """
+        Queue parts to be downloaded in order.
+        :param urls: S3 urls of the parts
+        :param sizes: Size in bytes of each part, as given in the manifest
+        :param manifest_url: S3 url of the manifest listing the parts, which keys them in the part cache
+        """
+        for url, size in zip(urls, sizes or [0] * len(urls)):
+            # Local parts are read where they are
+            if url.startswith("s3://"):
+                self._queued[url] = size
+                self._manifest_urls[url] = manifest_url
+        self._start_downloads()
+
+    def local_url(self, url: str) -> str:
+        """
+        Return the url to read a part from, waiting for its download to finish.
+        :param url: S3 url of the part
+        :return: file:// url of the downloaded part, or url if it isn't prefetched
+        """
+        if url in self._queued:
+            # The part is needed before there was room to prefetch it
+            self._start_download(url, self._queued.pop(url))
+        if url not in self._downloads:
+            return url
+
+        start = time.time()
+        path = self._downloads[url][0].result()
+        self.wait_seconds += time.time() - start
+        self.downloaded_bytes += os.path.getsize(path)
+        return f"file://{path}"
+
+    def release(self, url: str):
+        """
+        Delete a downloaded part that is no longer needed and start the next downloads.
+        :param url: S3 url of the part
+        """
+        if url in self._downloads:
+            future, size, cached = self._downloads.pop(url)
+            self._bytes -= size
+            try:
+                if not cached:
+                    os.remove(future.result())
+            except Exception:
+                # A failed download left nothing to remove
+                pass
+        self._start_downloads()
+
+    def close(self):
+        """Cancel queued downloads and remove the scratch directory."""
+        self._queued.clear()
+        for future, _, _ in self._downloads.values():
+            future.cancel()
+        self._executor.shutdown()
+        self._downloads.clear()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+    def _start_downloads(self):
+        while self._queued and len(self._downloads) < self.max_parts:
+            url, size = next(iter(self._queued.items()))
+            if self._downloads and self._bytes + size > self.max_bytes:
+                break
+            del self._queued[url]
+            self._start_download(url, size)
+
+    def _start_download(self, url: str, size: int):
+        manifest_url = self._manifest_urls.get(url)
+        if self.part_cache is not None and manifest_url:
+            future = self._executor.submit(self.part_cache.local_path, manifest_url, url)
+            self._downloads[url] = (future, size, True)
+            self._bytes += size
+            return
+
+        # Parts keep their file names, which pandas infers their compression from
+        path = os.path.join(self.scratch_dir, f"{self._n_downloads}_{os.path.basename(url)}")
+        self._n_downloads += 1
+        bucket, key = url[len("s3://"):].split("/", 1)
+        if bucket not in self._s3_handlers:
+            self._s3_handlers[bucket] = S3Handler(bucket)
+        future = self._executor.submit(self._download, self._s3_handlers[bucket], key, path)
+        self._downloads[url] = (future, size, False)
+        self._bytes += size
+
+    @staticmethod
+    def _download(s3_handler: S3Handler, key: str, path: str) -> str:
+        s3_handler.download_file(key, path)
+        return path
@@ -0,0 +1,106 @@
+import datetime
+import hashlib
+import json
+import os
+import typing
+
+from matrix.common import date
+from matrix.common.aws.redshift_handler import RedshiftHandler
+from matrix.common.aws.s3_handler import S3Handler
+from matrix.common.logging import Logging
+
+logger = Logging.get_logger(__name__)
+
+PROJECT_SHARD_PREFIX = "project_shards"
+
+# Age after which shards are rebuilt rather than reused. The query results bucket expires
+# objects 30 days after they are written, so this leaves a week for the requests reading
+# a shard to finish before its parts may expire.
+SHARD_MAX_AGE = datetime.timedelta(days=23)
+
+# Manifest names of the cell and expression query results, by query type
+SHARD_MANIFEST_NAMES = {
+    "cell": "cell_metadata_manifest",
+    "expression": "expression_manifest"
+}
+
+
+def cell_shard_prefix(data_version: int, project_id: str, fields: typing.List[str]) -> str:
+    """
+    S3 prefix in the query results bucket of a project's cell query results for a set of metadata fields.
+    """
+    fields_hash = hashlib.md5(json.dumps(fields).encode()).hexdigest()
+    return f"{PROJECT_SHARD_PREFIX}/{data_version}/{project_id}/cell/{fields_hash}"
+
+
+def expression_shard_prefix(data_version: int, project_id: str, feature: str) -> str:
+    """
+    S3 prefix in the query results bucket of a project's expression query results for a feature type.
+    """
+    return f"{PROJECT_SHARD_PREFIX}/{data_version}/{project_id}/expression/{feature}"
+
+
+class ProjectShards:
+    """
+    Serves requests for the cells of a union of whole projects from per-project shards.
+
+    A shard is the UNLOAD output of the cell or expression query of a single project on
+    a data version. Shards are built once and shared by every request including the
+    project. A request's query results are assembled by writing manifests that list the
+    parts of its projects' shards, which the converter reads like any other query results.
+
+    Shards are described by a dict of query types ("cell" and "expression") to lists of
+    {"manifest_key": ..., "query": ...}, where the query UNLOADs the shard's results.
+    """
+
+    def __init__(self):
+        self.s3_handler = S3Handler(os.environ['MATRIX_QUERY_RESULTS_BUCKET'])
+
+    def build_missing(self, shards: dict, redshift_handler: RedshiftHandler) -> int:
+        """
+        Runs the queries of the shards that have not been built yet, or that were built more
+        than SHARD_MAX_AGE ago and will soon expire. Rebuilding overwrites a shard's parts in place.
+        :param shards: Shards to build, in the format described above
+        :param redshift_handler: RedshiftHandler to run the queries with
+        :return: int Number of shards built
+        """
+        built = 0
+        for shard in (shard for query_type in SHARD_MANIFEST_NAMES for shard in shards.get(query_type, [])):
+            if self._is_fresh(shard['manifest_key']):
+                continue
+            logger.info(f"Building project shard {shard['manifest_key']}")
+            redshift_handler.transaction([shard['query']], read_only=True)
+            built += 1
+        return built
+
+    def _is_fresh(self, manifest_key: str) -> bool:
+        """
+        Whether a shard's manifest exists and was written less than SHARD_MAX_AGE ago.
+        :param manifest_key: S3 key of the shard's manifest
+        :return: bool True if the shard can be reused
+        """
+        for obj in self.s3_handler.ls(manifest_key):
+            if obj['Key'] == manifest_key:
+                return date.get_datetime_now() - obj['LastModified'].replace(tzinfo=None) < SHARD_MAX_AGE
+        return False
+
+    def assemble(self, request_id: str, shards: dict):
+        """
+        Writes the cell and expression query results manifests of a request, listing the
+        parts of the shards in order. Parts of the cell and expression shards of a project
+        come from the same Redshift slices, so their order matches between the manifests.
+        :param request_id: Request ID to write the manifests for
+        :param shards: Shards of the request's projects, in the format described above
+        """
+        for query_type, manifest_name in SHARD_MANIFEST_NAMES.items():
+            manifests = [json.loads(self.s3_handler.load_content_from_obj_key(shard['manifest_key']))
+                         for shard in shards[query_type]]
+            manifest = {
+                "entries": [entry for m in manifests for entry in m["entries"]],
+                "schema": manifests[0]["schema"],
+                "meta": {
+                    "content_length": sum(m["meta"].get("content_length", 0) for m in manifests),
+                    "record_count": sum(m["meta"]["record_count"] for m in manifests)
+                }
+            }
+            self.s3_handler.store_content_in_s3(f"{request_id}/{manifest_name}", json.dumps(manifest))
@@ -1,8 +1,10 @@
+import contextlib
 import json
 
 import s3fs
 
 from matrix.common import constants
+from matrix.common.query.part_cache import get_part_cache
 
 
 class MatrixQueryResultsNotFound(Exception):
@@ -23,6 +25,24 @@ class QueryResultsReader:
 
         self.s3_manifest_key = s3_manifest_key
         self.manifest = self._parse_manifest(s3_manifest_key)
+        self.prefetcher = None
+
+    def __getstate__(self):
+        # Prefetching is tied to the reading process, so copies sent to worker
+        # processes read their parts directly
+        state = self.__dict__.copy()
+        state["prefetcher"] = None
+        return state
+
+    def prefetch_parts(self, prefetcher):
+        """
+        Download the part files of the query results ahead of them being loaded, in
+        slice order.
+        :param prefetcher: PartPrefetcher to download the parts with
+        """
+        self.prefetcher = prefetcher
+        prefetcher.prefetch(self.manifest["part_urls"], self.manifest.get("part_content_lengths"),
+                            manifest_url=self.s3_manifest_key)
 
     def load_results(self):
         """
@@ -49,18 +69,52 @@ class QueryResultsReader:
                 "part_urls": full S3 urls for the files containing results from each
                     Redshift slice
                 "record_count": total number of records returned by the query
+                "part_content_lengths": size in bytes of each of the part_urls
         """
         try:
-            manifest = json.load(self._s3fs.open(manifest_key))
+            manifest = json.load(self._open(manifest_key))
         except FileNotFoundError:
             raise MatrixQueryResultsNotFound(f"Unable to locate query results at {manifest_key}.")
 
         return {
             "columns": [e["name"] for e in manifest["schema"]["elements"]],
             "part_urls": [e["url"] for e in manifest["entries"] if e["meta"]["record_count"]],
-            "record_count": manifest["meta"]["record_count"]
+            "record_count": manifest["meta"]["record_count"],
+            "part_content_lengths": [e["meta"]["content_length"] for e in manifest["entries"]
+                                     if e["meta"]["record_count"]]
         }
 
+    @contextlib.contextmanager
+    def _part_url(self, slice_idx):
+        """Get the url to read a slice's part file from, which is local if the part was
+        prefetched or is in the part cache. The prefetched part is released once the
+        caller is done with it.
+
+        Yields:
+            url of the part file
+        """
+        url = self.manifest["part_urls"][slice_idx]
+        if self.prefetcher is None:
+            part_cache = get_part_cache()
+            if part_cache is not None and url.startswith("s3://"):
+                url = f"file://{part_cache.local_path(self.s3_manifest_key, url)}"
+            yield url
+            return
+        try:
+            yield self.prefetcher.local_url(url)
+        finally:
+            self.prefetcher.release(url)
+
+    def _open(self, url):
+        """Open a query results object for reading.
+
+        Results are normally in S3, but file:// urls are read from local disk so that
+        UNLOAD outputs can be staged locally, e.g. for benchmarks.
+        """
+        if url.startswith("file://"):
+            return open(url[len("file://"):], "rb")
+        return self._s3fs.open(url)
+
     @staticmethod
     def _map_columns(cols: list):
         """
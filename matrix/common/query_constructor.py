@@ -1,8 +1,10 @@
 """Methods and templates for redshift queries."""
 
+import json
 import typing
 
 from matrix.common import constants
+from matrix.common.query import project_shards
 from matrix.docker.query_runner import QueryType
 
 COMPARISON_OPERATORS = [
@@ -12,6 +14,8 @@ COMPARISON_OPERATORS = [
 
 LOGICAL_OPERATORS = ["and", "or", "not"]
 
+PROJECT_ID_FIELD = "project.provenance.document_id"
+
 EXPRESSION_QUERY_TEMPLATE = """
 UNLOAD ($$SELECT cell.cellkey, expression.featurekey, expression.exrpvalue
 FROM expression
@@ -46,16 +50,6 @@ MANIFEST VERBOSE
 ;
 """
 
-FEATURE_QUERY_TEMPLATE = """
-UNLOAD ($$SELECT *
-FROM feature
-WHERE {feature_where_clause}$$)
-to 's3://{{results_bucket}}/{{request_id}}/gene_metadata_'
-IAM_ROLE '{{iam_role}}'
-GZIP
-MANIFEST VERBOSE;
-"""
-
 # Query templates for requests to /filter/... and /fields/...
 FIELD_DETAIL_CATEGORICAL_QUERY_TEMPLATE = """
 SELECT {fq_field_name}, COUNT(cell.cellkey)
@@ -70,6 +64,13 @@ FROM cell {join}
 ;
 """
 
+# Number of cells and mean number of genes detected per cell, used to estimate request sizes
+CELL_SUMMARY_QUERY = """
+SELECT COUNT(cell.cellkey), AVG(cell.genes_detected::FLOAT)
+FROM cell
+;
+"""
+
 FIELD_DETAIL_JOIN = "LEFT OUTER JOIN {table_name} on (cell.{primary_key} = {table_name}.{primary_key})"
 
 
@@ -175,15 +176,67 @@ def create_matrix_request_queries(filter_: typing.Dict[str, typing.Any],
         fields=', '.join(translate_fields(fields)),
         cell_where_clause=cell_where_clause)
 
-    feature_query = FEATURE_QUERY_TEMPLATE.format(feature_where_clause=feature_where_clause)
-
     return {
         QueryType.EXPRESSION: expression_query,
-        QueryType.CELL: cell_query,
-        QueryType.FEATURE: feature_query
+        QueryType.CELL: cell_query
     }
 
 
+def create_project_shards(project_ids: typing.List[str],
+                          fields: typing.List[str],
+                          feature: str,
+                          data_version: int,
+                          results_bucket: str,
+                          iam_role: str) -> typing.Dict[str, typing.List[typing.Dict[str, str]]]:
+    """Create the descriptions of the cell and expression shards of each project,
+    in the format ProjectShards builds and assembles them from.
+
+    Shards of a project may be built by several requests at once, so their
+    UNLOADs overwrite any parts already written.
+    """
+
+    shards = {QueryType.CELL.value: [], QueryType.EXPRESSION.value: []}
+    for project_id in project_ids:
+        queries = create_matrix_request_queries({"op": "=", "field": PROJECT_ID_FIELD, "value": project_id},
+                                                fields,
+                                                feature)
+        prefixes = {
+            QueryType.CELL: project_shards.cell_shard_prefix(data_version, project_id, fields),
+            QueryType.EXPRESSION: project_shards.expression_shard_prefix(data_version, project_id, feature)
+        }
+        for query_type, prefix in prefixes.items():
+            query = queries[query_type].format(results_bucket=results_bucket, request_id=prefix, iam_role=iam_role)
+            shards[query_type.value].append({
+                'manifest_key': f"{prefix}/{project_shards.SHARD_MANIFEST_NAMES[query_type.value]}",
+                'query': query.replace("MANIFEST VERBOSE", "MANIFEST VERBOSE\nALLOWOVERWRITE")
+            })
+
+    return shards
+
+
+def filter_to_project_ids(matrix_filter: typing.Dict[str, typing.Any]) -> typing.Optional[typing.List[str]]:
+    """Return the project ids of a filter that selects the cells of a union of
+    whole projects, i.e. an "=" or "in" on the project id, or an "or" of those.
+
+    Returns None for any other filter.
+    """
+
+    project_field = _get_internal_name(PROJECT_ID_FIELD)
+    canonical_filter = canonicalize_filter(matrix_filter)
+    operands = canonical_filter["value"] if canonical_filter["op"] == "or" else [canonical_filter]
+
+    project_ids = set()
+    for operand in operands:
+        if operand.get("field") != project_field or operand["op"] not in ("=", "in"):
+            return None
+        values = operand["value"] if operand["op"] == "in" else [operand["value"]]
+        if not all(isinstance(value, str) for value in values):
+            return None
+        project_ids.update(values)
+
+    return sorted(project_ids)
+
+
 def feature_to_where(matrix_feature: str) -> str:
     """Build the WHERE clause for the features."""
 
@@ -248,6 +301,56 @@ def filter_to_where(matrix_filter: typing.Dict[str, typing.Any]) -> str:
         raise MalformedMatrixFilter(f"Invalid op: {op}")
 
 
+def canonicalize_filter(matrix_filter: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+    """Rewrite a matrix filter into a canonical form, so that filters selecting
+    the same cells by the same conditions compare equal however they are written.
+
+    Fields are translated to their internal names, "in" values are deduplicated
+    and sorted, nested operands of the same "and"/"or" are flattened into their
+    parent, and operands of "and"/"or" are deduplicated and sorted. An "and"/"or"
+    left with a single operand is replaced by it, and double negations cancel.
+
+    Raises MalformedMatrixFilter for filters that filter_to_where rejects.
+    """
+
+    # Validate the filter with the same rules the queries are built with
+    filter_to_where(matrix_filter)
+
+    return _canonicalize_filter(translate_filters(matrix_filter))
+
+
+def _canonical_json(value: typing.Any) -> str:
+    return json.dumps(value, sort_keys=True)
+
+
+def _canonicalize_filter(matrix_filter: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+    op = matrix_filter["op"]
+    value = matrix_filter["value"]
+
+    if op in COMPARISON_OPERATORS:
+        if op == "in":
+            unique_values = {_canonical_json(el): el for el in value}
+            value = [unique_values[key] for key in sorted(unique_values)]
+        return {"op": op, "field": matrix_filter["field"], "value": value}
+
+    elif op == "not":
+        operand = _canonicalize_filter(value[0])
+        if operand["op"] == "not":
+            return operand["value"][0]
+        return {"op": op, "value": [operand]}
+
+    else:
+        operands = {}
+        for operand in (_canonicalize_filter(v) for v in value):
+            nested_operands = operand["value"] if operand["op"] == op else [operand]
+            for nested_operand in nested_operands:
+                operands[_canonical_json(nested_operand)] = nested_operand
+
+        if len(operands) == 1:
+            return next(iter(operands.values()))
+        return {"op": op, "value": [operands[key] for key in sorted(operands)]}
+
+
 def format_str_list(values: typing.Iterable[str]) -> str:
     """
     Formats a list of strings into a query compatible string
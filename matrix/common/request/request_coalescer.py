@@ -0,0 +1,76 @@
+import hashlib
+import json
+import typing
+
+from matrix.common import query_constructor
+from matrix.common.aws.dynamo_handler import DynamoHandler
+from matrix.common.logging import Logging
+from matrix.common.request.request_tracker import RequestTracker
+
+logger = Logging.get_logger(__name__)
+
+
+def generate_request_key(filter_: typing.Dict[str, typing.Any],
+                         fields: typing.List[str],
+                         feature: str,
+                         fmt: str,
+                         data_version: int) -> str:
+    """
+    Generates a key identifying a request by its parameters before any query has run.
+    Filters are canonicalized first, so equivalent filters written differently share a key.
+    Raises MalformedMatrixFilter for invalid filters.
+    :param filter_: Filter dict describing which cells to get expression data for
+    :param fields: Metadata fields to include in expression matrix
+    :param feature: Feature type to generate expression counts for (one of MatrixFeature)
+    :param fmt: Request output format for matrix conversion
+    :param data_version: Redshift data version the request is generated on
+    :return: str Request key
+    """
+    h = hashlib.md5()
+    h.update(json.dumps(query_constructor.canonicalize_filter(filter_), sort_keys=True).encode())
+    h.update(json.dumps(fields).encode())
+    h.update(feature.encode())
+    h.update(fmt.encode())
+    h.update(str(data_version).encode())
+    return h.hexdigest()
+
+
+class RequestCoalescer:
+    """
+    Attaches matrix requests to an identical request that is already in flight, so that
+    identical requests submitted close together are only computed once.
+    In flight requests are tracked in DynamoDB, keyed by the request key (see generate_request_key).
+    """
+
+    # Matches RequestTracker.timeout, after which an in flight request is no longer waited on
+    IN_FLIGHT_TTL_SECONDS = 36 * 60 * 60
+
+    def __init__(self):
+        self.dynamo_handler = DynamoHandler()
+
+    def attach(self, request_id: str, request_key: str) -> str:
+        """
+        Registers the request as in flight, unless an identical request already is.
+        An in flight request that failed, including its conversion batch job, or timed out is replaced by this request.
+        :param request_id: UUID of the request to attach
+        :param request_key: Key identifying the request's parameters
+        :return: str The request ID of the in flight request that computes the request's result
+        """
+        in_flight_request_id = self.dynamo_handler.put_in_flight_request_table_entry(request_key,
+                                                                                     request_id,
+                                                                                     self.IN_FLIGHT_TTL_SECONDS)
+        if in_flight_request_id == request_id:
+            return request_id
+
+        in_flight_request_tracker = RequestTracker(in_flight_request_id)
+        if (in_flight_request_tracker.error
+                or in_flight_request_tracker.timeout
+                or in_flight_request_tracker.batch_job_status == "FAILED"):
+            logger.info(f"Replacing failed in flight request {in_flight_request_id} with {request_id}")
+            return self.dynamo_handler.put_in_flight_request_table_entry(request_key,
+                                                                         request_id,
+                                                                         self.IN_FLIGHT_TTL_SECONDS,
+                                                                         replaced_request_id=in_flight_request_id)
+
+        logger.info(f"Attaching {request_id} to in flight request {in_flight_request_id}")
+        return in_flight_request_id
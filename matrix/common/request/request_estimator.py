@@ -0,0 +1,114 @@
+import operator
+import typing
+
+from matrix.common import constants
+from matrix.common import field_details
+from matrix.common.constants import MatrixFormat
+
+RANGE_OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# Approximate output bytes per nonzero expression value, by format
+BYTES_PER_NONZERO = {
+    MatrixFormat.LOOM.value: 6,
+    MatrixFormat.CSV.value: 9,
+    MatrixFormat.MTX.value: 8,
+    MatrixFormat.ZARR.value: 6,
+    MatrixFormat.H5AD.value: 8,
+    MatrixFormat.PARQUET.value: 6,
+}
+
+# Approximate output bytes per metadata field value of a cell
+BYTES_PER_CELL_FIELD = 24
+
+# Fixed cost of running the queries of a request, and rate at which query results are converted
+QUERY_OVERHEAD_SECONDS = 120
+CONVERSION_NONZEROS_PER_SECOND = 2000000
+
+
+class RequestEstimator:
+    """
+    Estimates the size and run time of matrix requests from the precomputed field details and
+    cell summary of the current data version, without querying Redshift.
+
+    The fraction of cells a filter selects is estimated from the cell counts of categorical fields
+    and the range of numeric fields, whose values are assumed to be uniformly distributed.
+    Conditions are assumed to be independent. Fields without details select every cell.
+    """
+
+    def estimate(self, filter_: typing.Dict[str, typing.Any], fields: typing.List[str]) -> dict:
+        """
+        :param filter_: Filter dict describing which cells to get expression data for
+        :param fields: Metadata fields to include in expression matrix
+        :return: dict Estimated cell count, nonzero count, output bytes per format and run time in seconds
+        """
+        summary = field_details.get_field_detail(field_details.CELL_SUMMARY)
+
+        # genes_detected counts the genes expressed in a cell, which also approximates transcript matrices
+        cell_count = int(round(summary["cell_count"] * self._selectivity(filter_)))
+        nonzero_count = int(round(cell_count * summary["mean_genes_detected"]))
+
+        return {
+            "cell_count": cell_count,
+            "nonzero_count": nonzero_count,
+            "output_bytes": {fmt: nonzero_count * bytes_per_nonzero + cell_count * len(fields) * BYTES_PER_CELL_FIELD
+                             for fmt, bytes_per_nonzero in BYTES_PER_NONZERO.items()},
+            "run_time_seconds": QUERY_OVERHEAD_SECONDS + nonzero_count // CONVERSION_NONZEROS_PER_SECOND
+        }
+
+    def _selectivity(self, filter_: typing.Dict[str, typing.Any]) -> float:
+        op = filter_["op"]
+        value = filter_["value"]
+
+        if op == "and":
+            selectivity = 1.0
+            for operand in value:
+                selectivity *= self._selectivity(operand)
+            return selectivity
+        elif op == "or":
+            unselected = 1.0
+            for operand in value:
+                unselected *= 1.0 - self._selectivity(operand)
+            return 1.0 - unselected
+        elif op == "not":
+            return 1.0 - self._selectivity(value[0])
+
+        field = filter_["field"]
+        if field not in constants.FIELD_DETAIL:
+            return 1.0
+
+        detail = field_details.get_field_detail(field)
+        if detail["field_type"] == "categorical":
+            return self._categorical_selectivity(op, value, detail["cell_counts"])
+        return self._numeric_selectivity(op, value, detail["minimum"], detail["maximum"])
+
+    @staticmethod
+    def _categorical_selectivity(op: str, value: typing.Any, cell_counts: typing.Dict[str, int]) -> float:
+        total = sum(cell_counts.values())
+        if not total or op not in ("=", "!=", "in"):
+            return 1.0
+
+        values = value if op == "in" else [value]
+        matched = sum(cell_counts.get("" if v is None else str(v), 0) for v in values) / total
+        return 1.0 - matched if op == "!=" else matched
+
+    @staticmethod
+    def _numeric_selectivity(op: str, value: typing.Any, minimum: float, maximum: float) -> float:
+        values = value if op == "in" else [value]
+        if minimum is None or maximum is None or not all(isinstance(v, (int, float)) for v in values):
+            return 1.0
+
+        if op in ("=", "!=", "in"):
+            in_range = sum(1 for v in values if minimum <= v <= maximum)
+            matched = min(1.0, in_range / (maximum - minimum + 1))
+            return 1.0 - matched if op == "!=" else matched
+
+        if maximum == minimum:
+            return 1.0 if RANGE_OPERATORS[op](minimum, value) else 0.0
+
+        below = min(1.0, max(0.0, (value - minimum) / (maximum - minimum)))
+        return below if op in ("<", "<=") else 1.0 - below
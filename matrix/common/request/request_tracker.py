@@ -4,10 +4,10 @@ from datetime import timedelta
 from enum import Enum
 
 from matrix.common import date
-from matrix.common.constants import DEFAULT_FIELDS, DEFAULT_FEATURE
+from matrix.common.constants import DEFAULT_FIELDS, DEFAULT_FEATURE, RUN_REPORT_SUFFIX
 from matrix.common.aws.batch_handler import BatchHandler
 from matrix.common.aws.cloudwatch_handler import CloudwatchHandler, MetricName
-from matrix.common.aws.dynamo_handler import DynamoHandler, DynamoTable, RequestTableField
+from matrix.common.aws.dynamo_handler import DynamoHandler, DynamoTable, RequestTableField, ResultCacheTableField
 from matrix.common.aws.s3_handler import S3Handler
 from matrix.common.exceptions import MatrixException
 from matrix.common.logging import Logging
@@ -35,6 +35,16 @@ class RequestTracker:
     Provides an interface for tracking a request's parameters and state.
     """
 
+    # Matches the expiration of matrices in the results bucket
+    RESULT_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+    # Version of the request hash scheme, hashed into every request hash. Bump it when the
+    # scheme changes so that new hashes can't collide with hashes of the previous scheme.
+    REQUEST_HASH_VERSION = 2
+
+    # Number of sorted cellkeys passed to md5 at a time when hashing a slice
+    REQUEST_HASH_BLOCK_SIZE = 65536
+
     def __init__(self, request_id: str):
         Logging.set_correlation_id(logger, request_id)
 
@@ -45,6 +55,7 @@ class RequestTracker:
         self._format = None
         self._metadata_fields = None
         self._feature = None
+        self._row_count = None
 
         self.dynamo_handler = DynamoHandler()
         self.cloudwatch_handler = CloudwatchHandler()
@@ -82,6 +93,11 @@ class RequestTracker:
                                                                    self.request_id,
                                                                    RequestTableField.REQUEST_HASH,
                                                                    self._request_hash)
+                    if self._row_count is not None:
+                        self.dynamo_handler.set_table_field_with_value(DynamoTable.REQUEST_TABLE,
+                                                                       self.request_id,
+                                                                       RequestTableField.ROW_COUNT,
+                                                                       self._row_count)
                 except MatrixQueryResultsNotFound as e:
                     logger.warning(f"Failed to generate a request hash. {e}")
 
@@ -101,7 +117,10 @@ class RequestTracker:
         The S3 key where matrix results for this request are stored in the results bucket.
         :return: str S3 key
         """
-        is_compressed = self.format == MatrixFormat.CSV.value or self.format == MatrixFormat.MTX.value
+        is_compressed = self.format in (MatrixFormat.CSV.value,
+                                        MatrixFormat.MTX.value,
+                                        MatrixFormat.ZARR.value,
+                                        MatrixFormat.PARQUET.value)
 
         return f"{self.data_version}/{self.request_hash}/{self.request_id}.{self.format}" + \
                (".zip" if is_compressed else "")
@@ -178,6 +197,18 @@ class RequestTracker:
                                                    key=self.request_id)[RequestTableField.FEATURE.value]
         return self._feature
 
+    @property
+    def row_count(self) -> int:
+        """
+        The number of cells in the request, recorded when the request hash is generated.
+        :return: int Number of cells
+        """
+        if self._row_count is None:
+            self._row_count = \
+                self.dynamo_handler.get_table_item(DynamoTable.REQUEST_TABLE,
+                                                   key=self.request_id)[RequestTableField.ROW_COUNT.value]
+        return self._row_count
+
     @property
     def batch_job_id(self) -> str:
         """
@@ -191,6 +222,32 @@ class RequestTracker:
         else:
             return batch_job_id
 
+    @property
+    def coalesced_request_id(self) -> str:
+        """
+        The ID of the identical in flight request this request was attached to, if any.
+        :return: str The request ID if the request was coalesced, else None
+        """
+        table_item = self.dynamo_handler.get_table_item(DynamoTable.REQUEST_TABLE, key=self.request_id)
+        coalesced_request_id = table_item.get(RequestTableField.COALESCED_REQUEST_ID.value)
+        if not coalesced_request_id or coalesced_request_id == "N/A":
+            return None
+        else:
+            return coalesced_request_id
+
+    @property
+    def request_key(self) -> str:
+        """
+        Key identifying the request's normalized parameters and data version.
+        :return: str The request key if one was recorded, else None
+        """
+        table_item = self.dynamo_handler.get_table_item(DynamoTable.REQUEST_TABLE, key=self.request_id)
+        request_key = table_item.get(RequestTableField.REQUEST_KEY.value)
+        if not request_key or request_key == "N/A":
+            return None
+        else:
+            return request_key
+
     @property
     def batch_job_status(self) -> str:
         """
@@ -267,24 +324,47 @@ class RequestTracker:
         """
         Generates a request hash uniquely identifying a request by its input parameters.
         Requires cell query results to exist, else raises MatrixQueryResultsNotFound.
+
+        Only the cellkeys of the cell query results are read, streamed part by part.
+        Redshift doesn't order UNLOAD outputs, so each slice's cellkeys are sorted and
+        hashed in blocks, and the slice digests are summed, which makes the hash
+        independent of the order of slices and of the cells within them. Cells are
+        distributed to slices by cellkey, so the same cells fall in the same slices.
+        The number of cells is recorded in row_count.
+
+        Version 1 hashes, which hashed cellkeys in the order they were read, are not
+        matched by version 2 hashes, so matrices cached under them are no longer reused
+        and expire from the results bucket.
         :return: str Request hash
         """
         cell_manifest_key = f"s3://{os.environ['MATRIX_QUERY_RESULTS_BUCKET']}/{self.request_id}/cell_metadata_manifest"
         reader = CellQueryResultsReader(cell_manifest_key)
-        cell_df = reader.load_results()
-        cellkeys = cell_df.index
+
+        cellkeys_digest = 0
+        row_count = 0
+        for slice_idx in range(len(reader.manifest["part_urls"])):
+            slice_cellkeys = [key for cellkeys in reader.load_cellkeys(slice_idx) for key in cellkeys]
+            slice_cellkeys.sort()
+
+            slice_hash = hashlib.md5()
+            for block_start in range(0, len(slice_cellkeys), self.REQUEST_HASH_BLOCK_SIZE):
+                slice_hash.update(b"\n".join(slice_cellkeys[block_start:block_start + self.REQUEST_HASH_BLOCK_SIZE]))
+                slice_hash.update(b"\n")
+            cellkeys_digest += int.from_bytes(slice_hash.digest(), "big")
+            row_count += len(slice_cellkeys)
 
         h = hashlib.md5()
+        h.update(f"v{self.REQUEST_HASH_VERSION}".encode())
         h.update(self.feature.encode())
         h.update(self.format.encode())
 
         for field in self.metadata_fields:
             h.update(field.encode())
 
-        for key in cellkeys:
-            h.update(key.encode())
+        h.update((cellkeys_digest % 2 ** 128).to_bytes(16, "big"))
 
         request_hash = h.hexdigest()
+        self._row_count = row_count
 
         return request_hash
 
@@ -324,16 +404,51 @@ class RequestTracker:
     def lookup_cached_result(self) -> str:
         """
         Retrieves the S3 key of an existing matrix result that corresponds to this request's request hash.
+        Conversion run reports stored alongside results are not matrices and are skipped.
         Returns "" if no such result exists
         :return: S3 key of cached result
         """
         results_bucket = S3Handler(os.environ['MATRIX_RESULTS_BUCKET'])
         objects = results_bucket.ls(f"{self.s3_results_prefix}/")
 
-        if len(objects) > 0:
-            return objects[0]['Key']
+        for obj in objects:
+            if not obj['Key'].endswith(RUN_REPORT_SUFFIX):
+                return obj['Key']
         return ""
 
+    def lookup_result_cache(self) -> str:
+        """
+        Retrieves the ID of a completed request with this request's request key.
+        Unlike lookup_cached_result, this does not require the cell query to have run.
+        Returns "" if no such request exists or its matrix has expired
+        :return: str Request ID of the completed request
+        """
+        request_key = self.request_key
+        if not request_key:
+            return ""
+
+        try:
+            cached_request_id = self.dynamo_handler.get_table_item(
+                DynamoTable.RESULT_CACHE_TABLE,
+                key=request_key
+            )[ResultCacheTableField.REQUEST_ID.value]
+        except MatrixException:
+            return ""
+
+        if cached_request_id == self.request_id or not RequestTracker(cached_request_id).is_request_complete():
+            return ""
+        return cached_request_id
+
+    def cache_result(self):
+        """
+        Records this request's completed matrix as the result for requests with its request key.
+        """
+        request_key = self.request_key
+        if request_key:
+            self.dynamo_handler.put_result_cache_table_entry(request_key,
+                                                             self.request_id,
+                                                             self.RESULT_CACHE_TTL_SECONDS)
+
     def is_request_ready_for_conversion(self) -> bool:
         """
         Checks whether the request has completed all queries
@@ -391,6 +506,35 @@ class RequestTracker:
             ]
         )
 
+    def log_conversion_report(self, report: dict):
+        """
+        Log the key numbers of a matrix conversion's run report in CloudWatch Metrics
+        :param report: dict run report of the conversion, with the duration of each stage
+        """
+        dimensions = [
+            {
+                'Name': "Number of Bundles",
+                'Value': self.num_bundles_interval
+            },
+            {
+                'Name': "Output Format",
+                'Value': self.format
+            },
+        ]
+        metrics = [(MetricName.CONVERSION_STAGE_DURATION,
+                    stage['seconds'],
+                    dimensions + [{'Name': "Conversion Stage", 'Value': name}])
+                   for name, stage in report['stages'].items()]
+        metrics.append((MetricName.CONVERSION_PEAK_MEMORY,
+                        max(report['peak_rss_bytes'], report['peak_children_rss_bytes']),
+                        dimensions))
+        if 'upload' in report['stages']:
+            metrics.append((MetricName.CONVERSION_OUTPUT_SIZE, report['stages']['upload']['bytes_out'], dimensions))
+        if 'read_slices' in report['stages']:
+            metrics.append((MetricName.CONVERSION_ROWS, report['stages']['read_slices']['rows'], dimensions))
+
+        self.cloudwatch_handler.put_metric_data_batch(metrics)
+
     def log_error(self, message: str):
         """
         Logs the latest error this request reported overwriting the previously logged error.
@@ -414,3 +558,21 @@ class RequestTracker:
                                                        self.request_id,
                                                        RequestTableField.BATCH_JOB_ID,
                                                        batch_job_id)
+
+    def write_coalesced_request_id_to_db(self, coalesced_request_id: str):
+        """
+        Logs the ID of the identical in flight request this request was attached to in the state table
+        """
+        self.dynamo_handler.set_table_field_with_value(DynamoTable.REQUEST_TABLE,
+                                                       self.request_id,
+                                                       RequestTableField.COALESCED_REQUEST_ID,
+                                                       coalesced_request_id)
+
+    def write_request_key_to_db(self, request_key: str):
+        """
+        Logs the key identifying the request's normalized parameters to state table
+        """
+        self.dynamo_handler.set_table_field_with_value(DynamoTable.REQUEST_TABLE,
+                                                       self.request_id,
+                                                       RequestTableField.REQUEST_KEY,
+                                                       request_key)
@@ -0,0 +1,109 @@
+"""Per-stage instrumentation of matrix conversions."""
+
+import collections
+import contextlib
+import json
+import resource
+import sys
+import time
+
+# ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+RU_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def peak_rss_bytes(who: int = resource.RUSAGE_SELF) -> int:
+    """Return the peak resident set size of this process, or of its terminated
+    children with RUSAGE_CHILDREN, in bytes."""
+    return resource.getrusage(who).ru_maxrss * RU_MAXRSS_UNIT
+
+
+class StageStats:
+    """Running totals of a conversion stage or slice."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.peak_rss_bytes = 0
+
+    def add(self, rows: int = 0, bytes_in: int = 0, bytes_out: int = 0):
+        self.rows += rows
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def to_dict(self) -> dict:
+        return {
+            'seconds': round(self.seconds, 6),
+            'rows': self.rows,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'peak_rss_bytes': self.peak_rss_bytes,
+        }
+
+
+class ConversionReport:
+    """Records the wall time, rows, bytes in and out and peak RSS of each stage of a
+    conversion and of each Redshift slice it reads.
+
+    Stages may nest, e.g. reading slices happens within the conversion, and a stage
+    entered several times accumulates its totals. Only a clock read and a getrusage
+    call are made per stage, so the report is cheap enough to keep on for every run.
+    Peak RSS is the process's high-water mark at the end of the stage, not the
+    memory used by the stage alone.
+    """
+
+    def __init__(self, request_id: str, fmt: str):
+        self.request_id = request_id
+        self.format = fmt
+        self.stages = collections.OrderedDict()
+        self.slices = collections.OrderedDict()
+        self._start = time.time()
+
+    def stage_stats(self, name: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats()
+        return self.stages[name]
+
+    def slice_stats(self, slice_idx: int) -> StageStats:
+        if slice_idx not in self.slices:
+            self.slices[slice_idx] = StageStats()
+        return self.slices[slice_idx]
+
+    @contextlib.contextmanager
+    def stage(self, name: str, slice_idx: int = None):
+        """Time a stage of the conversion.
+
+        Args:
+            name: Name of the stage
+            slice_idx: Slice the stage is working on, whose time the stage's time is added to
+
+        Yields:
+            StageStats of the stage, to add rows and bytes to
+        """
+        stats = self.stage_stats(name)
+        start = time.time()
+        try:
+            yield stats
+        finally:
+            seconds = time.time() - start
+            stats.seconds += seconds
+            stats.peak_rss_bytes = peak_rss_bytes()
+            if slice_idx is not None:
+                slice_stats = self.slice_stats(slice_idx)
+                slice_stats.seconds += seconds
+                slice_stats.peak_rss_bytes = stats.peak_rss_bytes
+
+    def to_dict(self) -> dict:
+        return {
+            'request_id': self.request_id,
+            'format': self.format,
+            'seconds': round(time.time() - self._start, 6),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'peak_children_rss_bytes': peak_rss_bytes(resource.RUSAGE_CHILDREN),
+            'stages': {name: stats.to_dict() for name, stats in self.stages.items()},
+            'slices': [dict(slice_idx=slice_idx, **stats.to_dict()) for slice_idx, stats in self.slices.items()],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
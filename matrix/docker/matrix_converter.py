@@ -1,28 +1,76 @@
 """Script to convert the outputs of Redshift queries into different formats."""
 
 import argparse
-import gzip
+import collections
+import concurrent.futures
+import contextlib
 import os
 import shutil
 import sys
+import tempfile
 import zipfile
 
+import h5py
 import loompy
+import numcodecs
+import numpy
 import pandas
+import pyarrow
+import pyarrow.parquet
 import s3fs
+import zarr
 
 from matrix.common import date
-from matrix.common.constants import MatrixFormat
+from matrix.common.aws.s3_handler import S3Handler
+from matrix.common.constants import MatrixFormat, RUN_REPORT_SUFFIX
 from matrix.common.logging import Logging
 from matrix.common.request.request_tracker import RequestTracker, Subtask
 from matrix.common.query.cell_query_results_reader import CellQueryResultsReader
-from matrix.common.query.expression_query_results_reader import ExpressionQueryResultsReader
+from matrix.common.query.expression_query_results_reader import ExpressionParser, ExpressionQueryResultsReader
 from matrix.common.query.feature_query_results_reader import FeatureQueryResultsReader
+from matrix.common.query.feature_table import is_feature_table_url
+from matrix.common.query.feature_table_reader import FeatureTableReader
+from matrix.common.query.part_cache import get_part_cache
+from matrix.common.query.part_prefetcher import PartPrefetcher
+from matrix.docker.conversion_report import ConversionReport
+from matrix.docker.parallel_gzip import ParallelGzipFile
 from matrix.docker.query_runner import QueryType
 
 LOGGER = Logging.get_logger(__file__)
 SUPPORTED_FORMATS = [item.value for item in MatrixFormat]
 
+# Number of cells formatted together when writing csv expression data. Each block
+# holds a float32 value and a string reference per gene, so with ~58k genes a block
+# of 200 cells takes roughly 140MB.
+CSV_BLOCK_SIZE = 200
+
+# Compression level of the gzipped mtx and tsv files.
+GZIP_COMPRESSLEVEL = 4
+
+# Number of values per chunk of the h5ad sparse matrix datasets.
+H5AD_CHUNK_SIZE = 1000000
+
+# Schema of the parquet expression table. Each expression chunk is written as a row
+# group, and the keys are dictionary encoded since they repeat heavily.
+PARQUET_EXPRESSION_SCHEMA = pyarrow.schema([pyarrow.field("cellkey", pyarrow.string()),
+                                            pyarrow.field("featurekey", pyarrow.string()),
+                                            pyarrow.field("exprvalue", pyarrow.float32())])
+# pyarrow 0.13's ParquetWriter takes the names of dictionary columns as bytes, and with
+# str names silently dictionary encodes nothing.
+PARQUET_DICTIONARY_COLUMNS = [b"cellkey", b"featurekey"]
+
+# Number of expression slice parts downloaded ahead of the slice being converted, and
+# the most disk space they may take up together.
+PREFETCH_SLICES = 2
+PREFETCH_BYTES = 4 * 1024 ** 3
+
+# Number of rows formatted at a time when writing gzipped tsv metadata tables
+TSV_CHUNK_ROWS = 10000
+
+# Number of cells per chunk of the zarr expression array. With ~58k genes a chunk is
+# roughly 23MB before compression.
+ZARR_CELL_CHUNK_SIZE = 100
+
 
 class MatrixConverter:
 
@@ -35,6 +83,14 @@ class MatrixConverter:
         self.local_output_filename = os.path.basename(os.path.normpath(args.target_path))
         self.target_path = args.target_path
         self.working_dir = args.working_dir
+        self.csv_block_size = getattr(args, "csv_block_size", CSV_BLOCK_SIZE)
+        self.workers = getattr(args, "workers", 1)
+        self.compression_threads = getattr(args, "compression_threads", None)
+        self.expression_parser = ExpressionParser(getattr(args, "expression_parser", ExpressionParser.PANDAS.value))
+        self.prefetch_slices = getattr(args, "prefetch_slices", PREFETCH_SLICES)
+        self.prefetch_bytes = getattr(args, "prefetch_bytes", PREFETCH_BYTES)
+        self._pool = None
+        self.report = ConversionReport(args.request_id, self.format)
         self.FS = s3fs.S3FileSystem()
 
         Logging.set_correlation_id(LOGGER, value=args.request_id)
@@ -42,31 +98,97 @@ class MatrixConverter:
     def run(self):
         try:
             LOGGER.debug(f"Beginning matrix conversion run for {self.args.request_id}")
-            self.query_results = {
-                QueryType.CELL: CellQueryResultsReader(self.args.cell_metadata_manifest_key),
-                QueryType.EXPRESSION: ExpressionQueryResultsReader(self.args.expression_manifest_key),
-                QueryType.FEATURE: FeatureQueryResultsReader(self.args.gene_metadata_manifest_key)
-            }
+            with self.report.stage("read_manifests"):
+                self.query_results = {
+                    QueryType.CELL: CellQueryResultsReader(self.args.cell_metadata_manifest_key),
+                    QueryType.EXPRESSION: ExpressionQueryResultsReader(self.args.expression_manifest_key,
+                                                                       parser=self.expression_parser),
+                    QueryType.FEATURE: self._feature_reader(self.args.gene_metadata_manifest_key)
+                }
 
             LOGGER.debug(f"Beginning conversion to {self.format}")
-            local_converted_path = getattr(self, f"_to_{self.format}")()
+            with self.report.stage("convert"), self._prefetching():
+                local_converted_path = getattr(self, f"_to_{self.format}")()
             LOGGER.debug(f"Conversion to {self.format} completed")
 
-            LOGGER.debug(f"Beginning upload to S3")
-            self._upload_converted_matrix(local_converted_path, self.target_path)
-            LOGGER.debug("Upload to S3 complete, job finished")
+            # Formats that stream their output to S3 while converting leave nothing to upload
+            if local_converted_path:
+                LOGGER.debug(f"Beginning upload to S3")
+                self._upload_converted_matrix(local_converted_path, self.target_path)
+                LOGGER.debug("Upload to S3 complete, job finished")
 
-            os.remove(local_converted_path)
+                os.remove(local_converted_path)
 
+            self._publish_report()
             self.request_tracker.complete_subtask_execution(Subtask.CONVERTER)
             self.request_tracker.complete_request(duration=(date.get_datetime_now()
                                                             - date.to_datetime(self.request_tracker.creation_date))
                                                   .total_seconds())
+            self.request_tracker.cache_result()
         except Exception as e:
             LOGGER.info(f"Matrix Conversion failed on {self.args.request_id} with error {str(e)}")
             self.request_tracker.log_error(str(e))
             raise e
 
+    def _publish_report(self):
+        """Write the run report next to the converted matrix and log its key numbers
+        in CloudWatch. The report is best effort, so failures are logged rather than
+        failing the conversion."""
+        # Time spent in the conversion outside of reading, transforming and zipping is
+        # spent formatting and writing the output
+        stages = self.report.stages
+        if "convert" in stages:
+            write_stats = self.report.stage_stats("write")
+            write_stats.seconds = max(stages["convert"].seconds - sum(stages[name].seconds
+                                                                      for name in ["read_slices", "transform", "zip"]
+                                                                      if name in stages), 0)
+            write_stats.add(rows=stages["read_slices"].rows if "read_slices" in stages else 0,
+                            bytes_out=stages["upload"].bytes_out if "upload" in stages else 0)
+            write_stats.peak_rss_bytes = stages["convert"].peak_rss_bytes
+
+        report_path = f"{self.target_path}{RUN_REPORT_SUFFIX}"
+        try:
+            report = self.report.to_dict()
+            LOGGER.debug(f"Conversion stages: {report['stages']}")
+            with (self.FS.open(report_path, "wb") if self._streams_to_s3() else open(report_path, "wb")) as f:
+                f.write(self.report.to_json().encode())
+            self.request_tracker.log_conversion_report(report)
+        except Exception as e:
+            LOGGER.warning(f"Failed to publish the run report to {report_path}: {str(e)}")
+
+    @staticmethod
+    def _feature_reader(url):
+        """Read feature metadata from the data version's feature table, or from the results
+        of a feature query for requests that queried it themselves."""
+        if is_feature_table_url(url):
+            return FeatureTableReader(url)
+        return FeatureQueryResultsReader(url)
+
+    @contextlib.contextmanager
+    def _prefetching(self):
+        """Download the expression slices ahead of their conversion.
+
+        With worker processes, the workers already read several slices ahead
+        concurrently, so the slices are only prefetched for a single worker. The time
+        spent waiting for downloads is recorded as the download_wait stage.
+        """
+        if self.workers > 1 or not self.prefetch_slices:
+            yield
+            return
+
+        with PartPrefetcher(os.path.join(self.working_dir, "prefetch"),
+                            max_parts=self.prefetch_slices,
+                            max_bytes=self.prefetch_bytes,
+                            part_cache=get_part_cache()) as prefetcher:
+            self.query_results[QueryType.EXPRESSION].prefetch_parts(prefetcher)
+            try:
+                yield
+            finally:
+                self.query_results[QueryType.EXPRESSION].prefetcher = None
+                download_wait_stats = self.report.stage_stats("download_wait")
+                download_wait_stats.seconds += prefetcher.wait_seconds
+                download_wait_stats.add(bytes_in=prefetcher.downloaded_bytes)
+
     def _n_slices(self):
         """Return the number of slices associated with this Redshift result.
 
@@ -84,21 +206,73 @@ class MatrixConverter:
         return results_dir
 
     def _zip_up_matrix_output(self, results_dir, matrix_file_names):
-        zipf = zipfile.ZipFile(os.path.join(self.working_dir, self.local_output_filename), 'w')
-        for filename in matrix_file_names:
-            zipf.write(os.path.join(results_dir, filename),
-                       arcname=os.path.join(os.path.basename(results_dir),
-                                            filename))
-        zipf.close()
+        # Members are already compressed, so they're stored rather than deflated again
+        zip_path = os.path.join(self.working_dir, self.local_output_filename)
+        with self.report.stage("zip") as zip_stats:
+            zipf = zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED)
+            for filename in matrix_file_names:
+                zipf.write(os.path.join(results_dir, filename),
+                           arcname=os.path.join(os.path.basename(results_dir),
+                                                filename))
+            zipf.close()
+            zip_stats.add(bytes_out=os.path.getsize(zip_path))
         shutil.rmtree(results_dir)
-        return os.path.join(self.working_dir, self.local_output_filename)
+        return zip_path
+
+    def _streams_to_s3(self):
+        """Whether zip outputs are streamed straight to an S3 target path."""
+        return self.target_path.startswith("s3://")
+
+    @contextlib.contextmanager
+    def _zip_output(self, results_dir):
+        """Open the zip archive for the files of results_dir, removing results_dir
+        once the archive is written.
+
+        If the target is in S3, the archive is streamed into a multipart upload as it is
+        written, so the upload overlaps with the conversion and the archive is never
+        staged on local disk. Otherwise it's written to the working directory.
+
+        Yields:
+            zipfile.ZipFile to add members to, named as in _zip_up_matrix_output
+        """
+        if self._streams_to_s3():
+            bucket, key = self.target_path[len("s3://"):].split("/", 1)
+            output = S3Handler(bucket).open_multipart_upload(key)
+        else:
+            output = open(os.path.join(self.working_dir, self.local_output_filename), "wb")
+
+        with output:
+            with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as zipf:
+                yield zipf
+            # The archive is written as the conversion goes, so only its size is recorded
+            zip_bytes = output.tell()
+            self.report.stage_stats("zip").add(bytes_out=zip_bytes)
+            if self._streams_to_s3():
+                self.report.stage_stats("upload").add(bytes_out=zip_bytes)
+        shutil.rmtree(results_dir)
+
+    @staticmethod
+    def _zip_member_name(results_dir, filename):
+        return os.path.join(os.path.basename(results_dir), filename)
+
+    def _gzip_open(self, fileobj):
+        """Open a gzip stream into fileobj, compressed on multiple threads."""
+        return ParallelGzipFile(fileobj, compresslevel=GZIP_COMPRESSLEVEL, threads=self.compression_threads)
+
+    def _write_out_gzipped_tsv(self, path, df, index_label):
+        """Write a DataFrame as a gzipped tsv, formatting TSV_CHUNK_ROWS rows at a time so
+        that the whole table is never held as one string."""
+        with open(path, "wb") as f, self._gzip_open(f) as gzip_f:
+            # An empty frame still gets its header line
+            for start in range(0, max(len(df), 1), TSV_CHUNK_ROWS):
+                gzip_f.write(df.iloc[start:start + TSV_CHUNK_ROWS].to_csv(sep="\t",
+                                                                          index_label=index_label,
+                                                                          header=start == 0).encode())
 
     def _write_out_gene_dataframe(self, results_dir, output_filename, compression=False):
         gene_df = self.query_results[QueryType.FEATURE].load_results()
         if compression:
-            gene_df.to_csv(os.path.join(results_dir, output_filename),
-                           index_label="featurekey",
-                           sep="\t", compression="gzip")
+            self._write_out_gzipped_tsv(os.path.join(results_dir, output_filename), gene_df, "featurekey")
         else:
             gene_df.to_csv(os.path.join(results_dir, output_filename), index_label="featurekey")
         return gene_df
@@ -106,19 +280,244 @@ class MatrixConverter:
     def _write_out_cell_dataframe(self, results_dir, output_filename, cell_df, cellkeys, compression=False):
         cell_df = cell_df.reindex(index=cellkeys)
         if compression:
-            cell_df.to_csv(os.path.join(results_dir, output_filename),
-                           sep='\t',
-                           index_label="cellkey", compression="gzip")
+            self._write_out_gzipped_tsv(os.path.join(results_dir, output_filename), cell_df, "cellkey")
         else:
             cell_df.to_csv(os.path.join(results_dir, output_filename), index_label="cellkey")
         return cell_df
 
+    @contextlib.contextmanager
+    def _worker_pool(self):
+        """Run the conversion's slice reading and formatting in a process pool when
+        more than one worker is configured."""
+        if self.workers <= 1:
+            yield
+            return
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as pool:
+            self._pool = pool
+            try:
+                yield
+            finally:
+                self._pool = None
+
+    def _imap(self, func, iterable):
+        """Call func with each tuple of arguments in iterable, yielding the results in order.
+
+        In the process pool, at most twice the number of workers calls are in flight so
+        that results waiting to be written don't pile up in memory.
+        """
+        if self._pool is None:
+            for args in iterable:
+                yield func(*args)
+            return
+
+        pending = collections.deque()
+        for args in iterable:
+            pending.append(self._pool.submit(func, *args))
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _expression_coo_chunks(self, gene_index):
+        """Yield the sparse coordinates of each expression chunk, in slice and then chunk order.
+
+        With a single worker slices are read a chunk at a time. In the process pool
+        whole slices are read and mapped to coordinates by the workers, a few slices
+        ahead of the caller. The workers spill each chunk's coordinates to disk rather
+        than returning the whole slice, so only one chunk at a time is held in memory.
+
+        Args:
+            gene_index: Index of featurekeys that defines the row order
+
+        Yields:
+            slice_idx, (rows, cols, values, cellkeys) as returned by _expression_chunk_to_coo
+        """
+        if self._pool is None:
+            for slice_idx, chunk in self._expression_chunks():
+                with self.report.stage("transform", slice_idx) as stats:
+                    coo_chunk = self._expression_chunk_to_coo(chunk, gene_index)
+                    stats.add(rows=len(coo_chunk[2]))
+                yield slice_idx, coo_chunk
+            return
+
+        # The workers read and transform the slices, so the time spent waiting for each
+        # slice is recorded as reading it
+        reader = self.query_results[QueryType.EXPRESSION]
+        with tempfile.TemporaryDirectory(dir=self.working_dir) as spill_dir:
+            slice_args = ((reader, slice_idx, gene_index, spill_dir) for slice_idx in range(self._n_slices()))
+            slice_chunk_paths = self._imap(_load_expression_slice, slice_args)
+            for slice_idx in range(self._n_slices()):
+                with self.report.stage("read_slices", slice_idx) as stats:
+                    chunk_paths, rows = next(slice_chunk_paths)
+                bytes_in = self._part_content_length(QueryType.EXPRESSION, slice_idx)
+                stats.add(rows=rows, bytes_in=bytes_in)
+                self.report.slice_stats(slice_idx).add(rows=rows, bytes_in=bytes_in)
+                for chunk_path in chunk_paths:
+                    with numpy.load(chunk_path) as coo:
+                        coo_chunk = coo["rows"], coo["cols"], coo["values"], coo["cellkeys"].tolist()
+                    os.remove(chunk_path)
+                    yield slice_idx, coo_chunk
+
+    def _expression_chunks(self):
+        """Yield each chunk of expression results, in slice and then chunk order,
+        recording the time spent reading them.
+
+        Yields:
+            slice_idx, DataFrame of expression results
+        """
+        reader = self.query_results[QueryType.EXPRESSION]
+        for slice_idx in range(self._n_slices()):
+            bytes_in = self._part_content_length(QueryType.EXPRESSION, slice_idx)
+            self.report.stage_stats("read_slices").add(bytes_in=bytes_in)
+            self.report.slice_stats(slice_idx).add(bytes_in=bytes_in)
+
+            chunks = iter(reader.load_slice(slice_idx))
+            while True:
+                with self.report.stage("read_slices", slice_idx) as stats:
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                stats.add(rows=len(chunk))
+                self.report.slice_stats(slice_idx).add(rows=len(chunk))
+                yield slice_idx, chunk
+
+    def _part_content_length(self, query_type, slice_idx):
+        """Return the size in bytes of a slice's part file, or 0 if the manifest doesn't say."""
+        content_lengths = self.query_results[query_type].manifest.get("part_content_lengths")
+        return content_lengths[slice_idx] if content_lengths else 0
+
+    @staticmethod
+    def _expression_chunk_to_coo(chunk, gene_index):
+        """Map a cell-complete chunk of expression results to sparse coordinates.
+
+        Cells are numbered in sorted cellkey order and features by their position in
+        gene_index. Rows for features that are not in gene_index are dropped, but the
+        cells they belong to are kept so that every cell in the chunk gets a column.
+
+        Args:
+            chunk: DataFrame with cellkey, featurekey and exprvalue columns
+            gene_index: Index of featurekeys that defines the row order
+
+        Returns:
+            rows, cols, values: coordinates sorted by column, then row
+            cellkeys: list of cellkeys, where cellkeys[i] is the cell in column i
+        """
+        cells = pandas.Categorical(chunk["cellkey"].values)
+        if chunk["featurekey"].dtype.name == "category":
+            # Look up each distinct featurekey once rather than once per row
+            featurekeys = chunk["featurekey"].values
+            rows = gene_index.get_indexer(featurekeys.categories).take(featurekeys.codes)
+        else:
+            rows = gene_index.get_indexer(chunk["featurekey"].values)
+        cols = cells.codes.astype("int64")
+        values = chunk["exprvalue"].values
+
+        present = (rows >= 0) & ~numpy.isnan(values)
+        rows, cols, values = rows[present], cols[present], values[present]
+
+        order = numpy.lexsort((rows, cols))
+        return rows[order], cols[order], values[order], list(cells.categories)
+
+    @staticmethod
+    def _format_mtx_entries(rows, cols, values):
+        """Format zero-based sparse coordinates as MatrixMarket coordinate lines.
+
+        Values are written with the shortest repr of their double precision value, which
+        is how a float32 formats in an f-string.
+        """
+        return "".join(map("{} {} {!r}\n".format,
+                           (rows + 1).tolist(),
+                           (cols + 1).tolist(),
+                           values.astype("float64").tolist()))
+
+    @staticmethod
+    def _format_csv_block(cellkeys, rows, cols, values, n_genes):
+        """Format sparse coordinates as dense csv lines, one line per cell.
+
+        The coordinates are scattered into a cells x genes float32 block, and values
+        are written the way pandas writes a float32 frame: missing values as 0 and
+        present values with the shortest float32 repr.
+
+        Args:
+            cellkeys: cellkeys of the cells in the block, in column order
+            rows, cols: zero-based gene and cell positions of the values
+            values: float32 expression values
+            n_genes: number of genes, i.e. the width of each line
+
+        Returns:
+            str of csv lines
+        """
+        block = numpy.full((len(cellkeys), n_genes), numpy.nan, dtype="float32")
+        block[cols, rows] = values
+
+        present = ~numpy.isnan(block)
+        formatted = numpy.full(block.shape, "0", dtype=object)
+        formatted[present] = block[present].astype(str)
+
+        return "".join([cellkey + "," + ",".join(line) + "\n" for cellkey, line in zip(cellkeys, formatted)])
+
+    @staticmethod
+    def _csv_blocks(cellkeys, rows, cols, values, block_size):
+        """Split the sparse coordinates of a chunk into blocks of cells, to bound the
+        size of the dense block each is formatted in.
+
+        Args:
+            cellkeys, rows, cols, values: as returned by _expression_chunk_to_coo
+            block_size: number of cells per block
+
+        Yields:
+            cellkeys, rows, cols, values of each block, with cols relative to the block
+        """
+        for block_start in range(0, len(cellkeys), block_size):
+            block_cellkeys = cellkeys[block_start:block_start + block_size]
+            start, end = numpy.searchsorted(cols, [block_start, block_start + len(block_cellkeys)])
+            yield block_cellkeys, rows[start:end], cols[start:end] - block_start, values[start:end]
+
+    @staticmethod
+    def _metadata_values(series):
+        """Return a metadata column as an array zarr and h5py can store.
+
+        Numeric and boolean columns keep their dtype. Anything else, e.g. categoricals
+        and the true/false emptydrops calls, is stored as strings with missing values
+        as empty strings.
+        """
+        if series.dtype.kind in "biuf":
+            return series.values
+        return numpy.array(["" if pandas.isnull(value) else str(value) for value in series], dtype=object)
+
+    @staticmethod
+    def _create_zarr_attribute(group, name, values, **kwargs):
+        """Create an attribute array in a zarr group from the values of a metadata column."""
+        if values.dtype == object:
+            kwargs["object_codec"] = numcodecs.VLenUTF8()
+        return group.array(name, values, dtype=values.dtype, **kwargs)
+
+    @staticmethod
+    def _h5ad_records(df):
+        """Convert a metadata table to the structured array that h5ad stores obs and var
+        tables as, with the index in an "index" field and strings as UTF-8 bytes."""
+        names = ["index"] + list(df.columns)
+        arrays = []
+        for series in [df.index.to_series()] + [df[column] for column in df.columns]:
+            values = MatrixConverter._metadata_values(series)
+            if values.dtype == object:
+                values = numpy.array([value.encode() for value in values], dtype="S")
+            arrays.append(values)
+        return numpy.rec.fromarrays(arrays, names=names)
+
+    @staticmethod
+    def _extend_h5_dataset(dataset, values):
+        """Append values to the end of a resizable one-dimensional HDF5 dataset."""
+        start = dataset.shape[0]
+        dataset.resize((start + len(values),))
+        dataset[start:] = values
+
     def _to_mtx(self):
         """Write a zip file with an mtx and two metadata tsvs from Redshift query
         manifests.
 
         Returns:
-           output_path: Path to the zip file.
+           output_path: Path to the zip file, or None if it was streamed to S3.
         """
         results_dir = self._make_directory()
         gene_df = self._write_out_gene_dataframe(results_dir, "genes.tsv.gz", compression=True)
@@ -131,32 +530,29 @@ class MatrixConverter:
 
         cellkeys = []
 
-        with gzip.open(os.path.join(results_dir, "matrix.mtx.gz"), "w", compresslevel=4) as exp_f:
-            # Write the mtx header
-            exp_f.write("%%MatrixMarket matrix coordinate real general\n".encode())
-            exp_f.write(f"{n_rows} {n_cols} {n_nonzero}\n".encode())
+        def entries_args():
+            # Offset each chunk's columns by the number of cells before it
+            for _, (rows, cols, values, chunk_cellkeys) in self._expression_coo_chunks(gene_df.index):
+                yield rows, cols + len(cellkeys), values
+                cellkeys.extend(chunk_cellkeys)
 
-            cell_count = 0
-            for slice_idx in range(self._n_slices()):
-                for chunk in self.query_results[QueryType.EXPRESSION].load_slice(slice_idx):
+        with self._zip_output(results_dir) as zipf:
+            zipf.write(os.path.join(results_dir, "genes.tsv.gz"), self._zip_member_name(results_dir, "genes.tsv.gz"))
 
-                    grouped = chunk.groupby("cellkey")
-                    for cell_group in grouped:
-                        single_cell_df = cell_group[1]
-                        single_cell_coo = single_cell_df.pivot(
-                            index="featurekey", columns="cellkey", values="exprvalue").reindex(
-                            index=gene_df.index).to_sparse().to_coo()
+            with zipf.open(self._zip_member_name(results_dir, "matrix.mtx.gz"), "w", force_zip64=True) as zip_f, \
+                    self._gzip_open(zip_f) as exp_f, \
+                    self._worker_pool():
+                # Write the mtx header
+                exp_f.write("%%MatrixMarket matrix coordinate real general\n".encode())
+                exp_f.write(f"{n_rows} {n_cols} {n_nonzero}\n".encode())
 
-                        for row, col, value in zip(single_cell_coo.row, single_cell_coo.col, single_cell_coo.data):
-                            exp_f.write(f"{row + 1} {col + cell_count + 1} {value}\n".encode())
-                        cell_count += 1
+                for entries in self._imap(_format_mtx_lines, entries_args()):
+                    exp_f.write(entries)
 
-                        cellkeys.append(cell_group[0])
+            self._write_out_cell_dataframe(results_dir, "cells.tsv.gz", cell_df, cellkeys, compression=True)
+            zipf.write(os.path.join(results_dir, "cells.tsv.gz"), self._zip_member_name(results_dir, "cells.tsv.gz"))
 
-        self._write_out_cell_dataframe(results_dir, "cells.tsv.gz", cell_df, cellkeys, compression=True)
-        file_names = ["genes.tsv.gz", "matrix.mtx.gz", "cells.tsv.gz"]
-        zip_path = self._zip_up_matrix_output(results_dir, file_names)
-        return zip_path
+        return None if self._streams_to_s3() else os.path.join(self.working_dir, self.local_output_filename)
 
     def _to_loom(self):
         """Write a loom file from Redshift query manifests.
@@ -179,84 +575,53 @@ class MatrixConverter:
         for key, val in row_attrs.items():
             row_attrs[key] = val.values
 
-        loom_parts = []
-        loom_part_dir = os.path.join(self.working_dir, ".loom_parts")
+        n_genes = len(gene_df.index)
+        loom_path = os.path.join(self.working_dir, self.local_output_filename)
 
-        if os.path.exists(loom_part_dir):
-            shutil.rmtree(loom_part_dir)
+        # Append each chunk's cells to a single loom file as the chunk is read,
+        # rather than writing a loom file per chunk and combining them afterwards.
+        # The expression slices are read in order, by the workers if there are any,
+        # and the loom file is only ever written from this process.
+        with loompy.new(loom_path) as ds, self._worker_pool():
+            cell_df = None
+            cell_df_slice_idx = None
+            chunk_idx = 0
+            for slice_idx, (rows, cols, values, chunk_cellkeys) in self._expression_coo_chunks(gene_df.index):
+                if slice_idx != cell_df_slice_idx:
+                    # Get the cell metadata for all the cells in this slice. Loom
+                    # can't store categoricals, so convert those columns once for
+                    # the slice.
+                    cell_df = self.query_results[QueryType.CELL].load_slice(slice_idx)
+                    for col in cell_df.columns:
+                        if cell_df[col].dtype.name == "category":
+                            cell_df[col] = cell_df[col].astype("object")
+                    cell_df_slice_idx = slice_idx
+                    chunk_idx = 0
 
-        os.makedirs(loom_part_dir)
+                print(f"Loading chunk {chunk_idx} from slice {slice_idx}")
+                if not chunk_cellkeys:
+                    continue
 
-        # Iterate over the "slices" produced by the redshift query
-        for slice_idx in range(self._n_slices()):
+                # Genes are rows and cells are columns, in the same order as the row
+                # attributes.
+                expression = numpy.zeros((n_genes, len(chunk_cellkeys)), dtype="float32")
+                expression[rows, cols] = values
 
-            # Get the cell metadata for all the cells in this slice
-            cell_df = self.query_results[QueryType.CELL].load_slice(slice_idx)
+                # Get the cell metadata for just the cells in this chunk
+                chunk_cell_df = cell_df.reindex(index=chunk_cellkeys)
+                col_attrs = {key: val.values for key, val in chunk_cell_df.items()}
+                col_attrs["CellID"] = chunk_cell_df.index.values
 
-            # Iterate over fixed-size chunks of expression data from this
-            # slice.
-            chunk_idx = 0
-            for chunk in self.query_results[QueryType.EXPRESSION].load_slice(slice_idx):
-                print(f"Loading chunk {chunk_idx} from slice {slice_idx}")
-                sparse_cell_dfs = []
-
-                # Group the data by cellkey and iterate over each cell
-                grouped = chunk.groupby("cellkey")
-                for cell_group in grouped:
-                    single_cell_df = cell_group[1]
-
-                    # Reshape the dataframe so cellkey is a column and features
-                    # are rows. Reindex so all dataframes have the same row
-                    # order, and then sparsify because this is a very empty
-                    # dataset usually.
-                    sparse_cell_dfs.append(single_cell_df
-                                           .pivot(index="featurekey", columns="cellkey", values="exprvalue")
-                                           .reindex(index=row_attrs["Accession"]).to_sparse())
-
-                # Concatenate the cell dataframes together. This is what we'll
-                # write to disk.
-                if not sparse_cell_dfs:
-                    continue
-                sparse_expression_matrix = pandas.concat(sparse_cell_dfs, axis=1, copy=True)
-
-                # Get the cell metadata dataframe for just the cell in this
-                # chunk
-                chunk_cell_df = cell_df.reindex(index=sparse_expression_matrix.columns)
-                chunk_cell_df["cellkey"] = chunk_cell_df.index
-                for col in chunk_cell_df.columns:
-                    if chunk_cell_df[col].dtype.name == "category":
-                        chunk_cell_df[col] = chunk_cell_df[col].astype("object")
-                col_attrs = chunk_cell_df.to_dict("series")
-                col_attrs["CellID"] = col_attrs.pop("cellkey")
-
-                # Just a thing you have to do...
-                for key, val in col_attrs.items():
-                    col_attrs[key] = val.values
-
-                # Write the data from this chunk to its own file.
-                loom_part_path = os.path.join(loom_part_dir,
-                                              f"matrix.{slice_idx}.{chunk_idx}.loom")
-                print(f"Writing to {loom_part_path}")
-                loompy.create(
-                    loom_part_path, sparse_expression_matrix.to_coo(), row_attrs, col_attrs)
-                loom_parts.append(loom_part_path)
+                ds.add_columns(expression, col_attrs, row_attrs=row_attrs)
                 chunk_idx += 1
 
-        # Using the loompy method, combine all the chunks together into a
-        # single file.
-        print(f"Parts complete. Writing to {self.local_output_filename}")
-        loompy.combine(loom_parts,
-                       key="Accession",
-                       output_file=os.path.join(self.working_dir, self.local_output_filename))
-        shutil.rmtree(loom_part_dir)
-
         return os.path.join(self.working_dir, self.local_output_filename)
 
     def _to_csv(self):
         """Write a zip file with csvs from Redshift query manifests and readme.
 
         Returns:
-           output_path: Path to the new zip file.
+           output_path: Path to the new zip file, or None if it was streamed to S3.
         """
 
         results_dir = self._make_directory()
@@ -264,25 +629,201 @@ class MatrixConverter:
         cell_df = self.query_results[QueryType.CELL].load_results()
 
         cellkeys = []
-        with open(os.path.join(results_dir, "expression.csv"), "w") as exp_f:
-            # Write the CSV's header
-            gene_index_string_list = [str(x) for x in gene_df.index.tolist()]
-            exp_f.write(','.join(["cellkey"] + gene_index_string_list))
-            exp_f.write('\n')
 
-            for slice_idx in range(self._n_slices()):
-                for chunk in self.query_results[QueryType.EXPRESSION].load_slice(slice_idx):
-                    # Group the data by cellkey and iterate over each cell
-                    grouped = chunk.groupby("cellkey")
-                    for cell_group in grouped:
-                        single_cell_df = cell_group[1]
-                        single_cell_df.pivot(
-                            index="cellkey", columns="featurekey", values="exprvalue").reindex(
-                            columns=gene_df.index).to_csv(exp_f, header=False, na_rep='0')
-                        cellkeys.append(cell_group[0])
-
-        self._write_out_cell_dataframe(results_dir, "cells.csv", cell_df, cellkeys)
-        file_names = ["genes.csv", "expression.csv", "cells.csv"]
+        def lines_args():
+            for _, coo_chunk in self._expression_coo_chunks(gene_df.index):
+                rows, cols, values, chunk_cellkeys = coo_chunk
+                for block in self._csv_blocks(chunk_cellkeys, rows, cols, values, self.csv_block_size):
+                    yield block + (len(gene_df.index),)
+                cellkeys.extend(chunk_cellkeys)
+
+        with self._zip_output(results_dir) as zipf:
+            zipf.write(os.path.join(results_dir, "genes.csv"), self._zip_member_name(results_dir, "genes.csv"))
+
+            with zipf.open(self._zip_member_name(results_dir, "expression.csv"), "w", force_zip64=True) as exp_f, \
+                    self._worker_pool():
+                # Write the CSV's header
+                gene_index_string_list = [str(x) for x in gene_df.index.tolist()]
+                exp_f.write(','.join(["cellkey"] + gene_index_string_list).encode())
+                exp_f.write(b'\n')
+
+                for lines in self._imap(_format_csv_lines, lines_args()):
+                    exp_f.write(lines)
+
+            self._write_out_cell_dataframe(results_dir, "cells.csv", cell_df, cellkeys)
+            zipf.write(os.path.join(results_dir, "cells.csv"), self._zip_member_name(results_dir, "cells.csv"))
+
+        return None if self._streams_to_s3() else os.path.join(self.working_dir, self.local_output_filename)
+
+    def _to_h5ad(self):
+        """Write an AnnData h5ad file from Redshift query manifests.
+
+        The expression matrix is stored as a cells x genes CSR matrix whose data,
+        indices and indptr datasets are extended chunk by chunk as the expression
+        slices are read, so neither a dense nor a full COO matrix is held in memory.
+        Cell and gene metadata are written as the obs and var tables.
+
+        Returns:
+           output_path: Path to the new h5ad file.
+        """
+        if not self.local_output_filename.endswith(".h5ad"):
+            self.local_output_filename += ".h5ad"
+
+        gene_df = self.query_results[QueryType.FEATURE].load_results()
+        cell_df = self.query_results[QueryType.CELL].load_results()
+        n_genes = len(gene_df.index)
+        cellkeys = []
+
+        h5ad_path = os.path.join(self.working_dir, self.local_output_filename)
+        with h5py.File(h5ad_path, "w") as h5ad_file:
+            matrix = h5ad_file.create_group("X")
+            matrix.attrs["h5sparse_format"] = "csr"
+            data = matrix.create_dataset("data", shape=(0,), maxshape=(None,),
+                                         chunks=(H5AD_CHUNK_SIZE,), dtype="float32")
+            indices = matrix.create_dataset("indices", shape=(0,), maxshape=(None,),
+                                            chunks=(H5AD_CHUNK_SIZE,), dtype="int32")
+            indptr = matrix.create_dataset("indptr", data=numpy.zeros(1, dtype="int64"), maxshape=(None,),
+                                           chunks=(H5AD_CHUNK_SIZE,))
+
+            with self._worker_pool():
+                for _, (rows, cols, values, chunk_cellkeys) in self._expression_coo_chunks(gene_df.index):
+                    # The coordinates are sorted by cell and then gene, which is CSR
+                    # order, so each chunk's cells extend the matrix as they are.
+                    cell_ends = numpy.searchsorted(cols, numpy.arange(1, len(chunk_cellkeys) + 1))
+                    self._extend_h5_dataset(indptr, data.shape[0] + cell_ends)
+                    self._extend_h5_dataset(data, values)
+                    self._extend_h5_dataset(indices, rows)
+                    cellkeys.extend(chunk_cellkeys)
+
+            matrix.attrs["h5sparse_shape"] = numpy.array([len(cellkeys), n_genes])
+            h5ad_file.create_dataset("obs", data=self._h5ad_records(cell_df.reindex(index=cellkeys)))
+            h5ad_file.create_dataset("var", data=self._h5ad_records(gene_df))
+
+        return h5ad_path
+
+    def _to_zarr(self):
+        """Write a zip file with a zarr store from Redshift query manifests.
+
+        The store holds a cells x genes expression array chunked by cell, the cell_id
+        and gene_id arrays, and an array per field in the cell_metadata and
+        gene_metadata groups. Cells are appended a chunk at a time as the expression
+        slices are read, so the full matrix is never held in memory.
+
+        Returns:
+           output_path: Path to the zip file.
+        """
+        results_dir = self._make_directory()
+        gene_df = self.query_results[QueryType.FEATURE].load_results()
+        cell_df = self.query_results[QueryType.CELL].load_results()
+        n_genes = len(gene_df.index)
+
+        root = zarr.open_group(results_dir, mode="w")
+
+        # Gene attributes are small enough to write in one go
+        self._create_zarr_attribute(root, "gene_id", self._metadata_values(gene_df.index.to_series()))
+        gene_metadata = root.create_group("gene_metadata")
+        for column in gene_df.columns:
+            self._create_zarr_attribute(gene_metadata, column, self._metadata_values(gene_df[column]))
+
+        # Cell arrays start empty and grow as cells are appended
+        expression = root.zeros("expression",
+                                shape=(0, n_genes),
+                                chunks=(ZARR_CELL_CHUNK_SIZE, n_genes),
+                                dtype="float32")
+        cell_attributes = {"cell_id": self._create_zarr_attribute(root,
+                                                                  "cell_id",
+                                                                  numpy.array([], dtype=object),
+                                                                  chunks=(ZARR_CELL_CHUNK_SIZE,))}
+        cell_metadata = root.create_group("cell_metadata")
+        for column in cell_df.columns:
+            cell_attributes[column] = self._create_zarr_attribute(
+                cell_metadata, column, self._metadata_values(cell_df[column].iloc[:0]),
+                chunks=(ZARR_CELL_CHUNK_SIZE,))
+
+        # Cells are buffered until they fill a zarr chunk, so that every append but
+        # the last writes whole chunks rather than rewriting a partial one per append.
+        pending_cellkeys = []
+        pending_blocks = []
+        with self._worker_pool():
+            for _, (rows, cols, values, chunk_cellkeys) in self._expression_coo_chunks(gene_df.index):
+                block_start = 0
+                while block_start < len(chunk_cellkeys):
+                    block_size = ZARR_CELL_CHUNK_SIZE - len(pending_cellkeys)
+                    block_cellkeys = chunk_cellkeys[block_start:block_start + block_size]
+                    start, end = numpy.searchsorted(cols, [block_start, block_start + len(block_cellkeys)])
+
+                    block = numpy.zeros((len(block_cellkeys), n_genes), dtype="float32")
+                    block[cols[start:end] - block_start, rows[start:end]] = values[start:end]
+                    pending_blocks.append(block)
+                    pending_cellkeys.extend(block_cellkeys)
+                    block_start += len(block_cellkeys)
+
+                    if len(pending_cellkeys) == ZARR_CELL_CHUNK_SIZE:
+                        self._append_zarr_cells(expression, cell_attributes, cell_df, pending_cellkeys, pending_blocks)
+                        pending_cellkeys, pending_blocks = [], []
+
+        if pending_cellkeys:
+            self._append_zarr_cells(expression, cell_attributes, cell_df, pending_cellkeys, pending_blocks)
+
+        file_names = [os.path.relpath(os.path.join(dir_path, file_name), results_dir)
+                      for dir_path, _, dir_file_names in os.walk(results_dir)
+                      for file_name in dir_file_names]
+        zip_path = self._zip_up_matrix_output(results_dir, file_names)
+        return zip_path
+
+    def _append_zarr_cells(self, expression, cell_attributes, cell_df, cellkeys, blocks):
+        """Append cells to the zarr expression array and cell attribute arrays.
+
+        Args:
+            expression: zarr cells x genes expression array
+            cell_attributes: dict of the zarr cell attribute arrays by column name
+            cell_df: DataFrame of cell metadata indexed by cellkey
+            cellkeys: cellkeys of the cells to append
+            blocks: dense cells x genes blocks of the cells' expression values, in cellkey order
+        """
+        expression.append(numpy.concatenate(blocks))
+
+        block_cell_df = cell_df.reindex(index=cellkeys)
+        cell_attributes["cell_id"].append(numpy.array(cellkeys, dtype=object))
+        for column in cell_df.columns:
+            cell_attributes[column].append(self._metadata_values(block_cell_df[column]))
+
+    def _to_parquet(self):
+        """Write a zip file with parquet expression, cell and gene tables from Redshift
+        query manifests.
+
+        Expression values are written in long format, one row per cellkey, featurekey
+        and exprvalue, with a row group per expression chunk as the slices are read.
+
+        Returns:
+           output_path: Path to the zip file.
+        """
+        results_dir = self._make_directory()
+        gene_df = self.query_results[QueryType.FEATURE].load_results()
+        cell_df = self.query_results[QueryType.CELL].load_results()
+
+        cellkeys = []
+        writer = pyarrow.parquet.ParquetWriter(os.path.join(results_dir, "expression.parquet"),
+                                               PARQUET_EXPRESSION_SCHEMA,
+                                               use_dictionary=PARQUET_DICTIONARY_COLUMNS)
+        try:
+            for _, chunk in self._expression_chunks():
+                writer.write_table(pyarrow.Table.from_pandas(chunk,
+                                                             schema=PARQUET_EXPRESSION_SCHEMA,
+                                                             preserve_index=False))
+                cellkeys.extend(chunk["cellkey"].unique())
+        finally:
+            writer.close()
+
+        pyarrow.parquet.write_table(
+            pyarrow.Table.from_pandas(cell_df.reindex(index=cellkeys).rename_axis("cellkey").reset_index(),
+                                      preserve_index=False),
+            os.path.join(results_dir, "cells.parquet"))
+        pyarrow.parquet.write_table(
+            pyarrow.Table.from_pandas(gene_df.rename_axis("featurekey").reset_index(), preserve_index=False),
+            os.path.join(results_dir, "genes.parquet"))
+
+        file_names = ["genes.parquet", "expression.parquet", "cells.parquet"]
         zip_path = self._zip_up_matrix_output(results_dir, file_names)
         return zip_path
 
@@ -296,7 +837,37 @@ class MatrixConverter:
         remote_path : str
             S3 path where the converted matrix will be uploaded
         """
-        self.FS.put(local_path, remote_path)
+        with self.report.stage("upload") as stats:
+            self.FS.put(local_path, remote_path)
+            stats.add(bytes_out=os.path.getsize(local_path))
+
+
+def _load_expression_slice(reader, slice_idx, gene_index, spill_dir):
+    """Read a slice of expression results in a worker process, writing the sparse
+    coordinates of each chunk to its own file in spill_dir.
+
+    Returns:
+        list of the chunk files in chunk order, and the number of values in the slice
+    """
+    chunk_paths = []
+    n_values = 0
+    for chunk_idx, chunk in enumerate(reader.load_slice(slice_idx)):
+        rows, cols, values, cellkeys = MatrixConverter._expression_chunk_to_coo(chunk, gene_index)
+        chunk_path = os.path.join(spill_dir, f"{slice_idx}.{chunk_idx}.npz")
+        numpy.savez(chunk_path, rows=rows, cols=cols, values=values, cellkeys=numpy.array(cellkeys, dtype=str))
+        chunk_paths.append(chunk_path)
+        n_values += len(values)
+    return chunk_paths, n_values
+
+
+def _format_mtx_lines(rows, cols, values):
+    """Format a chunk of mtx entries in a worker process."""
+    return MatrixConverter._format_mtx_entries(rows, cols, values).encode()
+
+
+def _format_csv_lines(cellkeys, rows, cols, values, n_genes):
+    """Format a block of csv expression lines in a worker process."""
+    return MatrixConverter._format_csv_block(cellkeys, rows, cols, values, n_genes).encode()
 
 
 def main(args):
@@ -310,7 +881,7 @@ def main(args):
     parser.add_argument("cell_metadata_manifest_key",
                         help="S3 url to Redshift manifest for the cell table.")
     parser.add_argument("gene_metadata_manifest_key",
-                        help="S3 url to Redshift manifest for the gene table.")
+                        help="S3 url to the feature table, or to Redshift manifest for the gene table.")
     parser.add_argument("target_path",
                         help="S3 prefix where the file should be written.")
     parser.add_argument("format",
@@ -318,6 +889,30 @@ def main(args):
                         choices=SUPPORTED_FORMATS)
     parser.add_argument("working_dir",
                         help="Directory to write local files.")
+    parser.add_argument("--csv-block-size",
+                        type=int,
+                        default=CSV_BLOCK_SIZE,
+                        help="Number of cells to format at a time when writing csv expression data.")
+    parser.add_argument("--workers",
+                        type=int,
+                        default=1,
+                        help="Number of processes to read and format Redshift slices with.")
+    parser.add_argument("--compression-threads",
+                        type=int,
+                        default=None,
+                        help="Number of threads to gzip outputs with. Defaults to the number of CPUs.")
+    parser.add_argument("--expression-parser",
+                        default=ExpressionParser.PANDAS.value,
+                        choices=[item.value for item in ExpressionParser],
+                        help="Parser to read the expression query results with.")
+    parser.add_argument("--prefetch-slices",
+                        type=int,
+                        default=PREFETCH_SLICES,
+                        help="Number of expression slices to download ahead of the conversion, or 0 to not prefetch.")
+    parser.add_argument("--prefetch-bytes",
+                        type=int,
+                        default=PREFETCH_BYTES,
+                        help="Most disk space that prefetched expression slices may take up.")
     args = parser.parse_args(args)
     LOGGER.debug(
         f"Starting matrix conversion job with parameters: "
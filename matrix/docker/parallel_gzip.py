@@ -0,0 +1,113 @@
+"""Multi-threaded gzip compression for the converter's outputs."""
+
+import collections
+import concurrent.futures
+import os
+import struct
+import zlib
+
+# Size of the blocks of uncompressed input that are compressed independently
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# Size of the deflate window, i.e. of the input preceding a block that it may refer back to
+DICTIONARY_SIZE = 32 * 1024
+
+# gzip header of a deflate stream with no file name or modification time
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+class ParallelGzipFile:
+    """Write-only gzip file object that compresses blocks of its input on a thread pool.
+
+    Like pigz, the input is split into fixed-size blocks that are deflated concurrently
+    and written out in order as a single gzip member. Each block is deflated with the
+    last 32KB of the block before it as its dictionary and ended on a byte boundary
+    with a sync flush, so the blocks concatenate into one deflate stream that compresses
+    close to what a single-threaded gzip would. zlib releases the GIL while it
+    compresses, so the blocks are compressed on separate cores. The CRC of the input is
+    computed as it is written.
+    """
+
+    def __init__(self, fileobj, compresslevel: int = 9, block_size: int = BLOCK_SIZE, threads: int = None):
+        """
+        Args:
+            fileobj: Binary file object the compressed stream is written to
+            compresslevel: zlib compression level of each block
+            block_size: Size of the blocks of uncompressed input
+            threads: Number of compression threads, by default the number of CPUs
+        """
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.block_size = block_size
+        self.threads = threads or os.cpu_count() or 1
+        self.closed = False
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads)
+        self._pending_blocks = collections.deque()
+        self._buffer = bytearray()
+        self._dictionary = b""
+        self._crc = 0
+        self._size = 0
+
+        self.fileobj.write(GZIP_HEADER)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data) -> int:
+        self._buffer.extend(data)
+        while len(self._buffer) >= self.block_size:
+            self._compress_block(bytes(self._buffer[:self.block_size]), last=False)
+            del self._buffer[:self.block_size]
+        return len(data)
+
+    def close(self):
+        """Compress the remaining input, which ends the deflate stream, and write out all
+        blocks and the gzip trailer. The underlying file object is left open."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._compress_block(bytes(self._buffer), last=True)
+            self._buffer = bytearray()
+            while self._pending_blocks:
+                self._write_oldest_block()
+            self.fileobj.write(struct.pack("<II", self._crc, self._size & 0xffffffff))
+        finally:
+            self._executor.shutdown()
+
+    def _compress_block(self, block: bytes, last: bool):
+        # Bound the number of compressed blocks waiting to be written
+        if len(self._pending_blocks) >= 2 * self.threads:
+            self._write_oldest_block()
+        self._pending_blocks.append(self._executor.submit(_deflate_block,
+                                                          block,
+                                                          self._dictionary,
+                                                          self.compresslevel,
+                                                          last))
+        self._dictionary = (self._dictionary + block)[-DICTIONARY_SIZE:]
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+
+    def _write_oldest_block(self):
+        self.fileobj.write(self._pending_blocks.popleft().result())
+
+
+def _deflate_block(block: bytes, dictionary: bytes, compresslevel: int, last: bool) -> bytes:
+    """Deflate a block of input as a part of a raw deflate stream.
+
+    Args:
+        block: Uncompressed input
+        dictionary: Input preceding the block that matches may refer back to
+        compresslevel: zlib compression level
+        last: Whether the block ends the stream, else it is ended with a sync flush
+
+    Returns:
+        bytes of raw deflate data
+    """
+    kwargs = {"zdict": dictionary} if dictionary else {}
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, **kwargs)
+    return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
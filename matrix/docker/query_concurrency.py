@@ -0,0 +1,58 @@
+"""Adaptive limit on the number of queries a QueryRunner runs concurrently."""
+
+import threading
+
+# ID of the last query run in a Redshift session
+LAST_QUERY_ID_QUERY = "SELECT pg_last_query_id();"
+
+# WLM statistics of completed queries, in microseconds. Redshift logs queries to
+# stl_wlm_query a while after they complete, so a query's statistics are usually not
+# there yet when it returns and are looked up again later.
+WLM_QUERY_STATS_QUERY_TEMPLATE = """
+SELECT query, total_queue_time, total_exec_time
+FROM stl_wlm_query
+WHERE query IN ({query_ids})
+;
+"""
+
+# Time after which queries whose WLM statistics still haven't been logged are no longer looked up
+WLM_QUERY_STATS_TIMEOUT_SECONDS = 600
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Limit on the number of queries run concurrently, adapted to the time the queries wait
+    in Redshift's WLM queue before executing.
+
+    Queries only wait in the queue once every WLM slot available to them is taken, at which
+    point running more of them concurrently doesn't finish any sooner. The limit is raised
+    by one after each query that ran at the limit without waiting for more than
+    max_queue_ratio of its execution time, and halved after any query that waited longer.
+    """
+
+    def __init__(self, minimum: int = 1, maximum: int = 8, initial: int = 1, max_queue_ratio: float = 0.1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_queue_ratio = max_queue_ratio
+
+        self._limit = max(minimum, min(maximum, initial))
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    def observe(self, queue_seconds: float, exec_seconds: float, concurrency: int) -> int:
+        """
+        Adapts the limit to a completed query.
+        :param queue_seconds: Time the query waited in the WLM queue
+        :param exec_seconds: Time the query executed for
+        :param concurrency: Number of queries running, including this one, when it started
+        :return: int The new limit
+        """
+        with self._lock:
+            if queue_seconds > self.max_queue_ratio * exec_seconds:
+                self._limit = max(self.minimum, self._limit // 2)
+            elif concurrency >= self._limit:
+                self._limit = min(self.maximum, self._limit + 1)
+            return self._limit
@@ -1,15 +1,26 @@
 """Script to pull from sqs and run redshift queries. Will be dockerized."""
+import concurrent.futures
+import functools
 import json
 import os
+import threading
+import time
 import traceback
 from enum import Enum
 
 from matrix.common.aws.batch_handler import BatchHandler
+from matrix.common.aws.cloudwatch_handler import CloudwatchHandler, MetricName
 from matrix.common.aws.redshift_handler import RedshiftHandler
 from matrix.common.aws.s3_handler import S3Handler
-from matrix.common.aws.sqs_handler import SQSHandler
+from matrix.common.aws.sqs_handler import MAX_BATCH_SIZE, SQSHandler, VisibilityHeartbeat
 from matrix.common.config import MatrixInfraConfig
 from matrix.common.logging import Logging
+from matrix.docker.query_concurrency import (AdaptiveConcurrencyLimit,
+                                             LAST_QUERY_ID_QUERY,
+                                             WLM_QUERY_STATS_QUERY_TEMPLATE,
+                                             WLM_QUERY_STATS_TIMEOUT_SECONDS)
+from matrix.common.query.feature_table import FeatureTable
+from matrix.common.query.project_shards import ProjectShards
 from matrix.common.request.request_tracker import RequestTracker, Subtask
 
 logger = Logging.get_logger(__name__)
@@ -18,17 +29,38 @@ logger = Logging.get_logger(__name__)
 class QueryType(Enum):
     CELL = "cell"
     EXPRESSION = "expression"
+    # Feature metadata is read from per data version feature tables (see FeatureTable).
+    # Feature queries are only run for requests queued before those replaced them.
     FEATURE = "feature"
+    # Shards of a union of whole projects to build and assemble (see ProjectShards)
+    PROJECT_UNION = "project_union"
 
 
 class QueryRunner:
+    """
+    Runs the queries queued by the drivers, up to concurrency_limit.limit at a time on a
+    pool of worker threads, and schedules the conversion of requests whose queries are done.
 
-    def __init__(self):
+    Messages stay invisible to other query runners while they are processed, and are
+    deleted in batches by the main thread once their workers are done with them.
+    """
+
+    def __init__(self, max_concurrency: int = 8, initial_concurrency: int = 4):
         self.sqs_handler = SQSHandler()
         self.s3_handler = S3Handler(os.environ["MATRIX_QUERY_BUCKET"])
         self.batch_handler = BatchHandler()
         self.redshift_handler = RedshiftHandler()
+        self.cloudwatch_handler = CloudwatchHandler()
+        self.project_shards = ProjectShards()
         self.matrix_infra_config = MatrixInfraConfig()
+        self.concurrency_limit = AdaptiveConcurrencyLimit(maximum=max_concurrency, initial=initial_concurrency)
+
+        self._running_queries = 0
+        self._running_queries_lock = threading.Lock()
+        self._pending_query_stats = {}
+        self._pending_query_stats_lock = threading.Lock()
+        self._processed_receipt_handles = []
+        self._processed_receipt_handles_lock = threading.Lock()
 
     @property
     def query_job_q_url(self):
@@ -40,56 +72,212 @@ class QueryRunner:
 
     def run(self, max_loops=None):
         loops = 0
-        while max_loops is None or loops < max_loops:
-            loops += 1
-            messages = self.sqs_handler.receive_messages_from_queue(self.query_job_q_url)
-            if messages:
-                message = messages[0]
-                logger.info(f"Received {message} from {self.query_job_q_url}")
-                payload = json.loads(message['Body'])
-                request_id = payload['request_id']
-                request_tracker = RequestTracker(request_id)
-                Logging.set_correlation_id(logger, value=request_id)
-                obj_key = payload['s3_obj_key']
-                query_type = payload['type']
-                receipt_handle = message['ReceiptHandle']
-                try:
-                    logger.info(f"Fetching query from {obj_key}")
-                    query = self.s3_handler.load_content_from_obj_key(obj_key)
-
-                    logger.info(f"Running query from {obj_key}")
-                    self.redshift_handler.transaction([query], read_only=True)
-                    logger.info(f"Finished running query from {obj_key}")
-
-                    logger.info(f"Deleting {message} from {self.query_job_q_url}")
-                    self.sqs_handler.delete_message_from_queue(self.query_job_q_url, receipt_handle)
-
-                    if query_type == QueryType.CELL.value:
-                        cached_result_s3_key = request_tracker.lookup_cached_result()
-                        if cached_result_s3_key:
-                            s3 = S3Handler(os.environ['MATRIX_RESULTS_BUCKET'])
-                            s3.copy_obj(cached_result_s3_key, request_tracker.s3_results_key)
-                            continue
-
-                    logger.info("Incrementing completed queries in state table")
-                    request_tracker.complete_subtask_execution(Subtask.QUERY)
-
-                    if request_tracker.is_request_ready_for_conversion():
-                        logger.info("Scheduling batch conversion job")
-                        batch_job_id = self.batch_handler.schedule_matrix_conversion(request_id,
-                                                                                     request_tracker.format,
-                                                                                     request_tracker.s3_results_key)
-                        request_tracker.write_batch_job_id_to_db(batch_job_id)
-                except Exception as e:
-                    logger.info(f"QueryRunner failed on {message} with error {e}")
-                    request_tracker.log_error(str(e))
-                    logger.error(traceback.format_exc())
-                    logger.info(f"Adding {message} to {self.query_job_deadletter_q_url}")
-                    self.sqs_handler.add_message_to_queue(self.query_job_deadletter_q_url, payload)
-                    logger.info(f"Deleting {message} from {self.query_job_q_url}")
-                    self.sqs_handler.delete_message_from_queue(self.query_job_q_url, receipt_handle)
+        heartbeat = VisibilityHeartbeat(self.sqs_handler, self.query_job_q_url)
+        heartbeat.start()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency_limit.maximum) as executor:
+                in_flight = set()
+                while max_loops is None or loops < max_loops:
+                    loops += 1
+                    while len(in_flight) >= self.concurrency_limit.limit:
+                        _, in_flight = concurrent.futures.wait(in_flight,
+                                                               return_when=concurrent.futures.FIRST_COMPLETED)
+                    self._delete_processed_messages(heartbeat)
+                    self._observe_query_stats()
+
+                    num_messages = min(MAX_BATCH_SIZE, self.concurrency_limit.limit - len(in_flight))
+                    messages = self.sqs_handler.receive_messages_from_queue(self.query_job_q_url,
+                                                                            num_messages=num_messages)
+                    if messages:
+                        for message in messages:
+                            heartbeat.add(message['ReceiptHandle'])
+                            future = executor.submit(self._process_message, message)
+                            future.add_done_callback(functools.partial(self._release_unprocessed_message,
+                                                                       heartbeat,
+                                                                       message['ReceiptHandle']))
+                            in_flight.add(future)
+                    else:
+                        logger.info(f"No messages to read from {self.query_job_q_url}")
+                    in_flight = {future for future in in_flight if not future.done()}
+        finally:
+            self._delete_processed_messages(heartbeat)
+            heartbeat.stop()
+
+    def _process_message(self, message: dict):
+        logger.info(f"Received {message} from {self.query_job_q_url}")
+        payload = json.loads(message['Body'])
+        request_id = payload['request_id']
+        request_tracker = RequestTracker(request_id)
+        Logging.set_correlation_id(logger, value=request_id)
+        obj_key = payload['s3_obj_key']
+        query_type = payload['type']
+        receipt_handle = message['ReceiptHandle']
+        try:
+            if query_type in (QueryType.EXPRESSION.value, QueryType.FEATURE.value) and \
+                    request_tracker.is_request_complete():
+                # The cell query already completed the request from a cached result. Only
+                # queued messages are skipped: queries already running, in this or other
+                # query runners, are not cancelled and run to completion.
+                logger.info(f"Skipping query from {obj_key}, request is complete")
+                self._mark_processed(receipt_handle)
+                return
+
+            logger.info(f"Fetching query from {obj_key}")
+            query = self.s3_handler.load_content_from_obj_key(obj_key)
+
+            if query_type == QueryType.PROJECT_UNION.value:
+                shards = json.loads(query)
+                logger.info(f"Building missing project shards from {obj_key}")
+                built = self.project_shards.build_missing(shards, self.redshift_handler)
+                logger.info(f"Built {built} project shards, assembling query results")
+                self.project_shards.assemble(request_id, shards)
             else:
-                logger.info(f"No messages to read from {self.query_job_q_url}")
+                logger.info(f"Running query from {obj_key}")
+                self._run_query(query, query_type)
+                logger.info(f"Finished running query from {obj_key}")
+
+            self._mark_processed(receipt_handle)
+
+            if query_type == QueryType.CELL.value:
+                cached_result_s3_key = request_tracker.lookup_cached_result()
+                if cached_result_s3_key:
+                    s3 = S3Handler(os.environ['MATRIX_RESULTS_BUCKET'])
+                    s3.copy_obj(cached_result_s3_key, request_tracker.s3_results_key)
+                    request_tracker.cache_result()
+                    return
+                self._add_deferred_queries_to_sqs(request_id, payload.get('deferred_queries', {}))
+
+            logger.info("Incrementing completed queries in state table")
+            request_tracker.complete_subtask_execution(Subtask.QUERY)
+
+            if request_tracker.is_request_ready_for_conversion():
+                feature_table = FeatureTable(request_tracker.data_version, request_tracker.feature)
+                feature_table_url = feature_table.get_or_build(self.redshift_handler)
+
+                logger.info("Scheduling batch conversion job")
+                batch_job_id = self.batch_handler.schedule_matrix_conversion(request_id,
+                                                                             request_tracker.format,
+                                                                             request_tracker.s3_results_key,
+                                                                             feature_table_url)
+                request_tracker.write_batch_job_id_to_db(batch_job_id)
+        except Exception as e:
+            logger.info(f"QueryRunner failed on {message} with error {e}")
+            request_tracker.log_error(str(e))
+            logger.error(traceback.format_exc())
+            logger.info(f"Adding {message} to {self.query_job_deadletter_q_url}")
+            self.sqs_handler.add_message_to_queue(self.query_job_deadletter_q_url, payload)
+            self._mark_processed(receipt_handle)
+
+    def _mark_processed(self, receipt_handle: str):
+        """
+        Marks a message as processed, to be deleted from the queue by the main thread.
+        """
+        with self._processed_receipt_handles_lock:
+            self._processed_receipt_handles.append(receipt_handle)
+
+    def _delete_processed_messages(self, heartbeat: VisibilityHeartbeat):
+        with self._processed_receipt_handles_lock:
+            receipt_handles = list(dict.fromkeys(self._processed_receipt_handles))
+            self._processed_receipt_handles = []
+        if receipt_handles:
+            logger.info(f"Deleting {len(receipt_handles)} processed messages from {self.query_job_q_url}")
+            self.sqs_handler.delete_messages_from_queue(self.query_job_q_url, receipt_handles)
+            heartbeat.remove(receipt_handles)
+
+    def _run_query(self, query: str, query_type: str):
+        """
+        Runs a query, putting its duration and the concurrency it ran at to CloudWatch Metrics.
+        The query's ID is kept to adapt the concurrency limit to its WLM statistics once
+        Redshift has logged them (see _observe_query_stats).
+        :param query: Query to run
+        :param query_type: QueryType value of the query
+        """
+        with self._running_queries_lock:
+            self._running_queries += 1
+            concurrency = self._running_queries
+        try:
+            start_time = time.time()
+            rows = self.redshift_handler.transaction([query, LAST_QUERY_ID_QUERY],
+                                                     return_results=True,
+                                                     read_only=True)
+            duration = time.time() - start_time
+        finally:
+            with self._running_queries_lock:
+                self._running_queries -= 1
+
+        if rows and rows[0][0] > 0:
+            with self._pending_query_stats_lock:
+                self._pending_query_stats[rows[0][0]] = (query_type, concurrency, time.time())
+
+        dimensions = [{'Name': "Query Type", 'Value': query_type}]
+        self.cloudwatch_handler.put_metric_data_batch([(MetricName.QUERY_DURATION, duration, dimensions),
+                                                       (MetricName.QUERY_CONCURRENCY, concurrency, None)])
+
+    def _observe_query_stats(self):
+        """
+        Adapts the concurrency limit to how long completed queries waited in Redshift's WLM queue,
+        once their statistics have been logged, and puts their queue times to CloudWatch Metrics.
+        Queries whose statistics aren't logged within WLM_QUERY_STATS_TIMEOUT_SECONDS, such as
+        those served from Redshift's result cache, are dropped and leave the limit as is.
+        """
+        with self._pending_query_stats_lock:
+            pending = dict(self._pending_query_stats)
+        if not pending:
+            return
+
+        query_ids = ", ".join(str(query_id) for query_id in pending)
+        rows = self.redshift_handler.fetch_all([WLM_QUERY_STATS_QUERY_TEMPLATE.format(query_ids=query_ids)],
+                                               read_only=True)[0]
+
+        metrics = []
+        observed = set()
+        for query_id, total_queue_time, total_exec_time in rows:
+            if query_id in observed or query_id not in pending:
+                continue
+            observed.add(query_id)
+            query_type, concurrency, _ = pending[query_id]
+            queue_seconds = total_queue_time / 1e6
+            limit = self.concurrency_limit.observe(queue_seconds, total_exec_time / 1e6, concurrency)
+            logger.info(f"Query {query_id} waited {queue_seconds:.1f}s in queue at concurrency {concurrency}, "
+                        f"concurrency limit is {limit}")
+            metrics.append((MetricName.QUERY_QUEUE_TIME, queue_seconds, [{'Name': "Query Type", 'Value': query_type}]))
+
+        expired = {query_id for query_id, (_, _, finish_time) in pending.items()
+                   if time.time() - finish_time > WLM_QUERY_STATS_TIMEOUT_SECONDS}
+        with self._pending_query_stats_lock:
+            for query_id in observed | expired:
+                self._pending_query_stats.pop(query_id, None)
+
+        if metrics:
+            metrics.append((MetricName.QUERY_CONCURRENCY_LIMIT, self.concurrency_limit.limit, None))
+            self.cloudwatch_handler.put_metric_data_batch(metrics)
+
+    @staticmethod
+    def _release_unprocessed_message(heartbeat: VisibilityHeartbeat,
+                                     receipt_handle: str,
+                                     future: concurrent.futures.Future):
+        """
+        Stops extending the visibility of a message whose processing failed before it could be
+        handled, so that it becomes visible again and is retried.
+        """
+        if future.exception():
+            logger.error(f"QueryRunner failed to process a message with error {future.exception()}")
+            heartbeat.remove([receipt_handle])
+
+    def _add_deferred_queries_to_sqs(self, request_id: str, deferred_queries: dict):
+        """
+        Queue the queries of a request that were deferred until its cell query found no cached result.
+        :param request_id: Request ID of the queries
+        :param deferred_queries: dict of QueryType values to the S3 keys of the queries
+        """
+        for query_type, s3_obj_key in deferred_queries.items():
+            payload = {
+                'request_id': request_id,
+                's3_obj_key': s3_obj_key,
+                'type': query_type
+            }
+            logger.info(f"Adding deferred {payload} to {self.query_job_q_url}")
+            self.sqs_handler.add_message_to_queue(self.query_job_q_url, payload)
 
 
 def main():
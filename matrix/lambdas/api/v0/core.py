@@ -125,10 +125,13 @@ def get_matrix(request_id: str):
         matrix_results_bucket = os.environ['MATRIX_RESULTS_BUCKET']
 
         matrix_location = ""
-        if format == MatrixFormat.LOOM.value:
+        if format in (MatrixFormat.LOOM.value, MatrixFormat.H5AD.value):
             matrix_location = f"https://s3.amazonaws.com/{matrix_results_bucket}/" \
                               f"{request_tracker.s3_results_prefix}/{request_id}.{format}"
-        elif format == MatrixFormat.CSV.value or format == MatrixFormat.MTX.value:
+        elif format in (MatrixFormat.CSV.value,
+                        MatrixFormat.MTX.value,
+                        MatrixFormat.ZARR.value,
+                        MatrixFormat.PARQUET.value):
             matrix_location = f"https://s3.amazonaws.com/{matrix_results_bucket}/" \
                               f"{request_tracker.s3_results_prefix}/{request_id}.{format}.zip"
 
@@ -6,12 +6,14 @@ import uuid
 from connexion.lifecycle import ConnexionResponse
 
 from matrix.common import constants
+from matrix.common import field_details
 from matrix.common import query_constructor
 from matrix.common.exceptions import MatrixException
 from matrix.common.constants import MatrixFormat, MatrixRequestStatus
 from matrix.common.config import MatrixInfraConfig
 from matrix.common.aws.lambda_handler import LambdaHandler, LambdaName
-from matrix.common.aws.redshift_handler import RedshiftHandler, TableName
+from matrix.common.request.request_coalescer import RequestCoalescer, generate_request_key
+from matrix.common.request.request_estimator import RequestEstimator
 from matrix.common.request.request_tracker import RequestTracker
 from matrix.common.aws.sqs_handler import SQSHandler
 
@@ -20,14 +22,12 @@ sqs_handler = SQSHandler()
 matrix_infra_config = MatrixInfraConfig()
 
 
-def post_matrix(body: dict):
-
-    feature = body.get("feature", constants.DEFAULT_FEATURE)
-    fields = body.get("fields", constants.DEFAULT_FIELDS)
-    format_ = body['format'] if 'format' in body else MatrixFormat.LOOM.value
+def _validate_matrix_request(body: dict, format_: str):
+    """
+    Returns the error response for an invalid matrix request body, or None if it is valid.
+    """
     expected_formats = [mf.value for mf in MatrixFormat]
 
-    # Validate input parameters
     if format_ not in expected_formats:
         return ({'message': "Invalid parameters supplied. "
                             "Please supply a valid `format`. "
@@ -44,8 +44,50 @@ def post_matrix(body: dict):
                             "Visit https://matrix.dev.data.humancellatlas.org for more information."},
                 requests.codes.request_entity_too_large)
 
+    try:
+        query_constructor.filter_to_where(body["filter"])
+    except query_constructor.MalformedMatrixFilter as exc:
+        return ({'message': f"Invalid filter supplied: {str(exc)}. "
+                            "Visit https://matrix.dev.data.humancellatlas.org for more information."},
+                requests.codes.bad_request)
+
+    return None
+
+
+def post_matrix(body: dict):
+
+    feature = body.get("feature", constants.DEFAULT_FEATURE)
+    fields = body.get("fields", constants.DEFAULT_FIELDS)
+    format_ = body['format'] if 'format' in body else MatrixFormat.LOOM.value
+
+    error_response = _validate_matrix_request(body, format_)
+    if error_response:
+        return error_response
+
     request_id = str(uuid.uuid4())
-    RequestTracker(request_id).initialize_request(format_, fields, feature)
+    request_tracker = RequestTracker(request_id)
+    request_tracker.initialize_request(format_, fields, feature)
+
+    request_key = generate_request_key(body["filter"], fields, feature, format_, request_tracker.data_version)
+    request_tracker.write_request_key_to_db(request_key)
+
+    # Requests matching a completed request are served its matrix without running any queries
+    cached_request_id = request_tracker.lookup_result_cache()
+    if cached_request_id:
+        request_tracker.write_coalesced_request_id_to_db(cached_request_id)
+        response, _ = get_matrix(request_id)
+        return response, requests.codes.ok
+
+    # Identical requests in flight share a single driver, query and conversion run
+    in_flight_request_id = RequestCoalescer().attach(request_id, request_key)
+    if in_flight_request_id != request_id:
+        request_tracker.write_coalesced_request_id_to_db(in_flight_request_id)
+        return ({'request_id': request_id,
+                 'status': MatrixRequestStatus.IN_PROGRESS.value,
+                 'matrix_url': "",
+                 'eta': "",
+                 'message': "Job started."},
+                requests.codes.accepted)
 
     driver_payload = {
         'request_id': request_id,
@@ -63,6 +105,18 @@ def post_matrix(body: dict):
             requests.codes.accepted)
 
 
+def post_matrix_estimate(body: dict):
+
+    fields = body.get("fields", constants.DEFAULT_FIELDS)
+    format_ = body['format'] if 'format' in body else MatrixFormat.LOOM.value
+
+    error_response = _validate_matrix_request(body, format_)
+    if error_response:
+        return error_response
+
+    return RequestEstimator().estimate(body["filter"], fields), requests.codes.ok
+
+
 def get_matrix(request_id: str):
 
     # There are a few cases to handle here. First, if the request_id is not in
@@ -89,6 +143,13 @@ def get_matrix(request_id: str):
     except MatrixException:
         return in_progress_response
 
+    # Requests attached to an identical in flight request report that request's status
+    coalesced_request_id = request_tracker.coalesced_request_id
+    if coalesced_request_id:
+        response, status_code = get_matrix(coalesced_request_id)
+        response['request_id'] = request_id
+        return response, status_code
+
     # Failed case
     if request_tracker.error:
         return ({'request_id': request_id,
@@ -113,10 +174,13 @@ def get_matrix(request_id: str):
         matrix_results_bucket = os.environ['MATRIX_RESULTS_BUCKET']
 
         matrix_location = ""
-        if format == MatrixFormat.LOOM.value:
+        if format in (MatrixFormat.LOOM.value, MatrixFormat.H5AD.value):
             matrix_location = f"https://s3.amazonaws.com/{matrix_results_bucket}/" \
                               f"{request_tracker.s3_results_prefix}/{request_id}.{format}"
-        elif format == MatrixFormat.CSV.value or format == MatrixFormat.MTX.value:
+        elif format in (MatrixFormat.CSV.value,
+                        MatrixFormat.MTX.value,
+                        MatrixFormat.ZARR.value,
+                        MatrixFormat.PARQUET.value):
             matrix_location = f"https://s3.amazonaws.com/{matrix_results_bucket}/" \
                               f"{request_tracker.s3_results_prefix}/{request_id}.{format}.zip"
 
@@ -167,51 +231,6 @@ def get_fields():
             requests.codes.ok)
 
 
-def _redshift_detail_lookup(name, description):
-    type_ = constants.METADATA_FIELD_TO_TYPE[name]
-    column_name = constants.METADATA_FIELD_TO_TABLE_COLUMN[name]
-    table_name = constants.TABLE_COLUMN_TO_TABLE[column_name]
-    fq_name = table_name + "." + column_name
-
-    table_primary_key = RedshiftHandler.PRIMARY_KEY[TableName(table_name)]
-
-    rs_handler = RedshiftHandler()
-
-    if type_ == "categorical":
-        query = query_constructor.create_field_detail_query(
-            fq_name, table_name, table_primary_key, type_)
-        results = dict(rs_handler.transaction([query], return_results=True, read_only=True))
-        if None in results:
-            results[""] = results[None]
-            results.pop(None)
-        if True in results:
-            results["True"] = results[True]
-            results.pop(True)
-        if False in results:
-            results["False"] = results[False]
-            results.pop(False)
-        return ({
-            "field_name": name,
-            "field_description": description,
-            "field_type": type_,
-            "cell_counts": results},
-            requests.codes.ok)
-
-    elif type_ == "numeric":
-        query = query_constructor.create_field_detail_query(
-            fq_name, table_name, table_primary_key, type_)
-        results = rs_handler.transaction([query], return_results=True, read_only=True)
-        min_ = results[0][0]
-        max_ = results[0][1]
-        return ({
-            "field_name": name,
-            "field_description": description,
-            "field_type": type_,
-            "minimum": min_,
-            "maximum": max_},
-            requests.codes.ok)
-
-
 def get_filter_detail(filter_name: str):
     """Return details about a filter."""
 
@@ -219,9 +238,8 @@ def get_filter_detail(filter_name: str):
         return ({"message": f"Filter {filter_name} not found."},
                 requests.codes.not_found)
 
-    description = constants.FILTER_DETAIL[filter_name]
-
-    return _redshift_detail_lookup(filter_name, description)
+    return (field_details.get_field_detail(filter_name),
+            requests.codes.ok)
 
 
 def get_field_detail(field_name: str):
@@ -235,9 +253,8 @@ def get_field_detail(field_name: str):
         return ({"message": f"Field {field_name} not found."},
                 requests.codes.not_found)
 
-    description = constants.FIELD_DETAIL[field_name]
-
-    return _redshift_detail_lookup(field_name, description)
+    return (field_details.get_field_detail(field_name),
+            requests.codes.ok)
 
 
 def get_formats():
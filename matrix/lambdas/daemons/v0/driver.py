@@ -54,16 +54,6 @@ cell_query_template = """
     ;
 """
 
-feature_query_template = """
-    UNLOAD ($$SELECT *
-    FROM feature
-    WHERE feature.isgene$$)
-    to 's3://{0}/{1}/gene_metadata_'
-    IAM_ROLE '{2}'
-    GZIP
-    MANIFEST VERBOSE;
-"""
-
 
 class Driver:
     """
@@ -129,8 +119,10 @@ class Driver:
             self.request_tracker.log_error(error_msg)
             return
 
-        for key in s3_obj_keys:
-            self._add_request_query_to_sqs(key, s3_obj_keys[key])
+        # The expression query only runs once the cell query found no cached result. Feature metadata
+        # is read from the data version's feature table instead of being queried per request.
+        deferred_queries = {QueryType.EXPRESSION.value: s3_obj_keys[QueryType.EXPRESSION]}
+        self._add_request_query_to_sqs(QueryType.CELL, s3_obj_keys[QueryType.CELL], deferred_queries)
         self.request_tracker.complete_subtask_execution(Subtask.DRIVER)
 
     @retry(reraise=True, wait=wait_fixed(5), stop=stop_after_attempt(60))
@@ -148,11 +140,6 @@ class Driver:
         return list(map(_parse_line, lines))
 
     def _format_and_store_queries_in_s3(self, resolved_bundle_fqids: list):
-        feature_query = feature_query_template.format(self.query_results_bucket,
-                                                      self.request_id,
-                                                      self.redshift_role_arn)
-        feature_query_obj_key = self.s3_handler.store_content_in_s3(f"{self.request_id}/feature", feature_query)
-
         exp_query = expression_query_template.format(self.query_results_bucket,
                                                      self.request_id,
                                                      self.redshift_role_arn,
@@ -167,17 +154,18 @@ class Driver:
 
         return {
             QueryType.CELL: cell_query_obj_key,
-            QueryType.EXPRESSION: exp_query_obj_key,
-            QueryType.FEATURE: feature_query_obj_key
+            QueryType.EXPRESSION: exp_query_obj_key
         }
 
-    def _add_request_query_to_sqs(self, query_type: QueryType, s3_obj_key: str):
+    def _add_request_query_to_sqs(self, query_type: QueryType, s3_obj_key: str, deferred_queries: dict = None):
         queue_url = self.query_job_q_url
         payload = {
             'request_id': self.request_id,
             's3_obj_key': s3_obj_key,
             'type': query_type.value
         }
+        if deferred_queries:
+            payload['deferred_queries'] = deferred_queries
         logger.debug(f"Adding {payload} to sqs {queue_url}")
         self.sqs_handler.add_message_to_queue(queue_url, payload)
 
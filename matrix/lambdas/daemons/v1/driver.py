@@ -1,3 +1,4 @@
+import json
 import typing
 import os
 
@@ -5,7 +6,7 @@ from matrix.common import query_constructor
 from matrix.common.config import MatrixInfraConfig, MatrixRedshiftConfig
 from matrix.common.logging import Logging
 from matrix.common.request.request_tracker import RequestTracker, Subtask
-from matrix.common.aws.dynamo_handler import DynamoHandler
+from matrix.common.aws.dynamo_handler import DataVersionTableField, DynamoHandler, DynamoTable, RequestTableField
 from matrix.common.aws.sqs_handler import SQSHandler
 from matrix.common.aws.s3_handler import S3Handler
 from matrix.docker.query_runner import QueryType
@@ -56,18 +57,61 @@ class Driver:
             self.request_tracker.log_error(f"Query construction failed with error: {str(exc)}")
             raise
 
+        project_ids = self._filter_to_existing_project_ids(filter_)
+        if project_ids:
+            self._run_project_union(project_ids, fields, feature)
+            return
+
         s3_obj_keys = self._format_and_store_queries_in_s3(matrix_request_queries)
-        for key in s3_obj_keys:
-            self._add_request_query_to_sqs(key, s3_obj_keys[key])
+        # The expression query only runs once the cell query found no cached result. Feature metadata
+        # is read from the data version's feature table instead of being queried per request.
+        deferred_queries = {QueryType.EXPRESSION.value: s3_obj_keys[QueryType.EXPRESSION]}
+        self._add_request_query_to_sqs(QueryType.CELL, s3_obj_keys[QueryType.CELL], deferred_queries)
         self.request_tracker.complete_subtask_execution(Subtask.DRIVER)
 
-    def _format_and_store_queries_in_s3(self, queries: dict):
-        feature_query = queries[QueryType.FEATURE].format(results_bucket=self.query_results_bucket,
-                                                          request_id=self.request_id,
-                                                          iam_role=self.redshift_role_arn)
-        feature_query_obj_key = self.s3_handler.store_content_in_s3(f"{self.request_id}/{QueryType.FEATURE.value}",
-                                                                    feature_query)
+    def _filter_to_existing_project_ids(self, filter_: typing.Dict[str, typing.Any]) -> typing.List[str]:
+        """
+        Returns the projects with cells in the request's data version, if the filter selects
+        a union of whole projects, else an empty list.
+        """
+        project_ids = query_constructor.filter_to_project_ids(filter_)
+        if not project_ids:
+            return []
+
+        project_cell_counts = self.dynamo_handler.get_table_item(
+            DynamoTable.DATA_VERSION_TABLE,
+            key=self.request_tracker.data_version
+        )[DataVersionTableField.PROJECT_CELL_COUNTS.value]
+        return [project_id for project_id in project_ids if project_cell_counts.get(project_id)]
+
+    def _run_project_union(self, project_ids: typing.List[str], fields: typing.List[str], feature: str):
+        """
+        Serve a request for a union of whole projects from per-project shards instead of
+        querying its cells and expression values.
 
+        :param project_ids: Projects with cells selected by the request filter
+        :param fields: Which metadata fields to return
+        :param feature: Which feature (gene vs transcript) to include in output
+        """
+        logger.debug(f"Serving request from the shards of projects {project_ids}")
+        shards = query_constructor.create_project_shards(project_ids,
+                                                         fields,
+                                                         feature,
+                                                         self.request_tracker.data_version,
+                                                         self.query_results_bucket,
+                                                         self.redshift_role_arn)
+        s3_obj_key = self.s3_handler.store_content_in_s3(f"{self.request_id}/{QueryType.PROJECT_UNION.value}",
+                                                         json.dumps(shards))
+
+        # The shards are built and assembled by a single query runner execution
+        self.dynamo_handler.set_table_field_with_value(DynamoTable.REQUEST_TABLE,
+                                                       self.request_id,
+                                                       RequestTableField.EXPECTED_QUERY_EXECUTIONS,
+                                                       1)
+        self._add_request_query_to_sqs(QueryType.PROJECT_UNION, s3_obj_key)
+        self.request_tracker.complete_subtask_execution(Subtask.DRIVER)
+
+    def _format_and_store_queries_in_s3(self, queries: dict):
         exp_query = queries[QueryType.EXPRESSION].format(results_bucket=self.query_results_bucket,
                                                          request_id=self.request_id,
                                                          iam_role=self.redshift_role_arn)
@@ -82,16 +126,17 @@ class Driver:
 
         return {
             QueryType.CELL: cell_query_obj_key,
-            QueryType.EXPRESSION: exp_query_obj_key,
-            QueryType.FEATURE: feature_query_obj_key
+            QueryType.EXPRESSION: exp_query_obj_key
         }
 
-    def _add_request_query_to_sqs(self, query_type: QueryType, s3_obj_key: str):
+    def _add_request_query_to_sqs(self, query_type: QueryType, s3_obj_key: str, deferred_queries: dict = None):
         queue_url = self.query_job_q_url
         payload = {
             'request_id': self.request_id,
             's3_obj_key': s3_obj_key,
             'type': query_type.value
         }
+        if deferred_queries:
+            payload['deferred_queries'] = deferred_queries
         logger.debug(f"Adding {payload} to sqs {queue_url}")
         self.sqs_handler.add_message_to_queue(queue_url, payload)
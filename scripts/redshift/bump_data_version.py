@@ -4,14 +4,23 @@ import sys
 pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))  # noqa
 sys.path.insert(0, pkg_root)  # noqa
 
+from matrix.common import query_constructor
+from matrix.common.config import MatrixRedshiftConfig
+from matrix.common.constants import DEFAULT_FEATURE, DEFAULT_FIELDS, MatrixFeature
 from matrix.common.exceptions import MatrixException
-from matrix.common.aws.dynamo_handler import DynamoHandler, DynamoTable, DeploymentTableField
+from matrix.common.field_details import FieldDetailStore
+from matrix.common.aws.dynamo_handler import DataVersionTableField, DeploymentTableField, DynamoHandler, DynamoTable
+from matrix.common.aws.redshift_handler import RedshiftHandler
+from matrix.common.query.feature_table import FeatureTable
+from matrix.common.query.project_shards import ProjectShards
 
 
 def bump_data_version():
     """
     Increment a deployment's current data version in the Deployment table in DynamoDb.
     If the new version does not exist in the Data Version table, generate a new one based on the current deployment.
+    The field details, feature tables and the project shards of requests for the default fields and feature
+    of the new version are built up front, so requests do not wait on them.
     """
     dynamo_handler = DynamoHandler()
     deployment_stage = os.environ['DEPLOYMENT_STAGE']
@@ -21,11 +30,29 @@ def bump_data_version():
                                       key=deployment_stage)[DeploymentTableField.CURRENT_DATA_VERSION.value]
     new_data_version = current_data_version + 1
 
+    redshift_handler = RedshiftHandler()
+    field_details = FieldDetailStore(new_data_version).build_all(redshift_handler)
+
     try:
         dynamo_handler.get_table_item(table=DynamoTable.DATA_VERSION_TABLE,
                                       key=new_data_version)
     except MatrixException:
-        dynamo_handler.create_data_version_table_entry(new_data_version)
+        project_cell_counts = field_details[query_constructor.PROJECT_ID_FIELD]['cell_counts']
+        dynamo_handler.create_data_version_table_entry(new_data_version, project_cell_counts)
+
+    for feature in MatrixFeature:
+        FeatureTable(new_data_version, feature.value).get_or_build(redshift_handler)
+
+    project_cell_counts = \
+        dynamo_handler.get_table_item(table=DynamoTable.DATA_VERSION_TABLE,
+                                      key=new_data_version)[DataVersionTableField.PROJECT_CELL_COUNTS.value]
+    shards = query_constructor.create_project_shards(sorted(project_cell_counts),
+                                                     DEFAULT_FIELDS,
+                                                     DEFAULT_FEATURE,
+                                                     new_data_version,
+                                                     os.environ['MATRIX_QUERY_RESULTS_BUCKET'],
+                                                     MatrixRedshiftConfig().redshift_role_arn)
+    ProjectShards().build_missing(shards, redshift_handler)
 
     dynamo_handler.set_table_field_with_value(table=DynamoTable.DEPLOYMENT_TABLE,
                                               key=deployment_stage,
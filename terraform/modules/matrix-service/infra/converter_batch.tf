@@ -157,10 +157,12 @@ resource "aws_iam_policy" "converter_job_policy" {
         "Effect": "Allow",
         "Action": [
           "dynamodb:UpdateItem",
-          "dynamodb:GetItem"
+          "dynamodb:GetItem",
+          "dynamodb:PutItem"
         ],
         "Resource": [
-          "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/dcp-matrix-service-request-table-${var.deployment_stage}"
+          "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/dcp-matrix-service-request-table-${var.deployment_stage}",
+          "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/dcp-matrix-service-result-cache-table-${var.deployment_stage}"
         ]
       },
       {
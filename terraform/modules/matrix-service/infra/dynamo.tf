@@ -11,6 +11,40 @@ resource "aws_dynamodb_table" "request_table" {
   # Add tags to this resource
 }
 
+resource "aws_dynamodb_table" "in_flight_request_table" {
+  name           = "dcp-matrix-service-in-flight-request-table-${var.deployment_stage}"
+  read_capacity  = 25
+  write_capacity = 25
+  hash_key       = "RequestKey"
+
+  attribute {
+    name = "RequestKey"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ExpirationTime"
+    enabled        = true
+  }
+}
+
+resource "aws_dynamodb_table" "result_cache_table" {
+  name           = "dcp-matrix-service-result-cache-table-${var.deployment_stage}"
+  read_capacity  = 25
+  write_capacity = 25
+  hash_key       = "RequestKey"
+
+  attribute {
+    name = "RequestKey"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ExpirationTime"
+    enabled        = true
+  }
+}
+
 resource "aws_dynamodb_table" "data_version_table" {
   name           = "dcp-matrix-service-data-version-table-${var.deployment_stage}"
   read_capacity  = 25
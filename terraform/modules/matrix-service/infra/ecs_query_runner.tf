@@ -35,6 +35,14 @@ resource "aws_ecs_task_definition" "query_runner" {
         "name": "DYNAMO_REQUEST_TABLE_NAME",
         "value": "dcp-matrix-service-request-table-${var.deployment_stage}"
       },
+      {
+        "name": "DYNAMO_IN_FLIGHT_REQUEST_TABLE_NAME",
+        "value": "dcp-matrix-service-in-flight-request-table-${var.deployment_stage}"
+      },
+      {
+        "name": "DYNAMO_RESULT_CACHE_TABLE_NAME",
+        "value": "dcp-matrix-service-result-cache-table-${var.deployment_stage}"
+      },
       {
         "name": "BATCH_CONVERTER_JOB_QUEUE_ARN",
         "value": "arn:aws:batch:${var.aws_region}:${var.account_id}:job-queue/dcp-matrix-converter-queue-${var.deployment_stage}"
@@ -157,7 +165,8 @@ resource "aws_iam_role_policy" "query_runner" {
           "Action": [
             "sqs:SendMessage",
             "sqs:ReceiveMessage",
-            "sqs:DeleteMessage"
+            "sqs:DeleteMessage",
+            "sqs:ChangeMessageVisibility"
           ],
           "Resource": [
             "arn:aws:sqs:${var.aws_region}:${var.account_id}:dcp-matrix-query-queue-${var.deployment_stage}",
@@ -197,7 +206,8 @@ resource "aws_iam_role_policy" "query_runner" {
           "Resource": [
             "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/dcp-matrix-service-data-version-table-${var.deployment_stage}",
             "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/dcp-matrix-service-deployment-table-${var.deployment_stage}",
-            "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/dcp-matrix-service-request-table-${var.deployment_stage}"
+            "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/dcp-matrix-service-request-table-${var.deployment_stage}",
+            "arn:aws:dynamodb:${var.aws_region}:${var.account_id}:table/dcp-matrix-service-result-cache-table-${var.deployment_stage}"
           ]
         },
         {
@@ -118,6 +118,8 @@ resource "aws_lambda_function" "matrix_service_driver_v0_lambda" {
         DYNAMO_DATA_VERSION_TABLE_NAME="dcp-matrix-service-data-version-table-${var.deployment_stage}"
         DYNAMO_DEPLOYMENT_TABLE_NAME="dcp-matrix-service-deployment-table-${var.deployment_stage}"
         DYNAMO_REQUEST_TABLE_NAME="dcp-matrix-service-request-table-${var.deployment_stage}"
+        DYNAMO_IN_FLIGHT_REQUEST_TABLE_NAME="dcp-matrix-service-in-flight-request-table-${var.deployment_stage}"
+        DYNAMO_RESULT_CACHE_TABLE_NAME="dcp-matrix-service-result-cache-table-${var.deployment_stage}"
         MATRIX_QUERY_BUCKET = "dcp-matrix-service-queries-${var.deployment_stage}"
         MATRIX_QUERY_RESULTS_BUCKET = "dcp-matrix-service-query-results-${var.deployment_stage}"
         BATCH_CONVERTER_JOB_QUEUE_ARN = "arn:aws:batch:${var.aws_region}:${var.account_id}:job-queue/dcp-matrix-converter-queue-${var.deployment_stage}"
@@ -141,6 +143,8 @@ resource "aws_lambda_function" "matrix_service_driver_v1_lambda" {
         DYNAMO_DATA_VERSION_TABLE_NAME="dcp-matrix-service-data-version-table-${var.deployment_stage}"
         DYNAMO_DEPLOYMENT_TABLE_NAME="dcp-matrix-service-deployment-table-${var.deployment_stage}"
         DYNAMO_REQUEST_TABLE_NAME="dcp-matrix-service-request-table-${var.deployment_stage}"
+        DYNAMO_IN_FLIGHT_REQUEST_TABLE_NAME="dcp-matrix-service-in-flight-request-table-${var.deployment_stage}"
+        DYNAMO_RESULT_CACHE_TABLE_NAME="dcp-matrix-service-result-cache-table-${var.deployment_stage}"
         MATRIX_QUERY_BUCKET = "dcp-matrix-service-queries-${var.deployment_stage}"
         MATRIX_QUERY_RESULTS_BUCKET = "dcp-matrix-service-query-results-${var.deployment_stage}"
         BATCH_CONVERTER_JOB_QUEUE_ARN = "arn:aws:batch:${var.aws_region}:${var.account_id}:job-queue/dcp-matrix-converter-queue-${var.deployment_stage}"
@@ -0,0 +1,208 @@
+"""Measure matrix converter throughput on synthetic Redshift UNLOAD outputs.
+
+Runs the conversion to each output format against locally staged query results, so
+neither Redshift nor S3 is involved, and reports cells converted per second, megabytes
+of compressed query results read per second and the peak memory of the conversion.
+Each conversion runs in a fresh process so that its peak memory is its own. Given
+several worker counts, each conversion is repeated with each to show how it scales
+across processes.
+
+    python tests/benchmark/benchmark_converter.py --cells 5000 --genes 20000
+    python tests/benchmark/benchmark_converter.py --format csv --slices 16 --workers 1 2 4 8 16
+
+Results can be saved and used as the baseline of a later run, which fails if any
+format's throughput dropped by more than the tolerance:
+
+    python tests/benchmark/benchmark_converter.py --output baseline.json
+    python tests/benchmark/benchmark_converter.py --baseline baseline.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))  # noqa
+sys.path.insert(0, pkg_root)  # noqa
+
+# The converter tracks its request in DynamoDB, which the benchmark never touches,
+# but the handlers still need to be constructable.
+os.environ.setdefault('DEPLOYMENT_STAGE', "benchmark")
+os.environ.setdefault('AWS_DEFAULT_REGION', "us-east-1")
+os.environ.setdefault('DYNAMO_DATA_VERSION_TABLE_NAME', "benchmark_data_version_table")
+os.environ.setdefault('DYNAMO_DEPLOYMENT_TABLE_NAME', "benchmark_deployment_table")
+os.environ.setdefault('DYNAMO_REQUEST_TABLE_NAME', "benchmark_request_table")
+os.environ.setdefault('DYNAMO_IN_FLIGHT_REQUEST_TABLE_NAME', "benchmark_in_flight_request_table")
+os.environ.setdefault('DYNAMO_RESULT_CACHE_TABLE_NAME', "benchmark_result_cache_table")
+
+from matrix.common.query.cell_query_results_reader import CellQueryResultsReader  # noqa
+from matrix.common.query.expression_query_results_reader import ExpressionParser, ExpressionQueryResultsReader  # noqa
+from matrix.common.query.feature_query_results_reader import FeatureQueryResultsReader  # noqa
+from matrix.docker.conversion_report import peak_rss_bytes  # noqa
+from matrix.docker.matrix_converter import MatrixConverter, SUPPORTED_FORMATS  # noqa
+from matrix.docker.query_runner import QueryType  # noqa
+from tests.benchmark.synthetic_unload import write_synthetic_unload  # noqa
+
+
+def benchmark_conversion(fmt: str, manifests: dict, working_dir: str, workers: int = 1,
+                         expression_parser: str = ExpressionParser.PANDAS.value):
+    """Convert the query results described by manifests to fmt.
+
+    :param fmt: MatrixFormat value to convert to
+    :param manifests: dict of "cell", "expression" and "feature" manifest urls
+    :param working_dir: Directory the converter writes its output to
+    :param workers: Number of converter worker processes
+    :param expression_parser: ExpressionParser value to read the expression results with
+    :return: dict of timing results
+    """
+    args = argparse.Namespace(request_id="benchmark",
+                              expression_manifest_key=manifests['expression'],
+                              cell_metadata_manifest_key=manifests['cell'],
+                              gene_metadata_manifest_key=manifests['feature'],
+                              target_path=f"benchmark.{fmt}",
+                              format=fmt,
+                              working_dir=working_dir,
+                              workers=workers)
+    converter = MatrixConverter(args)
+    converter.query_results = {
+        QueryType.CELL: CellQueryResultsReader(manifests['cell']),
+        QueryType.EXPRESSION: ExpressionQueryResultsReader(manifests['expression'],
+                                                           parser=ExpressionParser(expression_parser)),
+        QueryType.FEATURE: FeatureQueryResultsReader(manifests['feature'])
+    }
+    n_cells = converter.query_results[QueryType.CELL].manifest["record_count"]
+    n_nonzero = converter.query_results[QueryType.EXPRESSION].manifest["record_count"]
+    input_bytes = sum(sum(results.manifest["part_content_lengths"]) for results in converter.query_results.values())
+
+    start = time.time()
+    with converter.report.stage("convert"):
+        output_path = getattr(converter, f"_to_{fmt}")()
+    seconds = time.time() - start
+    output_bytes = os.path.getsize(output_path)
+    os.remove(output_path)
+
+    return {
+        'format': fmt,
+        'workers': workers,
+        'seconds': seconds,
+        'cells_per_second': n_cells / seconds,
+        'nonzeros_per_second': n_nonzero / seconds,
+        'input_megabytes_per_second': input_bytes / 1e6 / seconds,
+        'input_bytes': input_bytes,
+        'output_bytes': output_bytes,
+        'peak_rss_bytes': max(peak_rss_bytes(), peak_rss_bytes(resource.RUSAGE_CHILDREN)),
+        'stage_seconds': {name: stats.seconds for name, stats in converter.report.stages.items()},
+    }
+
+
+def _benchmark_in_process(results, *args):
+    results.put(benchmark_conversion(*args))
+
+
+def benchmark_conversion_in_new_process(*args):
+    """Run benchmark_conversion in a new process, so that the peak memory it reports
+    is the conversion's alone.
+
+    :param args: Arguments of benchmark_conversion
+    :return: dict of timing results
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_benchmark_in_process, args=(results,) + args)
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def find_regressions(results: list, baseline: list, tolerance: float):
+    """Compare throughput against a baseline run.
+
+    :param results: Results of this run
+    :param baseline: Results of the baseline run
+    :param tolerance: Fraction by which cells/s may drop before it counts as a regression
+    :return: list of str descriptions of the regressions
+    """
+    baseline_results = {(result['format'], result['workers']): result for result in baseline}
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get((result['format'], result['workers']))
+        if not baseline_result:
+            continue
+        if result['cells_per_second'] < (1 - tolerance) * baseline_result['cells_per_second']:
+            regressions.append(f"{result['format']} with {result['workers']} worker(s): "
+                               f"{result['cells_per_second']:.0f} cells/s, "
+                               f"down from {baseline_result['cells_per_second']:.0f}")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", nargs="+", default=SUPPORTED_FORMATS, choices=SUPPORTED_FORMATS,
+                        help="Output formats to benchmark. Defaults to all of them.")
+    parser.add_argument("--cells", type=int, default=2000, help="Number of cells.")
+    parser.add_argument("--genes", type=int, default=20000, help="Number of genes.")
+    parser.add_argument("--density", type=float, default=0.05,
+                        help="Expected fraction of nonzero genes per cell.")
+    parser.add_argument("--slices", type=int, default=4, help="Number of Redshift slices.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="Numbers of converter worker processes to benchmark with.")
+    parser.add_argument("--expression-parser", default=ExpressionParser.PANDAS.value,
+                        choices=[item.value for item in ExpressionParser],
+                        help="Parser to read the expression query results with.")
+    parser.add_argument("--output", help="Path to save the results to as JSON.")
+    parser.add_argument("--baseline", help="Path to the saved results of a run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Fraction by which cells/s may drop from the baseline before failing.")
+    args = parser.parse_args(argv)
+
+    scratch_dir = tempfile.mkdtemp(prefix="matrix-benchmark-")
+    results = []
+    try:
+        manifests = write_synthetic_unload(os.path.join(scratch_dir, "unload"),
+                                           n_cells=args.cells,
+                                           n_genes=args.genes,
+                                           density=args.density,
+                                           n_slices=args.slices,
+                                           seed=args.seed)
+        working_dir = os.path.join(scratch_dir, "output")
+        os.makedirs(working_dir)
+
+        for fmt in args.format:
+            baseline_seconds = None
+            for workers in args.workers:
+                result = benchmark_conversion_in_new_process(fmt, manifests, working_dir, workers,
+                                                             args.expression_parser)
+                results.append(result)
+                baseline_seconds = baseline_seconds or result['seconds']
+                stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result['stage_seconds'].items())
+                print(f"{result['format']} with {workers} worker(s): {result['seconds']:.2f}s, "
+                      f"{result['cells_per_second']:.0f} cells/s, "
+                      f"{result['nonzeros_per_second']:.0f} nonzeros/s, "
+                      f"{result['input_megabytes_per_second']:.1f} MB/s, "
+                      f"{result['peak_rss_bytes'] / 1e6:.0f} MB peak, "
+                      f"{result['output_bytes']} bytes, "
+                      f"{baseline_seconds / result['seconds']:.1f}x ({stages})")
+    finally:
+        shutil.rmtree(scratch_dir)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,101 @@
+"""Measure the per-transaction overhead of RedshiftHandler against a local Postgres stand-in.
+
+Runs the same trivial transaction repeatedly, first opening and closing a connection for
+each transaction and then on RedshiftHandler's pooled connections, and reports the mean
+and 95th percentile time per transaction of each. Redshift adds TLS and a slower
+authentication to every connection, so the difference there is larger than locally.
+
+    docker run -d -p 5432:5432 -e POSTGRES_HOST_AUTH_METHOD=trust postgres
+    python tests/benchmark/benchmark_redshift_handler.py --database-uri postgresql://postgres@localhost:5432/postgres
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import psycopg2
+
+pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))  # noqa
+sys.path.insert(0, pkg_root)  # noqa
+
+from matrix.common.aws.redshift_handler import RedshiftHandler, close_connection_pools  # noqa
+
+
+class LocalRedshiftHandler(RedshiftHandler):
+    """
+    RedshiftHandler connecting to a local database for both the read-write and read-only users.
+    """
+
+    def __init__(self, database_uri: str):
+        self._database_uri = database_uri
+
+    @property
+    def database_uri(self):
+        return self._database_uri
+
+    @property
+    def readonly_database_uri(self):
+        return self._database_uri
+
+
+def unpooled_transaction(database_uri: str, queries: list):
+    """Run a transaction the way RedshiftHandler did before pooling, on a new connection."""
+    conn = psycopg2.connect(database_uri)
+    cursor = conn.cursor()
+    for query in queries:
+        cursor.execute(query)
+    results = cursor.fetchall()
+    conn.commit()
+    conn.close()
+    return results
+
+
+def time_transactions(run, transactions: int) -> dict:
+    """Time each of a number of calls to run.
+
+    :param run: Function running one transaction
+    :param transactions: Number of transactions to run
+    :return: dict of the mean and 95th percentile milliseconds per transaction
+    """
+    durations = []
+    for _ in range(transactions):
+        start = time.perf_counter()
+        run()
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return {
+        'mean_ms': statistics.mean(durations),
+        'p95_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-uri", default="postgresql://postgres@localhost:5432/postgres",
+                        help="URI of the local Postgres database to connect to.")
+    parser.add_argument("--transactions", type=int, default=200, help="Number of transactions to time.")
+    parser.add_argument("--query", default="SELECT 1;", help="Query each transaction runs.")
+    args = parser.parse_args(argv)
+
+    queries = [args.query]
+    handler = LocalRedshiftHandler(args.database_uri)
+    try:
+        results = {
+            'unpooled': time_transactions(lambda: unpooled_transaction(args.database_uri, queries),
+                                          args.transactions),
+            'pooled': time_transactions(lambda: handler.transaction(queries, return_results=True),
+                                        args.transactions),
+        }
+    finally:
+        close_connection_pools()
+
+    for name, result in results.items():
+        print(f"{name}: {result['mean_ms']:.2f} ms/transaction mean, {result['p95_ms']:.2f} ms p95")
+    print(f"Pooling saves {results['unpooled']['mean_ms'] - results['pooled']['mean_ms']:.2f} ms/transaction "
+          f"({results['unpooled']['mean_ms'] / results['pooled']['mean_ms']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
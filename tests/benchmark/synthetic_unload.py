@@ -0,0 +1,110 @@
+"""Write synthetic Redshift UNLOAD outputs to local disk.
+
+The outputs mimic what the matrix service queries produce in S3: a MANIFEST VERBOSE
+manifest per query plus one gzipped, pipe-delimited part file per Redshift slice.
+Manifest and part urls use the file:// scheme, which QueryResultsReader reads from
+local disk.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+import numpy
+
+CELL_COLUMNS = ["cellkey", "genes_detected", "total_umis", "emptydrops_is_cell", "barcode",
+                "specimenkey", "organ_label", "librarykey", "projectkey", "short_name"]
+FEATURE_COLUMNS = ["featurekey", "featurename", "featuretype", "chromosome",
+                   "featurestart", "featureend", "isgene"]
+EXPRESSION_COLUMNS = ["cellkey", "featurekey", "exrpvalue"]
+
+
+def write_synthetic_unload(output_dir: str,
+                           n_cells: int = 2000,
+                           n_genes: int = 20000,
+                           density: float = 0.05,
+                           n_slices: int = 4,
+                           seed: int = 0):
+    """Write cell, expression and feature UNLOAD outputs for a synthetic request.
+
+    :param output_dir: Directory to write manifests and part files to
+    :param n_cells: Number of cells in the request
+    :param n_genes: Number of genes in the feature table
+    :param density: Expected fraction of genes with a nonzero value in each cell
+    :param n_slices: Number of Redshift slices to spread the cells over
+    :param seed: Seed for the random number generator
+    :return: dict with the "cell", "expression" and "feature" manifest urls
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = numpy.random.RandomState(seed)
+
+    featurekeys = [f"ENSG{i:011d}" for i in range(n_genes)]
+    cellkeys = [hashlib.md5(str(i).encode()).hexdigest() for i in range(n_cells)]
+
+    feature_slices = [[] for _ in range(n_slices)]
+    for i, featurekey in enumerate(featurekeys):
+        feature_slices[i % n_slices].append(
+            f"{featurekey}|GENE{i}|protein_coding|chr{i % 22 + 1}|{i * 100}|{i * 100 + 50}|t\n")
+
+    cell_slices = [[] for _ in range(n_slices)]
+    expression_slices = [[] for _ in range(n_slices)]
+
+    # Redshift distributes both tables on cellkey, so all of a cell's rows land in
+    # the same slice, and the expression table is sorted by cellkey within a slice.
+    for i, cellkey in enumerate(sorted(cellkeys)):
+        slice_idx = i % n_slices
+        genes = numpy.unique(rng.randint(0, n_genes, size=rng.binomial(n_genes, density)))
+        values = rng.geometric(0.3, size=len(genes)).astype("float32")
+
+        cell_slices[slice_idx].append(
+            f"{cellkey}|{len(genes)}|{values.sum()}|t|{cellkey[:16].upper()}|specimen_{i % 7}|"
+            f"organ_{i % 5}|library_{i % 3}|project_{i % 11}|Project {i % 11}\n")
+        expression_slices[slice_idx].append(
+            "".join(map("{}|{}|{!r}\n".format,
+                        [cellkey] * len(genes),
+                        [featurekeys[g] for g in genes],
+                        values.astype("float64").tolist())))
+
+    return {
+        'cell': _write_query_output(output_dir, "cell_metadata_", CELL_COLUMNS, cell_slices),
+        'expression': _write_query_output(output_dir, "expression_", EXPRESSION_COLUMNS, expression_slices),
+        'feature': _write_query_output(output_dir, "gene_metadata_", FEATURE_COLUMNS, feature_slices),
+    }
+
+
+def _write_query_output(output_dir: str, prefix: str, columns: list, slices: list):
+    """Write the part files and manifest of one UNLOAD query.
+
+    :param output_dir: Directory to write to
+    :param prefix: UNLOAD prefix, e.g. "expression_"
+    :param columns: Column names of the query
+    :param slices: List of lists of pipe-delimited lines, one list per slice
+    :return: file:// url of the manifest
+    """
+    entries = []
+    total_records = 0
+    total_length = 0
+    for slice_idx, lines in enumerate(slices):
+        part_path = os.path.join(os.path.abspath(output_dir), f"{prefix}{slice_idx:04d}_part_00.gz")
+        with gzip.open(part_path, "wt") as part_file:
+            part_file.writelines(lines)
+
+        record_count = sum(line.count("\n") for line in lines)
+        content_length = os.path.getsize(part_path)
+        entries.append({'url': f"file://{part_path}",
+                        'meta': {'content_length': content_length, 'record_count': record_count}})
+        total_records += record_count
+        total_length += content_length
+
+    manifest = {
+        'entries': entries,
+        'schema': {'elements': [{'name': column} for column in columns]},
+        'meta': {'content_length': total_length, 'record_count': total_records},
+        'author': {'name': "Amazon Redshift", 'version': "1.0.0"},
+    }
+    manifest_path = os.path.join(os.path.abspath(output_dir), f"{prefix}manifest")
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    return f"file://{manifest_path}"
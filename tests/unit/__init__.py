@@ -14,6 +14,8 @@ os.environ['LAMBDA_NOTIFICATION_FUNCTION_NAME'] = "test_notification_name"
 os.environ['DYNAMO_DATA_VERSION_TABLE_NAME'] = "test_data_version_table_name"
 os.environ['DYNAMO_DEPLOYMENT_TABLE_NAME'] = "test_deployment_table_name"
 os.environ['DYNAMO_REQUEST_TABLE_NAME'] = "test_request_table_name"
+os.environ['DYNAMO_IN_FLIGHT_REQUEST_TABLE_NAME'] = "test_in_flight_request_table_name"
+os.environ['DYNAMO_RESULT_CACHE_TABLE_NAME'] = "test_result_cache_table_name"
 os.environ['MATRIX_RESULTS_BUCKET'] = "test_results_bucket"
 os.environ['MATRIX_QUERY_BUCKET'] = "test_query_bucket"
 os.environ['MATRIX_QUERY_RESULTS_BUCKET'] = "test_query_results_bucket"
@@ -127,6 +129,50 @@ class MatrixTestCaseUsingMockAWS(unittest.TestCase):
             },
         )
 
+    @staticmethod
+    def create_test_in_flight_request_table():
+        boto3.resource("dynamodb", region_name=os.environ['AWS_DEFAULT_REGION']).create_table(
+            TableName=os.environ['DYNAMO_IN_FLIGHT_REQUEST_TABLE_NAME'],
+            KeySchema=[
+                {
+                    'AttributeName': "RequestKey",
+                    'KeyType': "HASH",
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': "RequestKey",
+                    'AttributeType': "S",
+                }
+            ],
+            ProvisionedThroughput={
+                'ReadCapacityUnits': 25,
+                'WriteCapacityUnits': 25,
+            },
+        )
+
+    @staticmethod
+    def create_test_result_cache_table():
+        boto3.resource("dynamodb", region_name=os.environ['AWS_DEFAULT_REGION']).create_table(
+            TableName=os.environ['DYNAMO_RESULT_CACHE_TABLE_NAME'],
+            KeySchema=[
+                {
+                    'AttributeName': "RequestKey",
+                    'KeyType': "HASH",
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': "RequestKey",
+                    'AttributeType': "S",
+                }
+            ],
+            ProvisionedThroughput={
+                'ReadCapacityUnits': 25,
+                'WriteCapacityUnits': 25,
+            },
+        )
+
     @staticmethod
     def init_test_data_version_table():
         dynamo = boto3.resource("dynamodb", region_name=os.environ['AWS_DEFAULT_REGION'])
@@ -160,3 +206,8 @@ class MatrixTestCaseUsingMockAWS(unittest.TestCase):
     def create_s3_queries_bucket():
         boto3.resource("s3", region_name=os.environ['AWS_DEFAULT_REGION']) \
              .create_bucket(Bucket=os.environ['MATRIX_QUERY_BUCKET'])
+
+    @staticmethod
+    def create_s3_query_results_bucket():
+        boto3.resource("s3", region_name=os.environ['AWS_DEFAULT_REGION']) \
+             .create_bucket(Bucket=os.environ['MATRIX_QUERY_RESULTS_BUCKET'])
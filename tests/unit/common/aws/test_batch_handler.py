@@ -23,12 +23,14 @@ class TestBatchHandler(unittest.TestCase):
         format = "test_format"
         job_name = f"conversion-{os.environ['DEPLOYMENT_STAGE']}-{self.request_id}-{format}"
 
-        self.batch_handler.schedule_matrix_conversion(self.request_id, format, "test_s3_key")
+        self.batch_handler.schedule_matrix_conversion(self.request_id, format, "test_s3_key", "test_feature_table_url")
         mock_enqueue_batch_job.assert_called_once_with(job_name=job_name,
                                                        job_queue_arn=os.environ['BATCH_CONVERTER_JOB_QUEUE_ARN'],
                                                        job_def_arn=os.environ['BATCH_CONVERTER_JOB_DEFINITION_ARN'],
                                                        command=mock.ANY,
                                                        environment=mock.ANY)
+        command = mock_enqueue_batch_job.call_args[1]['command']
+        self.assertEqual(command[5], "test_feature_table_url")
         mock_cw_put.assert_called_once_with(metric_name=MetricName.CONVERSION_REQUEST, metric_value=1)
 
     def test_enqueue_batch_job(self):
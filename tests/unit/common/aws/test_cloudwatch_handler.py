@@ -30,3 +30,19 @@ class TestCloudwatchHandler(unittest.TestCase):
         self.mock_cloudwatch_client.add_response('put_metric_data', {}, expected_params)
         self.mock_cloudwatch_client.activate()
         self.handler.put_metric_data(MetricName.REQUEST, 1, [{'Name': "a", 'Value': "b"}])
+
+    def test_put_metric_data_batch(self):
+        dimensions = [{'Name': "a", 'Value': "b"}]
+        metrics = [(MetricName.CONVERSION_STAGE_DURATION, i, dimensions) for i in range(25)]
+        namespace = f"dcp-matrix-service-{self.deploment_stage}"
+        for start in [0, 20]:
+            expected_params = {'MetricData': [{'MetricName': MetricName.CONVERSION_STAGE_DURATION.value,
+                                               'Value': i,
+                                               'Dimensions': dimensions} for i in range(start, min(start + 20, 25))],
+                               'Namespace': namespace}
+            self.mock_cloudwatch_client.add_response('put_metric_data', {}, expected_params)
+        self.mock_cloudwatch_client.activate()
+
+        self.handler.put_metric_data_batch(metrics)
+
+        self.mock_cloudwatch_client.assert_no_pending_responses()
@@ -5,7 +5,8 @@ import mock
 import boto3
 
 from matrix.common.constants import DEFAULT_FIELDS, SUPPORTED_METADATA_SCHEMA_VERSIONS
-from matrix.common.aws.dynamo_handler import DynamoHandler, DynamoTable, RequestTableField, DataVersionTableField
+from matrix.common.aws.dynamo_handler import (DynamoHandler, DynamoTable, RequestTableField, DataVersionTableField,
+                                              InFlightRequestTableField, ResultCacheTableField)
 from matrix.common.exceptions import MatrixException
 from tests.unit import MatrixTestCaseUsingMockAWS
 
@@ -27,6 +28,8 @@ class TestDynamoHandler(MatrixTestCaseUsingMockAWS):
         self.create_test_data_version_table()
         self.create_test_deployment_table()
         self.create_test_request_table()
+        self.create_test_in_flight_request_table()
+        self.create_test_result_cache_table()
 
         self.init_test_data_version_table()
         self.init_test_deployment_table()
@@ -171,6 +174,46 @@ class TestDynamoHandler(MatrixTestCaseUsingMockAWS):
         entry = self.handler.get_table_item(DynamoTable.REQUEST_TABLE, key=self.request_id)
         self.assertEqual(entry[RequestTableField.COMPLETED_DRIVER_EXECUTIONS.value], 15)
 
+    def test_put_in_flight_request_table_entry(self):
+        other_request_id = str(uuid.uuid4())
+
+        in_flight_request_id = self.handler.put_in_flight_request_table_entry("test_key", self.request_id, 60)
+        self.assertEqual(in_flight_request_id, self.request_id)
+
+        in_flight_request_id = self.handler.put_in_flight_request_table_entry("test_key", other_request_id, 60)
+        self.assertEqual(in_flight_request_id, self.request_id)
+
+        entry = self.handler.get_table_item(DynamoTable.IN_FLIGHT_REQUEST_TABLE, key="test_key")
+        self.assertEqual(entry[InFlightRequestTableField.REQUEST_ID.value], self.request_id)
+        self.assertTrue(InFlightRequestTableField.EXPIRATION_TIME.value in entry)
+
+    def test_put_in_flight_request_table_entry_replaces_request(self):
+        other_request_id = str(uuid.uuid4())
+        self.handler.put_in_flight_request_table_entry("test_key", self.request_id, 60)
+
+        in_flight_request_id = self.handler.put_in_flight_request_table_entry("test_key",
+                                                                              other_request_id,
+                                                                              60,
+                                                                              replaced_request_id="test_id")
+        self.assertEqual(in_flight_request_id, self.request_id)
+
+        in_flight_request_id = self.handler.put_in_flight_request_table_entry("test_key",
+                                                                              other_request_id,
+                                                                              60,
+                                                                              replaced_request_id=self.request_id)
+        self.assertEqual(in_flight_request_id, other_request_id)
+
+    def test_put_result_cache_table_entry(self):
+        other_request_id = str(uuid.uuid4())
+
+        self.handler.put_result_cache_table_entry("test_key", self.request_id, 60)
+        entry = self.handler.get_table_item(DynamoTable.RESULT_CACHE_TABLE, key="test_key")
+        self.assertEqual(entry[ResultCacheTableField.REQUEST_ID.value], self.request_id)
+
+        self.handler.put_result_cache_table_entry("test_key", other_request_id, 60)
+        entry = self.handler.get_table_item(DynamoTable.RESULT_CACHE_TABLE, key="test_key")
+        self.assertEqual(entry[ResultCacheTableField.REQUEST_ID.value], other_request_id)
+
     def test_get_table_item(self):
         self.assertRaises(MatrixException, self.handler.get_table_item,
                           DynamoTable.REQUEST_TABLE,
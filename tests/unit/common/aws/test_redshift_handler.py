@@ -0,0 +1,148 @@
+import unittest
+from unittest import mock
+
+import psycopg2
+
+from matrix.common.aws import redshift_handler
+from matrix.common.aws.redshift_handler import ConnectionPool, RedshiftHandler
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("psycopg2.connect", side_effect=lambda uri: mock.MagicMock(closed=0))
+        self.mock_connect = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.pool = ConnectionPool("test_uri", max_size=1, max_idle_seconds=60, health_check_seconds=10)
+
+    @mock.patch("time.time")
+    def test_reuse(self, mock_time):
+        mock_time.return_value = 0
+        conn, reused = self.pool.acquire()
+        self.assertFalse(reused)
+        self.pool.release(conn)
+
+        mock_time.return_value = 5
+        self.assertEqual(self.pool.acquire(), (conn, True))
+        conn.cursor.assert_not_called()
+        self.assertEqual(self.mock_connect.call_count, 1)
+
+    @mock.patch("time.time")
+    def test_health_check(self, mock_time):
+        mock_time.return_value = 0
+        conn, _ = self.pool.acquire()
+        self.pool.release(conn)
+
+        mock_time.return_value = 20
+        self.assertEqual(self.pool.acquire(), (conn, True))
+        conn.cursor.return_value.execute.assert_called_once_with(ConnectionPool.HEALTH_CHECK_QUERY)
+
+        self.pool.release(conn)
+        conn.cursor.return_value.execute.side_effect = psycopg2.OperationalError()
+        mock_time.return_value = 40
+        new_conn, reused = self.pool.acquire()
+        self.assertNotEqual(new_conn, conn)
+        self.assertFalse(reused)
+        conn.close.assert_called_once_with()
+
+    @mock.patch("time.time")
+    def test_max_idle_age(self, mock_time):
+        mock_time.return_value = 0
+        conn, _ = self.pool.acquire()
+        self.pool.release(conn)
+
+        mock_time.return_value = 60
+        new_conn, reused = self.pool.acquire()
+        self.assertFalse(reused)
+        conn.close.assert_called_once_with()
+        conn.cursor.assert_not_called()
+
+    def test_max_size(self):
+        conn_a, _ = self.pool.acquire()
+        conn_b, _ = self.pool.acquire()
+        self.pool.release(conn_a)
+        self.pool.release(conn_b)
+
+        conn_a.close.assert_not_called()
+        conn_b.close.assert_called_once_with()
+
+
+class TestRedshiftHandler(unittest.TestCase):
+
+    def setUp(self):
+        redshift_handler.close_connection_pools()
+        self.addCleanup(redshift_handler.close_connection_pools)
+
+        for uri_property, uri in [("database_uri", "read_write_uri"), ("readonly_database_uri", "read_only_uri")]:
+            patcher = mock.patch(f"matrix.common.aws.redshift_handler.RedshiftHandler.{uri_property}",
+                                 new_callable=mock.PropertyMock, return_value=uri)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        patcher = mock.patch("psycopg2.connect", side_effect=lambda uri: mock.MagicMock(closed=0))
+        self.mock_connect = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.handler = RedshiftHandler()
+
+    def test_transaction_reuses_connections(self):
+        self.handler.transaction(["query_1"])
+        results = RedshiftHandler().transaction(["query_2"], return_results=True)
+
+        self.mock_connect.assert_called_once_with("read_write_uri")
+        conn, reused = redshift_handler.get_connection_pool("read_write_uri").acquire()
+        self.assertTrue(reused)
+        conn.cursor.return_value.execute.assert_has_calls([mock.call("query_1"), mock.call("query_2")])
+        self.assertEqual(results, conn.cursor.return_value.fetchall.return_value)
+        self.assertEqual(conn.commit.call_count, 2)
+
+    def test_read_only_pool(self):
+        self.handler.transaction(["query"])
+        self.handler.fetch_all(["query"], read_only=True)
+        self.handler.fetch_all(["query"], read_only=True)
+
+        self.assertEqual(self.mock_connect.call_args_list, [mock.call("read_write_uri"), mock.call("read_only_uri")])
+
+    def test_reconnect_on_lost_connection(self):
+        self.handler.transaction(["query"])
+        stale_conn = redshift_handler.get_connection_pool("read_write_uri").acquire()[0]
+        redshift_handler.get_connection_pool("read_write_uri").release(stale_conn)
+
+        def lose_connection(query):
+            stale_conn.closed = 2
+            raise psycopg2.OperationalError()
+        stale_conn.cursor.return_value.execute.side_effect = lose_connection
+
+        self.handler.transaction(["query"])
+
+        self.assertEqual(self.mock_connect.call_count, 2)
+        stale_conn.close.assert_called_once_with()
+
+    def test_lost_connection_on_commit_is_not_retried(self):
+        self.handler.transaction(["query"])
+        stale_conn = redshift_handler.get_connection_pool("read_write_uri").acquire()[0]
+        redshift_handler.get_connection_pool("read_write_uri").release(stale_conn)
+
+        def lose_connection():
+            stale_conn.closed = 2
+            raise psycopg2.OperationalError()
+        stale_conn.commit.side_effect = lose_connection
+
+        with self.assertRaises(psycopg2.OperationalError):
+            self.handler.transaction(["query"])
+
+        self.assertEqual(self.mock_connect.call_count, 1)
+        stale_conn.close.assert_called_once_with()
+
+    def test_query_error_closes_connection(self):
+        self.handler.transaction(["query"])
+        conn = redshift_handler.get_connection_pool("read_write_uri").acquire()[0]
+        redshift_handler.get_connection_pool("read_write_uri").release(conn)
+        conn.cursor.return_value.execute.side_effect = psycopg2.ProgrammingError()
+
+        with self.assertRaises(psycopg2.ProgrammingError):
+            self.handler.transaction(["bad query"])
+
+        conn.close.assert_called_once_with()
+        self.assertEqual(self.mock_connect.call_count, 1)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 import uuid
 
 from matrix.common.aws.s3_handler import S3Handler
@@ -33,6 +34,27 @@ class TestS3Handler(MatrixTestCaseUsingMockAWS):
 
         self.assertEqual(content, 'test_content')
 
+    def test_download_file(self):
+        obj_key = f"{self.request_id}/expression"
+        self.s3_handler.store_content_in_s3(obj_key, "test_content")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "expression")
+            self.s3_handler.download_file(obj_key, path)
+
+            with open(path) as f:
+                self.assertEqual(f.read(), "test_content")
+
+    def test_etag(self):
+        obj_key = f"{self.request_id}/expression"
+        self.s3_handler.store_content_in_s3(obj_key, "test_content")
+        etag = self.s3_handler.etag(obj_key)
+
+        self.assertEqual(self.s3_handler.etag(obj_key), etag)
+
+        self.s3_handler.store_content_in_s3(obj_key, "new_test_content")
+        self.assertNotEqual(self.s3_handler.etag(obj_key), etag)
+
     def test_copy_obj(self):
         src_key = "test_key"
         dst_key = "test_key_copy"
@@ -104,3 +126,38 @@ class TestS3Handler(MatrixTestCaseUsingMockAWS):
             self.assertEqual(keys_in_s3, expected_keys)
             self.assertEqual(deleted_objects[0]['Key'], obj_key_2)
             self.assertEqual(deleted_objects[1]['Key'], obj_key_3)
+
+    def test_open_multipart_upload(self):
+        obj_key = "test_key"
+        part_size = 5 * 1024 * 1024
+        content = os.urandom(2 * part_size + 100)
+
+        with self.s3_handler.open_multipart_upload(obj_key, part_size=part_size, concurrency=2) as upload:
+            for start in range(0, len(content), 1024 * 1024):
+                upload.write(content[start:start + 1024 * 1024])
+            self.assertEqual(upload.tell(), len(content))
+
+        obj = self.s3_handler.s3_bucket.Object(obj_key)
+        self.assertEqual(obj.get()['Body'].read(), content)
+        self.assertEqual(len(upload._uploaded_parts), 3)
+
+    def test_open_multipart_upload__empty(self):
+        obj_key = "test_key"
+
+        with self.s3_handler.open_multipart_upload(obj_key):
+            pass
+
+        obj = self.s3_handler.s3_bucket.Object(obj_key)
+        self.assertEqual(obj.get()['Body'].read(), b"")
+
+    def test_open_multipart_upload__aborts_on_error(self):
+        obj_key = "test_key"
+
+        with self.assertRaises(ValueError):
+            with self.s3_handler.open_multipart_upload(obj_key) as upload:
+                upload.write(b"test_content")
+                raise ValueError()
+
+        self.assertFalse(self.s3_handler.exists(obj_key))
+        uploads = self.s3_handler.s3_client.list_multipart_uploads(Bucket=self.s3_handler.s3_bucket.name)
+        self.assertEqual(uploads.get('Uploads', []), [])
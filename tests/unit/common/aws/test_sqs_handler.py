@@ -1,6 +1,8 @@
 import json
+from unittest import mock
 
-from matrix.common.aws.sqs_handler import SQSHandler
+from matrix.common.aws.sqs_handler import SQSHandler, VisibilityHeartbeat
+from matrix.common.exceptions import MatrixException
 from tests.unit import MatrixTestCaseUsingMockAWS
 
 
@@ -43,3 +45,53 @@ class TestSQSHandler(MatrixTestCaseUsingMockAWS):
 
         message = self.sqs_handler.receive_messages_from_queue("test_query_job_q_name", 1)
         self.assertEqual(message, None)
+
+    def test_delete_messages_from_queue(self):
+        for idx in range(12):
+            self.sqs_handler.add_message_to_queue("test_query_job_q_name", {'test_key': idx})
+        receipt_handles = []
+        while len(receipt_handles) < 12:
+            messages = self.sqs_handler.receive_messages_from_queue("test_query_job_q_name", 1, num_messages=10)
+            receipt_handles.extend(message['ReceiptHandle'] for message in messages)
+
+        with mock.patch.object(self.sqs_handler.sqs.meta.client, "delete_message_batch",
+                               wraps=self.sqs_handler.sqs.meta.client.delete_message_batch) as mock_delete_batch:
+            self.sqs_handler.delete_messages_from_queue("test_query_job_q_name", receipt_handles)
+
+        self.assertEqual(mock_delete_batch.call_count, 2)
+        message = self.sqs_handler.receive_messages_from_queue("test_query_job_q_name", 1)
+        self.assertEqual(message, None)
+
+    def test_change_message_visibility(self):
+        with mock.patch.object(self.sqs_handler.sqs.meta.client, "change_message_visibility_batch") as mock_change:
+            mock_change.return_value = {'ResponseMetadata': {'HTTPStatusCode': 200}, 'Successful': [], 'Failed': []}
+            self.sqs_handler.change_message_visibility("test_query_job_q_name", ["handle_1", "handle_2"], 600)
+
+            mock_change.assert_called_once_with(QueueUrl="test_query_job_q_name",
+                                                Entries=[{'Id': "0", 'ReceiptHandle': "handle_1",
+                                                          'VisibilityTimeout': 600},
+                                                         {'Id': "1", 'ReceiptHandle': "handle_2",
+                                                          'VisibilityTimeout': 600}])
+
+            mock_change.return_value['Failed'] = [{'Id': "0", 'Code': "ReceiptHandleIsInvalid"}]
+            with self.assertRaises(MatrixException):
+                self.sqs_handler.change_message_visibility("test_query_job_q_name", ["handle_1"], 600)
+
+    def test_visibility_heartbeat(self):
+        mock_sqs_handler = mock.MagicMock()
+        heartbeat = VisibilityHeartbeat(mock_sqs_handler, "test_query_job_q_name", visibility_timeout=600)
+
+        heartbeat.beat()
+        mock_sqs_handler.change_message_visibility.assert_not_called()
+
+        heartbeat.add("handle_2")
+        heartbeat.add("handle_1")
+        heartbeat.beat()
+        mock_sqs_handler.change_message_visibility.assert_called_once_with("test_query_job_q_name",
+                                                                           ["handle_1", "handle_2"],
+                                                                           600)
+
+        heartbeat.remove(["handle_1"])
+        mock_sqs_handler.change_message_visibility.side_effect = MatrixException(status=500, title="Internal error")
+        heartbeat.beat()
+        mock_sqs_handler.change_message_visibility.assert_called_with("test_query_job_q_name", ["handle_2"], 600)
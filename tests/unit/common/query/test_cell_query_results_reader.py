@@ -1,9 +1,11 @@
 import mock
+import tempfile
 import unittest
 
 import pandas
 
 from matrix.common.query.cell_query_results_reader import CellQueryResultsReader
+from tests.benchmark.synthetic_unload import write_synthetic_unload
 
 
 class TestCellQueryResultsReader(unittest.TestCase):
@@ -38,3 +40,17 @@ class TestCellQueryResultsReader(unittest.TestCase):
 
         self.assertIn("project.project_core.project_short_name", pandas_kwargs["names"])
         self.assertTrue(pandas_args[0].startswith("s3://"))
+
+    def test_load_cellkeys(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manifest = write_synthetic_unload(temp_dir, n_cells=50, n_genes=10, n_slices=2)['cell']
+            reader = CellQueryResultsReader(manifest)
+
+            for slice_idx in range(2):
+                # Small blocks so that lines span block boundaries
+                with mock.patch("matrix.common.query.cell_query_results_reader.CELLKEY_BLOCK_SIZE", 100):
+                    blocks = list(reader.load_cellkeys(slice_idx))
+
+                self.assertGreater(len(blocks), 1)
+                cellkeys = [key.decode() for block in blocks for key in block]
+                self.assertEqual(cellkeys, list(reader.load_slice(slice_idx).index))
@@ -1,7 +1,11 @@
 import mock
+import tempfile
 import unittest
 
-from matrix.common.query.expression_query_results_reader import ExpressionQueryResultsReader
+import pandas
+
+from matrix.common.query.expression_query_results_reader import ExpressionParser, ExpressionQueryResultsReader
+from tests.benchmark.synthetic_unload import write_synthetic_unload
 
 
 class TestExpressionQueryResultsReader(unittest.TestCase):
@@ -16,3 +20,30 @@ class TestExpressionQueryResultsReader(unittest.TestCase):
         reader = ExpressionQueryResultsReader("test_manifest_key")
         results = reader.load_slice(0)
         self.assertEqual(type(results).__name__, 'generator')
+
+    def test_load_slice__arrow_parser_matches_pandas_parser(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manifest = write_synthetic_unload(temp_dir, n_cells=50, n_genes=200, density=0.2, n_slices=2)['expression']
+            arrow_reader = ExpressionQueryResultsReader(manifest, parser=ExpressionParser.ARROW)
+            pandas_reader = ExpressionQueryResultsReader(manifest, parser=ExpressionParser.PANDAS)
+
+            for slice_idx in range(2):
+                # Small blocks so that cells span block boundaries
+                with mock.patch("matrix.common.query.expression_query_results_reader.ARROW_BLOCK_SIZE", 1000):
+                    arrow_chunks = list(arrow_reader.load_slice(slice_idx))
+                pandas_chunks = list(pandas_reader.load_slice(slice_idx))
+
+                self.assertGreater(len(arrow_chunks), 1)
+                for chunk in arrow_chunks:
+                    self.assertEqual(chunk["exprvalue"].dtype, "float32")
+                    self.assertEqual(chunk["cellkey"].dtype.name, "category")
+                    self.assertEqual(len(chunk["cellkey"].cat.categories), chunk["cellkey"].nunique())
+
+                # Every cell is complete within a single chunk
+                chunk_cellkeys = [set(chunk["cellkey"]) for chunk in arrow_chunks]
+                self.assertEqual(sum(len(cellkeys) for cellkeys in chunk_cellkeys), len(set.union(*chunk_cellkeys)))
+
+                arrow_df = pandas.concat([chunk.astype({"cellkey": object, "featurekey": object})
+                                          for chunk in arrow_chunks], ignore_index=True)
+                pandas_df = pandas.concat(pandas_chunks, ignore_index=True)
+                pandas.testing.assert_frame_equal(arrow_df, pandas_df)
@@ -0,0 +1,76 @@
+import io
+import os
+import tempfile
+
+import boto3
+import mock
+import pyarrow.parquet
+
+from matrix.common.aws.redshift_handler import RedshiftHandler
+from matrix.common.query.feature_table import FeatureTable, is_feature_table_url
+from matrix.common.query.feature_table_reader import FeatureTableReader
+from tests.unit import MatrixTestCaseUsingMockAWS
+
+
+class TestFeatureTable(MatrixTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super(TestFeatureTable, self).setUp()
+        self.create_s3_query_results_bucket()
+        self.bucket = os.environ['MATRIX_QUERY_RESULTS_BUCKET']
+        self.feature_table = FeatureTable(1, "gene")
+        self.rows = [
+            ("ENSG01", "A", "protein_coding", "chr1", 100, 150, True),
+            ("ENSG02", "B", "lincRNA", "chr2", 200, 250, True)
+        ]
+
+    def test_url(self):
+        self.assertEqual(self.feature_table.url, f"s3://{self.bucket}/feature_tables/1/gene.parquet")
+        self.assertTrue(is_feature_table_url(self.feature_table.url))
+        self.assertFalse(is_feature_table_url(f"s3://{self.bucket}/test_request_id/gene_metadata_manifest"))
+
+    def test_query(self):
+        self.assertIn("WHERE feature.isgene", FeatureTable(1, "gene").query)
+        self.assertIn("WHERE (NOT feature.isgene)", FeatureTable(1, "transcript").query)
+        with self.assertRaises(ValueError):
+            FeatureTable(1, "foo").query
+
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
+    def test_build(self, mock_transaction):
+        mock_transaction.return_value = self.rows
+
+        url = self.feature_table.build(RedshiftHandler())
+
+        self.assertEqual(url, self.feature_table.url)
+        mock_transaction.assert_called_once_with([self.feature_table.query], return_results=True, read_only=True)
+        body = boto3.resource("s3").Object(self.bucket, self.feature_table.s3_key).get()['Body'].read()
+        df = pyarrow.parquet.read_table(io.BytesIO(body)).to_pandas()
+        self.assertEqual(list(df['featurekey']), ["ENSG01", "ENSG02"])
+        self.assertEqual(list(df['isgene']), [True, True])
+
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
+    def test_get_or_build(self, mock_transaction):
+        mock_transaction.return_value = self.rows
+        self.assertFalse(self.feature_table.exists())
+
+        self.assertEqual(self.feature_table.get_or_build(RedshiftHandler()), self.feature_table.url)
+        self.assertTrue(self.feature_table.exists())
+        self.assertEqual(self.feature_table.get_or_build(RedshiftHandler()), self.feature_table.url)
+        self.assertEqual(mock_transaction.call_count, 1)
+
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
+    def test_load_results(self, mock_transaction):
+        mock_transaction.return_value = self.rows
+        self.feature_table.build(RedshiftHandler())
+        body = boto3.resource("s3").Object(self.bucket, self.feature_table.s3_key).get()['Body'].read()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "gene.parquet")
+            with open(path, "wb") as f:
+                f.write(body)
+
+            df = FeatureTableReader(f"file://{path}").load_results()
+
+        self.assertEqual(list(df.index), ["ENSG01", "ENSG02"])
+        self.assertEqual(list(df['featurename']), ["A", "B"])
+        self.assertEqual(list(df['featurestart']), [100, 200])
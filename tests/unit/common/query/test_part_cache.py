@@ -0,0 +1,111 @@
+import os
+import tempfile
+import time
+
+import boto3
+import mock
+
+from matrix.common.query import part_cache
+from matrix.common.query.part_cache import PartCache, get_part_cache
+from tests.unit import MatrixTestCaseUsingMockAWS
+
+
+class TestPartCache(MatrixTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super(TestPartCache, self).setUp()
+        self.bucket = os.environ['MATRIX_QUERY_RESULTS_BUCKET']
+        self.s3 = boto3.resource("s3", region_name=os.environ['AWS_DEFAULT_REGION'])
+        self.s3.create_bucket(Bucket=self.bucket)
+
+        self.manifest_url = f"s3://{self.bucket}/expression_manifest"
+        self.urls = []
+        for i in range(3):
+            key = f"expression_{i:04d}_part_00.gz"
+            self.s3.Object(self.bucket, key).put(Body=f"part {i}".encode())
+            self.urls.append(f"s3://{self.bucket}/{key}")
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.temp_dir.name, "part-cache")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        super(TestPartCache, self).tearDown()
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_local_path(self):
+        cache = PartCache(self.cache_dir)
+
+        path = cache.local_path(self.manifest_url, self.urls[0])
+        self.assertTrue(path.startswith(self.cache_dir))
+        self.assertTrue(path.endswith(".gz"))
+        self.assertEqual(self._read(path), "part 0")
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        with mock.patch("matrix.common.aws.s3_handler.S3Handler.download_file") as mock_download_file:
+            self.assertEqual(cache.local_path(self.manifest_url, self.urls[0]), path)
+            mock_download_file.assert_not_called()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # Another cache in the same directory, e.g. a retry on the same instance, reuses the part
+        self.assertEqual(PartCache(self.cache_dir).local_path(self.manifest_url, self.urls[0]), path)
+        self.assertEqual(os.listdir(self.cache_dir), [os.path.basename(path)])
+
+    def test_local_path__keyed_by_manifest_and_etag(self):
+        cache = PartCache(self.cache_dir)
+        path = cache.local_path(self.manifest_url, self.urls[0])
+
+        self.assertNotEqual(cache.local_path(f"s3://{self.bucket}/other_manifest", self.urls[0]), path)
+
+        # A new UNLOAD to the same url changes the part's ETag
+        self.s3.Object(self.bucket, "expression_0000_part_00.gz").put(Body=b"new part 0")
+        new_path = cache.local_path(self.manifest_url, self.urls[0])
+        self.assertNotEqual(new_path, path)
+        self.assertEqual(self._read(new_path), "new part 0")
+
+    def test_local_path__evicts_least_recently_used(self):
+        cache = PartCache(self.cache_dir, max_bytes=12)
+        paths = [cache.local_path(self.manifest_url, url) for url in self.urls[:2]]
+        os.utime(paths[0], (0, 0))
+        os.utime(paths[1], (1, 1))
+
+        path = cache.local_path(self.manifest_url, self.urls[2])
+
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(path))
+
+    def test_local_path__keeps_recently_used(self):
+        cache = PartCache(self.cache_dir, max_bytes=12)
+        paths = [cache.local_path(self.manifest_url, url) for url in self.urls[:2]]
+        recent = time.time() - part_cache.EVICTION_GRACE_SECONDS / 2
+        os.utime(paths[0], (recent, recent))
+
+        # Handed to a reader that hasn't opened it yet, e.g. in another process
+        paths.append(cache.local_path(self.manifest_url, self.urls[2]))
+
+        for path in paths:
+            self.assertTrue(os.path.exists(path))
+
+    def test_local_path__keeps_part_larger_than_cache(self):
+        cache = PartCache(self.cache_dir, max_bytes=1)
+
+        path = cache.local_path(self.manifest_url, self.urls[0])
+
+        self.assertEqual(self._read(path), "part 0")
+
+    @mock.patch.object(part_cache, "_part_cache", None)
+    def test_get_part_cache(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('MATRIX_PART_CACHE_DIR', None)
+            self.assertIsNone(get_part_cache())
+
+            os.environ['MATRIX_PART_CACHE_DIR'] = self.cache_dir
+            os.environ['MATRIX_PART_CACHE_BYTES'] = "100"
+            cache = get_part_cache()
+            self.assertEqual(cache.cache_dir, self.cache_dir)
+            self.assertEqual(cache.max_bytes, 100)
+            self.assertIs(get_part_cache(), cache)
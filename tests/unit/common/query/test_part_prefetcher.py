@@ -0,0 +1,91 @@
+import os
+import tempfile
+
+import boto3
+
+from matrix.common.query.part_cache import PartCache
+from matrix.common.query.part_prefetcher import PartPrefetcher
+from tests.unit import MatrixTestCaseUsingMockAWS
+
+
+class TestPartPrefetcher(MatrixTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super(TestPartPrefetcher, self).setUp()
+        self.bucket = os.environ['MATRIX_QUERY_RESULTS_BUCKET']
+        s3 = boto3.resource("s3", region_name=os.environ['AWS_DEFAULT_REGION'])
+        s3.create_bucket(Bucket=self.bucket)
+
+        self.urls = []
+        for i in range(4):
+            key = f"expression_{i:04d}_part_00.gz"
+            s3.Object(self.bucket, key).put(Body=f"part {i}".encode())
+            self.urls.append(f"s3://{self.bucket}/{key}")
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.scratch_dir = os.path.join(self.temp_dir.name, "prefetch")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        super(TestPartPrefetcher, self).tearDown()
+
+    def _read(self, url):
+        self.assertTrue(url.startswith("file://"))
+        with open(url[len("file://"):]) as f:
+            return f.read()
+
+    def test_prefetch(self):
+        with PartPrefetcher(self.scratch_dir, max_parts=2) as prefetcher:
+            prefetcher.prefetch(self.urls, [6] * 4)
+            self.assertEqual(len(prefetcher._downloads), 2)
+
+            for i, url in enumerate(self.urls):
+                local_url = prefetcher.local_url(url)
+                self.assertEqual(self._read(local_url), f"part {i}")
+                prefetcher.release(url)
+
+                self.assertFalse(os.path.exists(local_url[len("file://"):]))
+                self.assertLessEqual(len(prefetcher._downloads), 2)
+
+            self.assertEqual(prefetcher.downloaded_bytes, 24)
+            self.assertGreaterEqual(prefetcher.wait_seconds, 0)
+
+        self.assertFalse(os.path.exists(self.scratch_dir))
+
+    def test_prefetch__byte_budget(self):
+        with PartPrefetcher(self.scratch_dir, max_parts=4, max_bytes=10) as prefetcher:
+            prefetcher.prefetch(self.urls, [6] * 4)
+
+            # Only one part fits in the budget, but there is always one in flight
+            self.assertEqual(list(prefetcher._downloads), self.urls[:1])
+
+            # A part needed ahead of its turn is downloaded anyway
+            self.assertEqual(self._read(prefetcher.local_url(self.urls[2])), "part 2")
+            prefetcher.release(self.urls[2])
+            prefetcher.release(self.urls[0])
+            self.assertEqual(list(prefetcher._downloads), self.urls[1:2])
+
+    def test_local_url__not_prefetched(self):
+        with PartPrefetcher(self.scratch_dir) as prefetcher:
+            prefetcher.prefetch(["file:///tmp/part_00.gz"])
+
+            self.assertEqual(prefetcher.local_url("file:///tmp/part_00.gz"), "file:///tmp/part_00.gz")
+            self.assertEqual(prefetcher.local_url(self.urls[0]), self.urls[0])
+            prefetcher.release(self.urls[0])
+
+    def test_prefetch__part_cache(self):
+        part_cache = PartCache(os.path.join(self.temp_dir.name, "part-cache"))
+        manifest_url = f"s3://{self.bucket}/expression_manifest"
+
+        with PartPrefetcher(self.scratch_dir, max_parts=2, part_cache=part_cache) as prefetcher:
+            prefetcher.prefetch(self.urls, [6] * 4, manifest_url=manifest_url)
+
+            for i, url in enumerate(self.urls):
+                local_url = prefetcher.local_url(url)
+                self.assertEqual(self._read(local_url), f"part {i}")
+                prefetcher.release(url)
+
+                # Cached parts are kept for later readers
+                self.assertEqual(local_url, f"file://{part_cache.local_path(manifest_url, url)}")
+
+        self.assertEqual(part_cache.misses, 4)
@@ -0,0 +1,85 @@
+import datetime
+import json
+import os
+
+import boto3
+import mock
+
+from matrix.common.aws.redshift_handler import RedshiftHandler
+from matrix.common.query.project_shards import (ProjectShards,
+                                                cell_shard_prefix,
+                                                expression_shard_prefix,
+                                                SHARD_MAX_AGE)
+from tests.unit import MatrixTestCaseUsingMockAWS
+
+
+class TestProjectShards(MatrixTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super(TestProjectShards, self).setUp()
+        self.create_s3_query_results_bucket()
+        self.bucket = boto3.resource("s3").Bucket(os.environ['MATRIX_QUERY_RESULTS_BUCKET'])
+        self.project_shards = ProjectShards()
+
+        self.shards = {'cell': [], 'expression': []}
+        for project_id in ["project_a", "project_b"]:
+            for query_type, prefix, name in [("cell", cell_shard_prefix(1, project_id, ["test.field"]),
+                                              "cell_metadata_manifest"),
+                                             ("expression", expression_shard_prefix(1, project_id, "gene"),
+                                              "expression_manifest")]:
+                self.shards[query_type].append({'manifest_key': f"{prefix}/{name}",
+                                                'query': f"{query_type} query of {project_id}"})
+
+    def _put_manifest(self, key, part_urls, columns):
+        manifest = {
+            "entries": [{"url": url, "meta": {"content_length": 10, "record_count": 2}} for url in part_urls],
+            "schema": {"elements": [{"name": column} for column in columns]},
+            "meta": {"content_length": 10 * len(part_urls), "record_count": 2 * len(part_urls)}
+        }
+        self.bucket.Object(key).put(Body=json.dumps(manifest))
+
+    def test_shard_prefixes(self):
+        self.assertEqual(expression_shard_prefix(1, "project_a", "gene"), "project_shards/1/project_a/expression/gene")
+        self.assertEqual(cell_shard_prefix(1, "project_a", ["a"]), cell_shard_prefix(1, "project_a", ["a"]))
+        self.assertNotEqual(cell_shard_prefix(1, "project_a", ["a"]), cell_shard_prefix(1, "project_a", ["b"]))
+
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
+    def test_build_missing(self, mock_transaction):
+        self._put_manifest(self.shards['cell'][0]['manifest_key'], ["part"], ["cellkey"])
+
+        built = self.project_shards.build_missing(self.shards, RedshiftHandler())
+
+        self.assertEqual(built, 3)
+        mock_transaction.assert_has_calls([mock.call(["cell query of project_b"], read_only=True),
+                                           mock.call(["expression query of project_a"], read_only=True),
+                                           mock.call(["expression query of project_b"], read_only=True)])
+
+    @mock.patch("matrix.common.date.get_datetime_now")
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
+    def test_build_missing__rebuilds_expiring_shards(self, mock_transaction, mock_get_datetime_now):
+        for query_type in ["cell", "expression"]:
+            for shard in self.shards[query_type]:
+                self._put_manifest(shard['manifest_key'], ["part"], ["cellkey"])
+
+        mock_get_datetime_now.return_value = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+        self.assertEqual(self.project_shards.build_missing(self.shards, RedshiftHandler()), 0)
+
+        mock_get_datetime_now.return_value = datetime.datetime.utcnow() + SHARD_MAX_AGE
+        self.assertEqual(self.project_shards.build_missing(self.shards, RedshiftHandler()), 4)
+        self.assertEqual(mock_transaction.call_count, 4)
+
+    def test_assemble(self):
+        for query_type, columns in [("cell", ["cellkey", "barcode"]), ("expression", ["cellkey", "featurekey"])]:
+            for idx, shard in enumerate(self.shards[query_type]):
+                self._put_manifest(shard['manifest_key'],
+                                   [f"s3://bucket/{query_type}_{idx}_{part}" for part in range(2)],
+                                   columns)
+
+        self.project_shards.assemble("test_request_id", self.shards)
+
+        for query_type, name in [("cell", "cell_metadata_manifest"), ("expression", "expression_manifest")]:
+            manifest = json.loads(self.bucket.Object(f"test_request_id/{name}").get()['Body'].read())
+            self.assertEqual([entry["url"] for entry in manifest["entries"]],
+                             [f"s3://bucket/{query_type}_{idx}_{part}" for idx in range(2) for part in range(2)])
+            self.assertEqual(manifest["meta"], {"content_length": 40, "record_count": 8})
+            self.assertEqual(manifest["schema"]["elements"][0]["name"], "cellkey")
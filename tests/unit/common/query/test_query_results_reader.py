@@ -1,4 +1,6 @@
 import mock
+import os
+import pickle
 import unittest
 
 from matrix.common.query.query_results_reader import QueryResultsReader
@@ -28,6 +30,54 @@ class TestQueryResultsReader(unittest.TestCase):
         self.assertEqual(query_results_reader.manifest['record_count'], 2544)
         self.assertEqual(len(query_results_reader.manifest['part_urls']), 8)
         self.assertTrue(all(u.startswith("s3://") for u in query_results_reader.manifest['part_urls']))
+        self.assertEqual(len(query_results_reader.manifest['part_content_lengths']), 8)
+        self.assertEqual(query_results_reader.manifest['part_content_lengths'][0], 10963)
+
+    @mock.patch("s3fs.S3FileSystem.open")
+    def test_parse_manifest__local_file(self, mock_open):
+        manifest_file_path = os.path.abspath("tests/functional/res/cell_metadata_manifest")
+
+        query_results_reader = QueryResultsReader(f"file://{manifest_file_path}")
+
+        mock_open.assert_not_called()
+        self.assertEqual(query_results_reader.manifest['record_count'], 2544)
+
+    @mock.patch("matrix.common.query.query_results_reader.QueryResultsReader._parse_manifest")
+    def test_part_url__prefetched(self, mock_parse_manifest):
+        mock_parse_manifest.return_value = {"part_urls": ["s3://bucket/part_00", "s3://bucket/part_01"],
+                                            "part_content_lengths": [10, 20]}
+        prefetcher = mock.Mock(local_url=mock.Mock(return_value="file:///scratch/part_01"))
+        query_results_reader = QueryResultsReader("test_manifest_key")
+
+        query_results_reader.prefetch_parts(prefetcher)
+        with query_results_reader._part_url(1) as part_url:
+            self.assertEqual(part_url, "file:///scratch/part_01")
+            prefetcher.release.assert_not_called()
+
+        prefetcher.prefetch.assert_called_once_with(["s3://bucket/part_00", "s3://bucket/part_01"], [10, 20],
+                                                    manifest_url="test_manifest_key")
+        prefetcher.local_url.assert_called_once_with("s3://bucket/part_01")
+        prefetcher.release.assert_called_once_with("s3://bucket/part_01")
+
+        # Copies sent to worker processes read their parts directly
+        self.assertIsNone(pickle.loads(pickle.dumps(query_results_reader)).prefetcher)
+
+    @mock.patch("matrix.common.query.query_results_reader.get_part_cache")
+    @mock.patch("matrix.common.query.query_results_reader.QueryResultsReader._parse_manifest")
+    def test_part_url__part_cache(self, mock_parse_manifest, mock_get_part_cache):
+        mock_parse_manifest.return_value = {"part_urls": ["s3://bucket/part_00", "file:///scratch/part_01"]}
+        part_cache = mock_get_part_cache.return_value
+        part_cache.local_path.return_value = "/part-cache/abc.gz"
+        query_results_reader = QueryResultsReader("test_manifest_key")
+
+        with query_results_reader._part_url(0) as part_url:
+            self.assertEqual(part_url, "file:///part-cache/abc.gz")
+        part_cache.local_path.assert_called_once_with("test_manifest_key", "s3://bucket/part_00")
+
+        # Local parts are read where they are
+        with query_results_reader._part_url(1) as part_url:
+            self.assertEqual(part_url, "file:///scratch/part_01")
+        part_cache.local_path.assert_called_once()
 
     @mock.patch("matrix.common.query.query_results_reader.QueryResultsReader._parse_manifest")
     def test_load_results(self, mock_parse_manifest):
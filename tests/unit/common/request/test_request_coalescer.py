@@ -0,0 +1,83 @@
+import uuid
+from unittest import mock
+
+from matrix.common.aws.dynamo_handler import DynamoHandler
+from matrix.common.request.request_coalescer import RequestCoalescer, generate_request_key
+from tests.unit import MatrixTestCaseUsingMockAWS
+
+
+class TestRequestCoalescer(MatrixTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super(TestRequestCoalescer, self).setUp()
+
+        self.create_test_data_version_table()
+        self.create_test_deployment_table()
+        self.create_test_request_table()
+        self.create_test_in_flight_request_table()
+
+        self.init_test_data_version_table()
+        self.init_test_deployment_table()
+
+        self.coalescer = RequestCoalescer()
+
+    def test_generate_request_key(self):
+        filter_ = {
+            'op': "and",
+            'value': [
+                {'op': "=", 'field': "foo", 'value': "bar"},
+                {'op': "in", 'field': "baz", 'value': [2, 1]}
+            ]
+        }
+        request_key = generate_request_key(filter_, ["test_field"], "gene", "loom", 0)
+
+        with self.subTest("Test equivalent filters share a key"):
+            reordered_filter = {
+                'value': [
+                    {'op': "in", 'field': "baz", 'value': [1, 2, 1]},
+                    {'op': "=", 'field': "foo", 'value': "bar"}
+                ],
+                'op': "and"
+            }
+            self.assertEqual(generate_request_key(reordered_filter, ["test_field"], "gene", "loom", 0), request_key)
+
+        with self.subTest("Test request parameters and data version change the key"):
+            self.assertNotEqual(generate_request_key(filter_, ["test_field"], "gene", "csv", 0), request_key)
+            self.assertNotEqual(generate_request_key(filter_, ["test_field"], "transcript", "loom", 0), request_key)
+            self.assertNotEqual(generate_request_key(filter_, ["other_field"], "gene", "loom", 0), request_key)
+            self.assertNotEqual(generate_request_key(filter_, ["test_field"], "gene", "loom", 1), request_key)
+
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.timeout", new_callable=mock.PropertyMock)
+    def test_attach(self, mock_timeout):
+        mock_timeout.return_value = False
+        request_id = str(uuid.uuid4())
+        other_request_id = str(uuid.uuid4())
+        DynamoHandler().create_request_table_entry(request_id, "loom")
+
+        self.assertEqual(self.coalescer.attach(request_id, "test_key"), request_id)
+        self.assertEqual(self.coalescer.attach(other_request_id, "test_key"), request_id)
+        self.assertEqual(self.coalescer.attach(other_request_id, "other_test_key"), other_request_id)
+
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.timeout", new_callable=mock.PropertyMock)
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.error", new_callable=mock.PropertyMock)
+    def test_attach_replaces_failed_request(self, mock_error, mock_timeout):
+        mock_error.return_value = "test error"
+        mock_timeout.return_value = False
+        request_id = str(uuid.uuid4())
+        other_request_id = str(uuid.uuid4())
+
+        self.assertEqual(self.coalescer.attach(request_id, "test_key"), request_id)
+        self.assertEqual(self.coalescer.attach(other_request_id, "test_key"), other_request_id)
+
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.batch_job_status", new_callable=mock.PropertyMock)
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.timeout", new_callable=mock.PropertyMock)
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.error", new_callable=mock.PropertyMock)
+    def test_attach_replaces_failed_batch_job_request(self, mock_error, mock_timeout, mock_batch_job_status):
+        mock_error.return_value = ""
+        mock_timeout.return_value = False
+        mock_batch_job_status.return_value = "FAILED"
+        request_id = str(uuid.uuid4())
+        other_request_id = str(uuid.uuid4())
+
+        self.assertEqual(self.coalescer.attach(request_id, "test_key"), request_id)
+        self.assertEqual(self.coalescer.attach(other_request_id, "test_key"), other_request_id)
@@ -0,0 +1,66 @@
+import unittest
+from unittest import mock
+
+from matrix.common import field_details
+from matrix.common.constants import MatrixFormat
+from matrix.common.request import request_estimator
+from matrix.common.request.request_estimator import RequestEstimator
+
+FIELD_DETAILS = {
+    field_details.CELL_SUMMARY: {"cell_count": 1000, "mean_genes_detected": 2000},
+    'derived_organ_label': {"field_type": "categorical",
+                            "cell_counts": {"kidney": 250, "brain": 500, "": 250}},
+    'genes_detected': {"field_type": "numeric", "minimum": 1000, "maximum": 5000},
+}
+
+
+class TestRequestEstimator(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("matrix.common.field_details.get_field_detail", side_effect=FIELD_DETAILS.get)
+        self.mock_get_field_detail = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.estimator = RequestEstimator()
+
+    def _cell_count(self, filter_):
+        return self.estimator.estimate(filter_, [])["cell_count"]
+
+    def test_categorical_filters(self):
+        self.assertEqual(self._cell_count({"op": "=", "field": "derived_organ_label", "value": "kidney"}), 250)
+        self.assertEqual(self._cell_count({"op": "!=", "field": "derived_organ_label", "value": "kidney"}), 750)
+        self.assertEqual(self._cell_count({"op": "in", "field": "derived_organ_label", "value": ["kidney", "brain"]}),
+                         750)
+        self.assertEqual(self._cell_count({"op": "=", "field": "derived_organ_label", "value": "heart"}), 0)
+
+    def test_numeric_filters(self):
+        self.assertEqual(self._cell_count({"op": ">", "field": "genes_detected", "value": 4000}), 250)
+        self.assertEqual(self._cell_count({"op": "<=", "field": "genes_detected", "value": 0}), 0)
+        self.assertEqual(self._cell_count({"op": ">=", "field": "genes_detected", "value": 0}), 1000)
+
+    def test_logical_filters(self):
+        kidney = {"op": "=", "field": "derived_organ_label", "value": "kidney"}
+        high_genes = {"op": ">", "field": "genes_detected", "value": 3000}
+
+        self.assertEqual(self._cell_count({"op": "and", "value": [kidney, high_genes]}), 125)
+        self.assertEqual(self._cell_count({"op": "or", "value": [kidney, high_genes]}), 625)
+        self.assertEqual(self._cell_count({"op": "not", "value": [kidney]}), 750)
+
+    def test_unknown_field_selects_every_cell(self):
+        self.assertEqual(self._cell_count({"op": "=", "field": "foo", "value": "bar"}), 1000)
+        self.assertNotIn(mock.call("foo"), self.mock_get_field_detail.call_args_list)
+
+    def test_estimate(self):
+        filter_ = {"op": "=", "field": "derived_organ_label", "value": "kidney"}
+        fields = ["derived_organ_label", "genes_detected"]
+
+        estimate = self.estimator.estimate(filter_, fields)
+
+        nonzero_count = 250 * 2000
+        self.assertEqual(estimate["cell_count"], 250)
+        self.assertEqual(estimate["nonzero_count"], nonzero_count)
+        self.assertEqual(set(estimate["output_bytes"]), {fmt.value for fmt in MatrixFormat})
+        self.assertEqual(estimate["output_bytes"][MatrixFormat.CSV.value],
+                         nonzero_count * request_estimator.BYTES_PER_NONZERO[MatrixFormat.CSV.value]
+                         + 250 * 2 * request_estimator.BYTES_PER_CELL_FIELD)
+        self.assertEqual(estimate["run_time_seconds"], request_estimator.QUERY_OVERHEAD_SECONDS)
@@ -1,6 +1,4 @@
-import hashlib
 import os
-import pandas
 import uuid
 from unittest import mock
 from datetime import timedelta
@@ -29,6 +27,7 @@ class TestRequestTracker(MatrixTestCaseUsingMockAWS):
         self.create_test_data_version_table()
         self.create_test_deployment_table()
         self.create_test_request_table()
+        self.create_test_result_cache_table()
         self.create_s3_results_bucket()
 
         self.init_test_data_version_table()
@@ -111,6 +110,18 @@ class TestRequestTracker(MatrixTestCaseUsingMockAWS):
         self.assertEqual(self.request_tracker.s3_results_key,
                          f"test_data_version/test_request_hash/{self.request_id}.mtx.zip")
 
+        mock_format.return_value = "zarr"
+        self.assertEqual(self.request_tracker.s3_results_key,
+                         f"test_data_version/test_request_hash/{self.request_id}.zarr.zip")
+
+        mock_format.return_value = "h5ad"
+        self.assertEqual(self.request_tracker.s3_results_key,
+                         f"test_data_version/test_request_hash/{self.request_id}.h5ad")
+
+        mock_format.return_value = "parquet"
+        self.assertEqual(self.request_tracker.s3_results_key,
+                         f"test_data_version/test_request_hash/{self.request_id}.parquet.zip")
+
     @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.get_table_item")
     def test_data_version(self, mock_get_table_item):
         mock_get_table_item.return_value = {RequestTableField.DATA_VERSION.value: 0}
@@ -191,21 +202,50 @@ class TestRequestTracker(MatrixTestCaseUsingMockAWS):
         mock_create_cw_metric.assert_called_once()
 
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.metadata_fields", new_callable=mock.PropertyMock)
-    @mock.patch("matrix.common.query.cell_query_results_reader.CellQueryResultsReader.load_results")
+    @mock.patch("matrix.common.query.cell_query_results_reader.CellQueryResultsReader.load_cellkeys")
     @mock.patch("matrix.common.query.query_results_reader.QueryResultsReader._parse_manifest")
-    def test_generate_request_hash(self, mock_parse_manifest, mock_load_results, mock_metadata_fields):
-        mock_load_results.return_value = pandas.DataFrame(index=["test_cell_key_1", "test_cell_key_2"])
+    def test_generate_request_hash(self, mock_parse_manifest, mock_load_cellkeys, mock_metadata_fields):
+        mock_parse_manifest.return_value = {"part_urls": ["A", "B"]}
         mock_metadata_fields.return_value = ["test_field_1", "test_field_2"]
+        slices = [[[b"test_cell_key_1"], [b"test_cell_key_2"]], [[b"test_cell_key_3"]]]
+
+        mock_load_cellkeys.side_effect = lambda slice_idx: iter(slices[slice_idx])
+        request_hash = self.request_tracker.generate_request_hash()
+        self.assertEqual(self.request_tracker.row_count, 3)
+
+        with self.subTest("Independent of the order of slices and of cells within them"):
+            slices = [[[b"test_cell_key_3"]], [[b"test_cell_key_2", b"test_cell_key_1"]]]
+            self.assertEqual(self.request_tracker.generate_request_hash(), request_hash)
+
+        with self.subTest("Independent of the blocks cells are hashed in"):
+            with mock.patch("matrix.common.request.request_tracker.RequestTracker.REQUEST_HASH_BLOCK_SIZE", 1):
+                self.assertEqual(self.request_tracker.generate_request_hash(), request_hash)
+
+        with self.subTest("Dependent on the cells"):
+            slices = [[[b"test_cell_key_1", b"test_cell_key_2"]], [[b"test_cell_key_4"]]]
+            self.assertNotEqual(self.request_tracker.generate_request_hash(), request_hash)
+
+        with self.subTest("Dependent on the request parameters"):
+            slices = [[[b"test_cell_key_1", b"test_cell_key_2"]], [[b"test_cell_key_3"]]]
+            mock_metadata_fields.return_value = ["test_field_1"]
+            self.assertNotEqual(self.request_tracker.generate_request_hash(), request_hash)
+
+    @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.get_table_item")
+    def test_row_count(self, mock_get_table_item):
+        mock_get_table_item.return_value = {RequestTableField.ROW_COUNT.value: 10}
 
-        h = hashlib.md5()
-        h.update(self.request_tracker.feature.encode())
-        h.update(self.request_tracker.format.encode())
-        h.update("test_field_1".encode())
-        h.update("test_field_2".encode())
-        h.update("test_cell_key_1".encode())
-        h.update("test_cell_key_2".encode())
+        self.assertEqual(self.request_tracker.row_count, 10)
+        self.assertEqual(self.request_tracker.row_count, 10)
+        mock_get_table_item.assert_called_once()
 
-        self.assertEqual(self.request_tracker.generate_request_hash(), h.hexdigest())
+        with self.subTest("An empty request's row count is not looked up again"):
+            mock_get_table_item.reset_mock()
+            mock_get_table_item.return_value = {RequestTableField.ROW_COUNT.value: 0}
+            request_tracker = RequestTracker(self.request_id)
+
+            self.assertEqual(request_tracker.row_count, 0)
+            self.assertEqual(request_tracker.row_count, 0)
+            mock_get_table_item.assert_called_once()
 
     @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.increment_table_field")
     def test_expect_subtask_execution(self, mock_increment_table_field):
@@ -240,6 +280,40 @@ class TestRequestTracker(MatrixTestCaseUsingMockAWS):
             s3_handler.store_content_in_s3("test_prefix/test_result_2", "test_content")
             self.assertEqual(self.request_tracker.lookup_cached_result(), "test_prefix/test_result_1")
 
+        with self.subTest("Skip conversion run reports"):
+            s3_handler.store_content_in_s3("test_prefix/test_result_0.loom.report.json", "test_content")
+            self.assertEqual(self.request_tracker.lookup_cached_result(), "test_prefix/test_result_1")
+
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_complete")
+    def test_lookup_result_cache(self, mock_is_request_complete):
+        cached_request_id = str(uuid.uuid4())
+        mock_is_request_complete.return_value = True
+
+        with self.subTest("Requests without a request key are not cached"):
+            self.assertEqual(self.request_tracker.lookup_result_cache(), "")
+
+        self.request_tracker.write_request_key_to_db("test_key")
+        with self.subTest("No cached result"):
+            self.assertEqual(self.request_tracker.lookup_result_cache(), "")
+
+        self.dynamo_handler.put_result_cache_table_entry("test_key", cached_request_id, 60)
+        with self.subTest("Successfully retrieve a completed request"):
+            self.assertEqual(self.request_tracker.lookup_result_cache(), cached_request_id)
+
+        mock_is_request_complete.return_value = False
+        with self.subTest("Do not match expired results"):
+            self.assertEqual(self.request_tracker.lookup_result_cache(), "")
+
+    def test_cache_result(self):
+        self.request_tracker.cache_result()
+        self.assertEqual(self.dynamo_handler.filter_table_items(DynamoTable.RESULT_CACHE_TABLE,
+                                                                {'RequestId': self.request_id}), [])
+
+        self.request_tracker.write_request_key_to_db("test_key")
+        self.request_tracker.cache_result()
+        entry = self.dynamo_handler.get_table_item(DynamoTable.RESULT_CACHE_TABLE, key="test_key")
+        self.assertEqual(entry['RequestId'], self.request_id)
+
     def test_is_request_complete(self):
         self.assertFalse(self.request_tracker.is_request_complete())
 
@@ -255,7 +329,7 @@ class TestRequestTracker(MatrixTestCaseUsingMockAWS):
         self.dynamo_handler.increment_table_field(DynamoTable.REQUEST_TABLE,
                                                   self.request_id,
                                                   RequestTableField.COMPLETED_QUERY_EXECUTIONS,
-                                                  3)
+                                                  2)
         self.assertTrue(self.request_tracker.is_request_ready_for_conversion())
 
     @mock.patch("matrix.common.aws.cloudwatch_handler.CloudwatchHandler.put_metric_data")
@@ -286,6 +360,37 @@ class TestRequestTracker(MatrixTestCaseUsingMockAWS):
         ]
         mock_cw_put.assert_has_calls(expected_calls)
 
+    @mock.patch("matrix.common.aws.cloudwatch_handler.CloudwatchHandler.put_metric_data_batch")
+    def test_log_conversion_report(self, mock_cw_put_batch):
+        stage = {'seconds': 2.0, 'rows': 10, 'bytes_in': 100, 'bytes_out': 50, 'peak_rss_bytes': 1000}
+        report = {
+            'peak_rss_bytes': 1000,
+            'peak_children_rss_bytes': 3000,
+            'stages': {'read_slices': stage, 'upload': stage},
+        }
+
+        self.request_tracker.log_conversion_report(report)
+
+        dimensions = [
+            {
+                'Name': "Number of Bundles",
+                'Value': "0-499"
+            },
+            {
+                'Name': "Output Format",
+                'Value': "test_format"
+            },
+        ]
+        mock_cw_put_batch.assert_called_once_with([
+            (MetricName.CONVERSION_STAGE_DURATION, 2.0,
+             dimensions + [{'Name': "Conversion Stage", 'Value': "read_slices"}]),
+            (MetricName.CONVERSION_STAGE_DURATION, 2.0,
+             dimensions + [{'Name': "Conversion Stage", 'Value': "upload"}]),
+            (MetricName.CONVERSION_PEAK_MEMORY, 3000, dimensions),
+            (MetricName.CONVERSION_OUTPUT_SIZE, 50, dimensions),
+            (MetricName.CONVERSION_ROWS, 10, dimensions),
+        ])
+
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.log_error")
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.creation_date",
                 new_callable=mock.PropertyMock)
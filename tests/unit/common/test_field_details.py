@@ -0,0 +1,115 @@
+import decimal
+import unittest
+from unittest import mock
+
+from matrix.common import constants
+from matrix.common import field_details
+from matrix.common.aws.redshift_handler import RedshiftHandler
+from matrix.common.field_details import FieldDetailStore, TTLCache
+from tests.unit import MatrixTestCaseUsingMockAWS
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = TTLCache(max_size=2, ttl_seconds=60)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    @mock.patch("time.time")
+    def test_ttl(self, mock_time):
+        cache = TTLCache(max_size=2, ttl_seconds=60)
+        mock_time.return_value = 0
+        cache.put("a", 1)
+
+        mock_time.return_value = 59
+        self.assertEqual(cache.get("a"), 1)
+        mock_time.return_value = 60
+        self.assertIsNone(cache.get("a"))
+
+
+class TestFieldDetails(MatrixTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super(TestFieldDetails, self).setUp()
+        self.create_s3_query_results_bucket()
+        self.create_test_deployment_table()
+        self.init_test_deployment_table()
+        field_details._field_detail_cache.clear()
+
+        self.store = FieldDetailStore(0)
+
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.fetch_all")
+    def test_build(self, mock_fetch_all):
+        categorical = 'donor_organism.human_specific.ethnicity.ontology'
+        boolean = 'emptydrops_is_cell'
+        numeric = 'total_umis'
+        mock_fetch_all.return_value = [[("abc", 123), ("def", 456), (None, 789)],
+                                       [(True, 123), (False, 456), (None, 789)],
+                                       [(decimal.Decimal("10.5"), decimal.Decimal("100.5"))]]
+
+        details = self.store.build([categorical, boolean, numeric], RedshiftHandler())
+
+        mock_fetch_all.assert_called_once_with([mock.ANY, mock.ANY, mock.ANY], read_only=True)
+        expected_details = {
+            categorical: {
+                "field_name": categorical,
+                "field_description": constants.FIELD_DETAIL[categorical],
+                "field_type": "categorical",
+                "cell_counts": {"abc": 123, "def": 456, "": 789}},
+            boolean: {
+                "field_name": boolean,
+                "field_description": constants.FIELD_DETAIL[boolean],
+                "field_type": "categorical",
+                "cell_counts": {"True": 123, "False": 456, "": 789}},
+            numeric: {
+                "field_name": numeric,
+                "field_description": constants.FIELD_DETAIL[numeric],
+                "field_type": "numeric",
+                "minimum": 10.5,
+                "maximum": 100.5}
+        }
+        self.assertEqual(details[categorical], expected_details[categorical])
+        self.assertEqual(details[boolean], expected_details[boolean])
+        for name, detail in expected_details.items():
+            self.assertEqual(self.store.get(name), detail)
+
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.fetch_all")
+    def test_build_all(self, mock_fetch_all):
+        mock_fetch_all.side_effect = lambda queries, read_only: [[(1, 2)] for _ in queries]
+
+        details = self.store.build_all(RedshiftHandler())
+
+        self.assertEqual(list(details.keys()), list(constants.FIELD_DETAIL.keys()) + [field_details.CELL_SUMMARY])
+        self.assertEqual(details[field_details.CELL_SUMMARY], {"cell_count": 1, "mean_genes_detected": 2})
+        self.assertEqual(mock_fetch_all.call_count, 1)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.store.get('genes_detected'))
+
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.fetch_all")
+    def test_get_field_detail(self, mock_fetch_all):
+        field = 'genes_detected'
+        mock_fetch_all.return_value = [[(10, 100)]]
+
+        with self.subTest("Details missing from the store are built"):
+            detail = field_details.get_field_detail(field)
+            self.assertEqual((detail['minimum'], detail['maximum']), (10, 100))
+            self.assertEqual(mock_fetch_all.call_count, 1)
+            self.assertEqual(self.store.get(field), detail)
+
+        with self.subTest("Details are served from memory"):
+            with mock.patch("matrix.common.field_details.FieldDetailStore.get") as mock_get:
+                self.assertEqual(field_details.get_field_detail(field), detail)
+                mock_get.assert_not_called()
+
+        with self.subTest("Details are served from the store"):
+            field_details._field_detail_cache.clear()
+            self.assertEqual(field_details.get_field_detail(field), detail)
+            self.assertEqual(mock_fetch_all.call_count, 1)
@@ -206,6 +206,59 @@ class TestFilterWhereConstruction(unittest.TestCase):
         self.assertEqual(query_constructor.filter_to_where(filter_), expected_sql)
 
 
+class TestFilterCanonicalization(unittest.TestCase):
+
+    def test_errors(self):
+        with self.assertRaises(query_constructor.MalformedMatrixFilter):
+            query_constructor.canonicalize_filter({"op": "<=", "value": 5})
+
+        with self.assertRaises(query_constructor.MalformedMatrixFilter):
+            query_constructor.canonicalize_filter(
+                {"op": "and", "value": [{"op": "=", "field": "foo", "value": "bar"}]})
+
+    def test_field_translation(self):
+        filter_ = {"op": "=", "field": "project.project_core.project_short_name", "value": "foo"}
+        self.assertEqual(query_constructor.canonicalize_filter(filter_),
+                         {"op": "=", "field": "project.short_name", "value": "foo"})
+
+    def test_in_values(self):
+        filter_ = {"op": "in", "field": "foo", "value": ["baz", "bar", "baz"]}
+        self.assertEqual(query_constructor.canonicalize_filter(filter_),
+                         {"op": "in", "field": "foo", "value": ["bar", "baz"]})
+
+    def test_commutative_operands(self):
+        operands = [
+            {"op": "=", "field": "foo", "value": "bar"},
+            {"op": ">", "field": "qux", "value": 5}
+        ]
+        for op in ("and", "or"):
+            with self.subTest(op=op):
+                self.assertEqual(query_constructor.canonicalize_filter({"op": op, "value": operands}),
+                                 query_constructor.canonicalize_filter({"op": op, "value": operands[::-1]}))
+
+    def test_flatten_and_deduplicate(self):
+        foo = {"op": "=", "field": "foo", "value": "bar"}
+        qux = {"op": ">", "field": "qux", "value": 5}
+        quuz = {"op": "=", "field": "quuz", "value": "thud"}
+        nested_filter = {"op": "and", "value": [foo, {"op": "and", "value": [qux, quuz]}, foo]}
+        flat_filter = {"op": "and", "value": [quuz, qux, foo]}
+        self.assertEqual(query_constructor.canonicalize_filter(nested_filter),
+                         query_constructor.canonicalize_filter(flat_filter))
+
+        with self.subTest("Operands of a different op are not flattened"):
+            mixed_filter = {"op": "and", "value": [foo, {"op": "or", "value": [qux, quuz]}]}
+            canonical_filter = query_constructor.canonicalize_filter(mixed_filter)
+            self.assertEqual(len(canonical_filter["value"]), 2)
+
+        with self.subTest("A single remaining operand replaces its parent"):
+            self.assertEqual(query_constructor.canonicalize_filter({"op": "or", "value": [foo, foo]}), foo)
+
+    def test_double_negation(self):
+        foo = {"op": "=", "field": "foo", "value": "bar"}
+        filter_ = {"op": "not", "value": [{"op": "not", "value": [foo]}]}
+        self.assertEqual(query_constructor.canonicalize_filter(filter_), foo)
+
+
 class TestFeatureWhereConstruction(unittest.TestCase):
 
     def test_errors(self):
@@ -260,17 +313,7 @@ MANIFEST VERBOSE
 ;
 """
         self.assertEqual(queries[QueryType.EXPRESSION], expected_exp_query)
-
-        expected_feature_query = """
-UNLOAD ($$SELECT *
-FROM feature
-WHERE (NOT feature.isgene)$$)
-to 's3://{results_bucket}/{request_id}/gene_metadata_'
-IAM_ROLE '{iam_role}'
-GZIP
-MANIFEST VERBOSE;
-"""
-        self.assertEqual(queries[QueryType.FEATURE], expected_feature_query)
+        self.assertNotIn(QueryType.FEATURE, queries)
 
     def test_nested(self):
         filter_ = \
@@ -362,6 +405,41 @@ MANIFEST VERBOSE
         self.assertEqual(queries[QueryType.EXPRESSION], expected_exp_query)
 
 
+class TestProjectShardQueries(unittest.TestCase):
+
+    def test_filter_to_project_ids(self):
+        field = query_constructor.PROJECT_ID_FIELD
+        self.assertEqual(query_constructor.filter_to_project_ids({"op": "=", "field": field, "value": "b"}), ["b"])
+        self.assertEqual(
+            query_constructor.filter_to_project_ids(
+                {"op": "or", "value": [{"op": "in", "field": field, "value": ["c", "a"]},
+                                       {"op": "=", "field": field, "value": "b"}]}),
+            ["a", "b", "c"])
+
+        self.assertIsNone(query_constructor.filter_to_project_ids({"op": "!=", "field": field, "value": "a"}))
+        self.assertIsNone(query_constructor.filter_to_project_ids({"op": "=", "field": "foo", "value": "a"}))
+        self.assertIsNone(query_constructor.filter_to_project_ids(
+            {"op": "and", "value": [{"op": "=", "field": field, "value": "a"},
+                                    {"op": "=", "field": "foo", "value": "bar"}]}))
+
+    def test_create_project_shards(self):
+        shards = query_constructor.create_project_shards(["a", "b"], ["test.field"], "gene", 1, "bucket", "role")
+
+        self.assertEqual(len(shards[QueryType.CELL.value]), 2)
+        self.assertEqual(len(shards[QueryType.EXPRESSION.value]), 2)
+
+        expression_shard = shards[QueryType.EXPRESSION.value][1]
+        self.assertEqual(expression_shard['manifest_key'], "project_shards/1/b/expression/gene/expression_manifest")
+        self.assertIn("TO 's3://bucket/project_shards/1/b/expression/gene/expression_'", expression_shard['query'])
+        self.assertIn("ALLOWOVERWRITE", expression_shard['query'])
+        self.assertIn("project.projectkey = 'b'", expression_shard['query'])
+
+        cell_shard = shards[QueryType.CELL.value][0]
+        self.assertTrue(cell_shard['manifest_key'].startswith("project_shards/1/a/cell/"))
+        self.assertTrue(cell_shard['manifest_key'].endswith("/cell_metadata_manifest"))
+        self.assertIn("IAM_ROLE 'role'", cell_shard['query'])
+
+
 class TestNameConversion(unittest.TestCase):
 
     def test_field_conversion(self):
@@ -0,0 +1,46 @@
+import json
+import unittest
+
+from matrix.docker.conversion_report import ConversionReport
+
+
+class TestConversionReport(unittest.TestCase):
+
+    def setUp(self):
+        self.report = ConversionReport("test_id", "mtx")
+
+    def test_stage(self):
+        with self.report.stage("read_slices", 0) as stats:
+            stats.add(rows=10, bytes_in=100)
+        with self.report.stage("read_slices", 1) as stats:
+            stats.add(rows=5, bytes_in=50)
+
+        stats = self.report.stage_stats("read_slices")
+        self.assertEqual(stats.rows, 15)
+        self.assertEqual(stats.bytes_in, 150)
+        self.assertGreater(stats.peak_rss_bytes, 0)
+        self.assertAlmostEqual(stats.seconds,
+                               self.report.slice_stats(0).seconds + self.report.slice_stats(1).seconds)
+
+    def test_stage__records_time_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.report.stage("convert"):
+                raise ValueError()
+
+        self.assertIn("convert", self.report.stages)
+        self.assertGreater(self.report.stage_stats("convert").peak_rss_bytes, 0)
+
+    def test_to_json(self):
+        with self.report.stage("convert") as stats:
+            stats.add(bytes_out=20)
+        self.report.slice_stats(0).add(rows=3)
+
+        report = json.loads(self.report.to_json())
+
+        self.assertEqual(report['request_id'], "test_id")
+        self.assertEqual(report['format'], "mtx")
+        self.assertEqual(report['stages']['convert']['bytes_out'], 20)
+        self.assertEqual(report['slices'], [{'slice_idx': 0, 'seconds': 0.0, 'rows': 3, 'bytes_in': 0,
+                                             'bytes_out': 0, 'peak_rss_bytes': 0}])
+        self.assertGreater(report['peak_rss_bytes'], 0)
+        self.assertGreaterEqual(report['peak_children_rss_bytes'], 0)
@@ -1,18 +1,34 @@
 import argparse
 import datetime
+import gzip
+import hashlib
+import io
+import json
 import os
 import shutil
+import tempfile
 import unittest
+import zipfile
 from unittest import mock
 
+import h5py
+import loompy
+import numpy
 import pandas
+import pyarrow.parquet
+import scipy.sparse
+import zarr
 
 from matrix.common import date
+from matrix.common.aws.s3_handler import S3Handler
 from matrix.common.request.request_tracker import Subtask
 from matrix.common.query.cell_query_results_reader import CellQueryResultsReader
+from matrix.common.query.expression_query_results_reader import ExpressionQueryResultsReader
 from matrix.common.query.feature_query_results_reader import FeatureQueryResultsReader
 from matrix.docker.matrix_converter import main, MatrixConverter, SUPPORTED_FORMATS
 from matrix.docker.query_runner import QueryType
+from tests.benchmark.synthetic_unload import write_synthetic_unload
+from tests.unit import MatrixTestCaseUsingMockAWS
 
 
 class TestMatrixConverter(unittest.TestCase):
@@ -37,10 +53,12 @@ class TestMatrixConverter(unittest.TestCase):
         self.args = parser.parse_args(args)
         self.matrix_converter = MatrixConverter(self.args)
 
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.cache_result")
     @mock.patch("os.remove")
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.creation_date", new_callable=mock.PropertyMock)
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_request")
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_subtask_execution")
+    @mock.patch("matrix.docker.matrix_converter.MatrixConverter._publish_report")
     @mock.patch("matrix.docker.matrix_converter.MatrixConverter._upload_converted_matrix")
     @mock.patch("matrix.docker.matrix_converter.MatrixConverter._to_loom")
     @mock.patch("matrix.common.query.query_results_reader.QueryResultsReader._parse_manifest")
@@ -48,10 +66,12 @@ class TestMatrixConverter(unittest.TestCase):
                  mock_parse_manifest,
                  mock_to_loom,
                  mock_upload_converted_matrix,
+                 mock_publish_report,
                  mock_subtask_exec,
                  mock_complete_request,
                  mock_creation_date,
-                 mock_os_remove):
+                 mock_os_remove,
+                 mock_cache_result):
         mock_parse_manifest.return_value = self.test_manifest
         mock_creation_date.return_value = date.to_string(datetime.datetime.utcnow())
         mock_to_loom.return_value = "local_matrix_path"
@@ -67,7 +87,69 @@ class TestMatrixConverter(unittest.TestCase):
         mock_to_loom.assert_called_once()
         mock_subtask_exec.assert_called_once_with(Subtask.CONVERTER)
         mock_complete_request.assert_called_once()
+        mock_cache_result.assert_called_once()
         mock_upload_converted_matrix.assert_called_once_with("local_matrix_path", "test_target")
+        mock_publish_report.assert_called_once()
+        self.assertEqual(list(self.matrix_converter.report.stages), ["read_manifests", "convert", "download_wait"])
+
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.log_conversion_report")
+    def test__publish_report(self, mock_log_conversion_report):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.matrix_converter.target_path = os.path.join(temp_dir, "test_target.loom")
+            with self.matrix_converter.report.stage("convert"), \
+                    self.matrix_converter.report.stage("read_slices", 0) as read_stats:
+                read_stats.add(rows=10, bytes_in=100)
+
+            self.matrix_converter._publish_report()
+
+            with open(os.path.join(temp_dir, "test_target.loom.report.json")) as report_file:
+                report = json.load(report_file)
+
+        self.assertEqual(report['request_id'], "test_id")
+        self.assertEqual(report['format'], "loom")
+        self.assertEqual(set(report['stages']), {"convert", "read_slices", "write"})
+        self.assertEqual(report['stages']['read_slices']['rows'], 10)
+        self.assertEqual(report['stages']['read_slices']['bytes_in'], 100)
+        self.assertEqual(report['stages']['write']['rows'], 10)
+        self.assertEqual([s['slice_idx'] for s in report['slices']], [0])
+        mock_log_conversion_report.assert_called_once()
+        self.assertEqual(mock_log_conversion_report.call_args[0][0]['stages'], report['stages'])
+
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.log_conversion_report")
+    def test__publish_report__failure_is_not_raised(self, mock_log_conversion_report):
+        mock_log_conversion_report.side_effect = Exception("CloudWatch is down")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.matrix_converter.target_path = os.path.join(temp_dir, "test_target.loom")
+
+            self.matrix_converter._publish_report()
+
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "test_target.loom.report.json")))
+
+    @mock.patch("matrix.docker.matrix_converter.PartPrefetcher")
+    def test__prefetching(self, mock_prefetcher):
+        prefetcher = mock_prefetcher.return_value.__enter__.return_value
+        prefetcher.wait_seconds = 1.5
+        prefetcher.downloaded_bytes = 100
+        expression_reader = mock.Mock(prefetcher=None)
+        self.matrix_converter.query_results = {QueryType.EXPRESSION: expression_reader}
+
+        with self.subTest("Single worker"):
+            with self.matrix_converter._prefetching():
+                expression_reader.prefetch_parts.assert_called_once_with(prefetcher)
+
+            mock_prefetcher.assert_called_once_with(os.path.join(".", "prefetch"), max_parts=2, max_bytes=4 * 1024 ** 3,
+                                                    part_cache=None)
+            self.assertIsNone(expression_reader.prefetcher)
+            self.assertEqual(self.matrix_converter.report.stage_stats("download_wait").seconds, 1.5)
+            self.assertEqual(self.matrix_converter.report.stage_stats("download_wait").bytes_in, 100)
+
+        with self.subTest("Worker processes read ahead themselves"):
+            mock_prefetcher.reset_mock()
+            self.matrix_converter.workers = 2
+            with self.matrix_converter._prefetching():
+                pass
+
+            mock_prefetcher.assert_not_called()
 
     @mock.patch("s3fs.S3FileSystem.open")
     def test__n_slices(self, mock_open):
@@ -105,15 +187,15 @@ class TestMatrixConverter(unittest.TestCase):
         }
         results_dir = self.matrix_converter._make_directory()
         mock_load_results.return_value = pandas.DataFrame()
+        mock_to_csv.return_value = "featurekey\n"
 
         results = self.matrix_converter._write_out_gene_dataframe(results_dir, 'genes.csv.gz', compression=True)
 
         self.assertEqual(type(results).__name__, 'DataFrame')
         mock_load_results.assert_called_once()
-        mock_to_csv.assert_called_once_with('./test_target/genes.csv.gz',
-                                            compression='gzip',
-                                            index_label='featurekey',
-                                            sep='\t')
+        mock_to_csv.assert_called_once_with(sep='\t', index_label='featurekey', header=True)
+        with gzip.open('./test_target/genes.csv.gz', 'rt') as genes_file:
+            self.assertEqual(genes_file.read(), "featurekey\n")
         shutil.rmtree(results_dir)
 
     @mock.patch("pandas.DataFrame.to_csv")
@@ -137,7 +219,8 @@ class TestMatrixConverter(unittest.TestCase):
     @mock.patch("pandas.DataFrame.to_csv")
     def test__write_out_cell_dataframe__with_compression(self, mock_to_csv, mock_reindex):
         mock_reindex.return_value = pandas.DataFrame()
-        results_dir = './test_target'
+        mock_to_csv.return_value = "cellkey\n"
+        results_dir = self.matrix_converter._make_directory()
         results = self.matrix_converter._write_out_cell_dataframe(results_dir,
                                                                   'cells.csv.gz',
                                                                   pandas.DataFrame(),
@@ -146,10 +229,10 @@ class TestMatrixConverter(unittest.TestCase):
 
         self.assertEqual(type(results).__name__, 'DataFrame')
         mock_reindex.assert_called_once()
-        mock_to_csv.assert_called_once_with('./test_target/cells.csv.gz',
-                                            compression='gzip',
-                                            index_label='cellkey',
-                                            sep='\t')
+        mock_to_csv.assert_called_once_with(sep='\t', index_label='cellkey', header=True)
+        with gzip.open('./test_target/cells.csv.gz', 'rt') as cells_file:
+            self.assertEqual(cells_file.read(), "cellkey\n")
+        shutil.rmtree(results_dir)
 
     @mock.patch("pandas.DataFrame.reindex")
     @mock.patch("pandas.DataFrame.to_csv")
@@ -166,11 +249,397 @@ class TestMatrixConverter(unittest.TestCase):
         mock_reindex.assert_called_once()
         mock_to_csv.assert_called_once_with('./test_target/cells.csv', index_label='cellkey')
 
+    @mock.patch("matrix.docker.matrix_converter.TSV_CHUNK_ROWS", 2)
+    def test__write_out_gzipped_tsv(self):
+        df = pandas.DataFrame({"organ": ["x", "y", "x"], "genes_detected": [1.5, 2, 1]},
+                              index=pandas.Index(["c1", "c2", "c3"]))
+        results_dir = self.matrix_converter._make_directory()
+
+        self.matrix_converter._write_out_gzipped_tsv(os.path.join(results_dir, "cells.tsv.gz"), df, "cellkey")
+
+        with gzip.open(os.path.join(results_dir, "cells.tsv.gz"), "rt") as cells_file:
+            self.assertEqual(cells_file.read(), df.to_csv(sep="\t", index_label="cellkey"))
+        shutil.rmtree(results_dir)
+
+    def test__expression_chunk_to_coo(self):
+        chunk = pandas.DataFrame({
+            "cellkey": ["c2", "c2", "c1", "c1"],
+            "featurekey": ["G3", "G1", "G2", "unknown_gene"],
+            "exprvalue": numpy.array([1.5, 2, 0.1, 4], dtype="float32")
+        })
+        gene_index = pandas.Index(["G1", "G2", "G3"])
+
+        rows, cols, values, cellkeys = MatrixConverter._expression_chunk_to_coo(chunk, gene_index)
+
+        self.assertEqual(cellkeys, ["c1", "c2"])
+        self.assertEqual(rows.tolist(), [1, 0, 2])
+        self.assertEqual(cols.tolist(), [0, 1, 1])
+        self.assertEqual(values.dtype, numpy.float32)
+        self.assertEqual(values.tolist(), numpy.array([0.1, 2, 1.5], dtype="float32").tolist())
+
+    def test__format_mtx_entries(self):
+        entries = MatrixConverter._format_mtx_entries(numpy.array([1, 0]),
+                                                      numpy.array([0, 4]),
+                                                      numpy.array([0.1, 2], dtype="float32"))
+
+        self.assertEqual(entries, "2 1 0.10000000149011612\n1 5 2.0\n")
+
+    def test__to_mtx(self):
+        gene_df = pandas.DataFrame({"featurename": ["A", "B", "C"]}, index=pandas.Index(["G1", "G2", "G3"]))
+        cell_df = pandas.DataFrame({"genes_detected": [1, 2, 1]}, index=pandas.Index(["c1", "c2", "c3"]))
+        expression_slices = [
+            [pandas.DataFrame({"cellkey": ["c2", "c2", "c1"],
+                               "featurekey": ["G3", "G1", "G2"],
+                               "exprvalue": numpy.array([1.5, 2, 0.1], dtype="float32")})],
+            [pandas.DataFrame({"cellkey": ["c3"],
+                               "featurekey": ["G2"],
+                               "exprvalue": numpy.array([3], dtype="float32")})]
+        ]
+        self.matrix_converter.query_results = {
+            QueryType.CELL: mock.Mock(manifest={"part_urls": ["A", "B"]},
+                                      load_results=mock.Mock(return_value=cell_df)),
+            QueryType.EXPRESSION: mock.Mock(manifest={"record_count": 4},
+                                            load_slice=mock.Mock(side_effect=expression_slices)),
+            QueryType.FEATURE: mock.Mock(load_results=mock.Mock(return_value=gene_df))
+        }
+
+        zip_path = self.matrix_converter._to_mtx()
+
+        with zipfile.ZipFile(zip_path) as zipf:
+            mtx = gzip.decompress(zipf.read("test_target/matrix.mtx.gz")).decode()
+            cells = gzip.decompress(zipf.read("test_target/cells.tsv.gz")).decode()
+        os.remove(zip_path)
+
+        self.assertEqual(mtx,
+                         "%%MatrixMarket matrix coordinate real general\n"
+                         "3 3 4\n"
+                         "2 1 0.10000000149011612\n"
+                         "1 2 2.0\n"
+                         "3 2 1.5\n"
+                         "2 3 3.0\n")
+        self.assertEqual([line.split("\t")[0] for line in cells.splitlines()], ["cellkey", "c1", "c2", "c3"])
+
+    def test__format_csv_block(self):
+        lines = MatrixConverter._format_csv_block(["c1", "c2"],
+                                                  numpy.array([2, 0, 1]),
+                                                  numpy.array([0, 1, 1]),
+                                                  numpy.array([0.1, 2, 0], dtype="float32"),
+                                                  4)
+
+        self.assertEqual(lines, "c1,0,0,0.1,0\nc2,2.0,0.0,0,0\n")
+
+    def test__to_csv(self):
+        gene_df = pandas.DataFrame({"featurename": ["A", "B", "C"]}, index=pandas.Index(["G1", "G2", "G3"]))
+        cell_df = pandas.DataFrame({"genes_detected": [1, 2, 1]}, index=pandas.Index(["c1", "c2", "c3"]))
+        expression_slices = [
+            [pandas.DataFrame({"cellkey": ["c2", "c2", "c1", "c3"],
+                               "featurekey": ["G3", "G1", "G2", "G2"],
+                               "exprvalue": numpy.array([1.5, 2, 0.1, 3], dtype="float32")})]
+        ]
+        self.matrix_converter.csv_block_size = 2
+        self.matrix_converter.query_results = {
+            QueryType.CELL: mock.Mock(manifest={"part_urls": ["A"]},
+                                      load_results=mock.Mock(return_value=cell_df)),
+            QueryType.EXPRESSION: mock.Mock(manifest={}, load_slice=mock.Mock(side_effect=expression_slices)),
+            QueryType.FEATURE: mock.Mock(load_results=mock.Mock(return_value=gene_df))
+        }
+
+        zip_path = self.matrix_converter._to_csv()
+
+        with zipfile.ZipFile(zip_path) as zipf:
+            expression = zipf.read("test_target/expression.csv").decode()
+            cells = zipf.read("test_target/cells.csv").decode()
+        os.remove(zip_path)
+
+        self.assertEqual(expression,
+                         "cellkey,G1,G2,G3\n"
+                         "c1,0,0.1,0\n"
+                         "c2,2.0,0,1.5\n"
+                         "c3,0,3.0,0\n")
+        self.assertEqual([line.split(",")[0] for line in cells.splitlines()], ["cellkey", "c1", "c2", "c3"])
+
+    def test__to_loom(self):
+        gene_df = pandas.DataFrame({"featurename": ["A", "B", "C"]}, index=pandas.Index(["G1", "G2", "G3"]))
+        cell_slices = [
+            pandas.DataFrame({"genes_detected": [1, 2], "organ": pandas.Categorical(["x", "y"])},
+                             index=pandas.Index(["c1", "c2"])),
+            pandas.DataFrame({"genes_detected": [1], "organ": pandas.Categorical(["x"])},
+                             index=pandas.Index(["c3"]))
+        ]
+        expression_slices = [
+            [pandas.DataFrame({"cellkey": ["c2", "c2"],
+                               "featurekey": ["G3", "G1"],
+                               "exprvalue": numpy.array([1.5, 2], dtype="float32")}),
+             pandas.DataFrame({"cellkey": ["c1"],
+                               "featurekey": ["G2"],
+                               "exprvalue": numpy.array([0.5], dtype="float32")})],
+            [pandas.DataFrame({"cellkey": ["c3"],
+                               "featurekey": ["G2"],
+                               "exprvalue": numpy.array([3], dtype="float32")})]
+        ]
+        self.matrix_converter.query_results = {
+            QueryType.CELL: mock.Mock(manifest={"part_urls": ["A", "B"]},
+                                      load_slice=mock.Mock(side_effect=cell_slices)),
+            QueryType.EXPRESSION: mock.Mock(manifest={}, load_slice=mock.Mock(side_effect=expression_slices)),
+            QueryType.FEATURE: mock.Mock(load_results=mock.Mock(return_value=gene_df))
+        }
+
+        loom_path = self.matrix_converter._to_loom()
+
+        with loompy.connect(loom_path) as ds:
+            expression = ds[:, :]
+            cell_ids = list(ds.ca["CellID"])
+            organs = list(ds.ca["organ"])
+            accessions = list(ds.ra["Accession"])
+            genes = list(ds.ra["Gene"])
+        os.remove(loom_path)
+
+        self.assertEqual(cell_ids, ["c2", "c1", "c3"])
+        self.assertEqual(organs, ["y", "x", "x"])
+        self.assertEqual(accessions, ["G1", "G2", "G3"])
+        self.assertEqual(genes, ["A", "B", "C"])
+        numpy.testing.assert_array_equal(expression, numpy.array([[2, 0, 0],
+                                                                  [0, 0.5, 3],
+                                                                  [1.5, 0, 0]], dtype="float32"))
+        self.assertFalse(os.path.exists(os.path.join(".", ".loom_parts")))
+
+    def test__to_zarr(self):
+        gene_df = pandas.DataFrame({"featurename": ["A", "B", "C"]}, index=pandas.Index(["G1", "G2", "G3"]))
+        cell_df = pandas.DataFrame({"genes_detected": numpy.array([1, 2, 1], dtype="uint32"),
+                                    "organ": pandas.Categorical(["x", "y", "x"])},
+                                   index=pandas.Index(["c1", "c2", "c3"]))
+        expression_slices = [
+            [pandas.DataFrame({"cellkey": ["c2", "c2", "c1"],
+                               "featurekey": ["G3", "G1", "G2"],
+                               "exprvalue": numpy.array([1.5, 2, 0.1], dtype="float32")})],
+            [pandas.DataFrame({"cellkey": ["c3"],
+                               "featurekey": ["G2"],
+                               "exprvalue": numpy.array([3], dtype="float32")})]
+        ]
+        self.matrix_converter.query_results = {
+            QueryType.CELL: mock.Mock(manifest={"part_urls": ["A", "B"]},
+                                      load_results=mock.Mock(return_value=cell_df)),
+            QueryType.EXPRESSION: mock.Mock(manifest={}, load_slice=mock.Mock(side_effect=expression_slices)),
+            QueryType.FEATURE: mock.Mock(load_results=mock.Mock(return_value=gene_df))
+        }
+
+        zip_path = self.matrix_converter._to_zarr()
+
+        with tempfile.TemporaryDirectory() as extract_dir:
+            with zipfile.ZipFile(zip_path) as zipf:
+                zipf.extractall(extract_dir)
+            os.remove(zip_path)
+            root = zarr.open_group(os.path.join(extract_dir, "test_target"), mode="r")
+
+            numpy.testing.assert_array_equal(root.expression[:], numpy.array([[0, 0.1, 0],
+                                                                              [2, 0, 1.5],
+                                                                              [0, 3, 0]], dtype="float32"))
+            self.assertEqual(list(root.cell_id[:]), ["c1", "c2", "c3"])
+            self.assertEqual(list(root.cell_metadata.genes_detected[:]), [1, 2, 1])
+            self.assertEqual(list(root.cell_metadata.organ[:]), ["x", "y", "x"])
+            self.assertEqual(list(root.gene_id[:]), ["G1", "G2", "G3"])
+            self.assertEqual(list(root.gene_metadata.featurename[:]), ["A", "B", "C"])
+
+    @mock.patch("matrix.docker.matrix_converter.ZARR_CELL_CHUNK_SIZE", 2)
+    @mock.patch("matrix.docker.matrix_converter.MatrixConverter._append_zarr_cells")
+    def test__to_zarr__appends_whole_chunks(self, mock_append_zarr_cells):
+        gene_df = pandas.DataFrame({"featurename": ["A", "B"]}, index=pandas.Index(["G1", "G2"]))
+        cell_df = pandas.DataFrame({"organ": ["x", "y", "x"]}, index=pandas.Index(["c1", "c2", "c3"]))
+        expression_slices = [
+            [pandas.DataFrame({"cellkey": ["c1"],
+                               "featurekey": ["G1"],
+                               "exprvalue": numpy.array([1], dtype="float32")})],
+            [pandas.DataFrame({"cellkey": ["c2", "c3"],
+                               "featurekey": ["G2", "G1"],
+                               "exprvalue": numpy.array([2, 3], dtype="float32")})]
+        ]
+        self.matrix_converter.query_results = {
+            QueryType.CELL: mock.Mock(manifest={"part_urls": ["A", "B"]},
+                                      load_results=mock.Mock(return_value=cell_df)),
+            QueryType.EXPRESSION: mock.Mock(manifest={}, load_slice=mock.Mock(side_effect=expression_slices)),
+            QueryType.FEATURE: mock.Mock(load_results=mock.Mock(return_value=gene_df))
+        }
+
+        os.remove(self.matrix_converter._to_zarr())
+
+        appended = [(args[3], numpy.concatenate(args[4]).tolist()) for args, _ in mock_append_zarr_cells.call_args_list]
+        self.assertEqual(appended, [(["c1", "c2"], [[1, 0], [0, 2]]), (["c3"], [[3, 0]])])
+
+    def test__to_h5ad(self):
+        gene_df = pandas.DataFrame({"featurename": ["A", "B", "C"]}, index=pandas.Index(["G1", "G2", "G3"]))
+        cell_df = pandas.DataFrame({"genes_detected": numpy.array([1, 2, 1], dtype="uint32"),
+                                    "organ": pandas.Categorical(["x", "y", "x"])},
+                                   index=pandas.Index(["c1", "c2", "c3"]))
+        expression_slices = [
+            [pandas.DataFrame({"cellkey": ["c2", "c2", "c1"],
+                               "featurekey": ["G3", "G1", "G2"],
+                               "exprvalue": numpy.array([1.5, 2, 0.1], dtype="float32")})],
+            [pandas.DataFrame({"cellkey": ["c3"],
+                               "featurekey": ["G2"],
+                               "exprvalue": numpy.array([3], dtype="float32")})]
+        ]
+        self.matrix_converter.query_results = {
+            QueryType.CELL: mock.Mock(manifest={"part_urls": ["A", "B"]},
+                                      load_results=mock.Mock(return_value=cell_df)),
+            QueryType.EXPRESSION: mock.Mock(manifest={}, load_slice=mock.Mock(side_effect=expression_slices)),
+            QueryType.FEATURE: mock.Mock(load_results=mock.Mock(return_value=gene_df))
+        }
+
+        h5ad_path = self.matrix_converter._to_h5ad()
+
+        with h5py.File(h5ad_path, "r") as h5ad_file:
+            matrix = h5ad_file["X"]
+            self.assertEqual(matrix.attrs["h5sparse_format"], "csr")
+            expression = scipy.sparse.csr_matrix((matrix["data"][()], matrix["indices"][()], matrix["indptr"][()]),
+                                                 shape=tuple(matrix.attrs["h5sparse_shape"]))
+            obs = h5ad_file["obs"][()]
+            var = h5ad_file["var"][()]
+        os.remove(h5ad_path)
+
+        numpy.testing.assert_array_equal(expression.toarray(), numpy.array([[0, 0.1, 0],
+                                                                            [2, 0, 1.5],
+                                                                            [0, 3, 0]], dtype="float32"))
+        self.assertEqual(list(obs["index"]), [b"c1", b"c2", b"c3"])
+        self.assertEqual(list(obs["genes_detected"]), [1, 2, 1])
+        self.assertEqual(list(obs["organ"]), [b"x", b"y", b"x"])
+        self.assertEqual(list(var["index"]), [b"G1", b"G2", b"G3"])
+        self.assertEqual(list(var["featurename"]), [b"A", b"B", b"C"])
+
+    def test__to_parquet(self):
+        gene_df = pandas.DataFrame({"featurename": ["A", "B", "C"]}, index=pandas.Index(["G1", "G2", "G3"]))
+        cell_df = pandas.DataFrame({"genes_detected": [1, 2, 1]}, index=pandas.Index(["c1", "c2", "c3"]))
+        expression_slices = [
+            [pandas.DataFrame({"cellkey": ["c1", "c2", "c2"],
+                               "featurekey": ["G2", "G1", "G3"],
+                               "exprvalue": numpy.array([0.1, 2, 1.5], dtype="float32")})],
+            [pandas.DataFrame({"cellkey": ["c3"],
+                               "featurekey": ["G2"],
+                               "exprvalue": numpy.array([3], dtype="float32")})]
+        ]
+        self.matrix_converter.query_results = {
+            QueryType.CELL: mock.Mock(manifest={"part_urls": ["A", "B"]},
+                                      load_results=mock.Mock(return_value=cell_df)),
+            QueryType.EXPRESSION: mock.Mock(manifest={}, load_slice=mock.Mock(side_effect=expression_slices)),
+            QueryType.FEATURE: mock.Mock(load_results=mock.Mock(return_value=gene_df))
+        }
+
+        zip_path = self.matrix_converter._to_parquet()
+
+        with tempfile.TemporaryDirectory() as extract_dir:
+            with zipfile.ZipFile(zip_path) as zipf:
+                zipf.extractall(extract_dir)
+            os.remove(zip_path)
+            expression = pyarrow.parquet.ParquetFile(os.path.join(extract_dir, "test_target", "expression.parquet"))
+            expression_df = expression.read().to_pandas()
+            column_encodings = [expression.metadata.row_group(0).column(i).encodings for i in range(3)]
+            cells_df = pyarrow.parquet.read_table(os.path.join(extract_dir, "test_target", "cells.parquet")).to_pandas()
+            genes_df = pyarrow.parquet.read_table(os.path.join(extract_dir, "test_target", "genes.parquet")).to_pandas()
+
+        self.assertEqual(expression.num_row_groups, 2)
+        self.assertEqual([any("DICTIONARY" in encoding for encoding in encodings) for encodings in column_encodings],
+                         [True, True, False])
+        self.assertEqual(expression_df["exprvalue"].dtype, numpy.float32)
+        self.assertEqual(list(expression_df["cellkey"]), ["c1", "c2", "c2", "c3"])
+        self.assertEqual(list(expression_df["featurekey"]), ["G2", "G1", "G3", "G2"])
+        numpy.testing.assert_array_equal(expression_df["exprvalue"].values,
+                                         numpy.array([0.1, 2, 1.5, 3], dtype="float32"))
+        self.assertEqual(list(cells_df["cellkey"]), ["c1", "c2", "c3"])
+        self.assertEqual(list(cells_df["genes_detected"]), [1, 2, 1])
+        self.assertEqual(list(genes_df["featurekey"]), ["G1", "G2", "G3"])
+        self.assertEqual(list(genes_df["featurename"]), ["A", "B", "C"])
+
+    def test_conversion_with_workers(self):
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            n_cells = 30
+            manifests = write_synthetic_unload(scratch_dir, n_cells=n_cells, n_genes=50, density=0.2, n_slices=3)
+            expected_cellkeys = sorted(hashlib.md5(str(i).encode()).hexdigest() for i in range(n_cells))
+            with open(manifests['expression'][len("file://"):]) as manifest_file:
+                # The synthetic expression values are all nonzero
+                expected_nnz = json.load(manifest_file)['meta']['record_count']
+
+            for file_format in ["mtx", "csv", "loom", "zarr", "h5ad"]:
+                with self.subTest(f"Converting to {file_format}"):
+                    outputs = []
+                    for workers in [1, 2]:
+                        self.matrix_converter.local_output_filename = f"test_target_{workers}"
+                        self.matrix_converter.workers = workers
+                        self.matrix_converter.query_results = {
+                            QueryType.CELL: CellQueryResultsReader(manifests['cell']),
+                            QueryType.EXPRESSION: ExpressionQueryResultsReader(manifests['expression']),
+                            QueryType.FEATURE: FeatureQueryResultsReader(manifests['feature'])
+                        }
+
+                        output_path = getattr(self.matrix_converter, f"_to_{file_format}")()
+                        cellkeys, nnz = self._conversion_cellkeys_and_nnz(file_format, output_path)
+                        self.assertEqual(len(cellkeys), n_cells)
+                        self.assertEqual(sorted(cellkeys), expected_cellkeys)
+                        self.assertEqual(nnz, expected_nnz)
+
+                        if file_format == "loom":
+                            with loompy.connect(output_path) as ds:
+                                outputs.append((ds[:, :], list(ds.ca["CellID"])))
+                        elif file_format == "h5ad":
+                            with h5py.File(output_path, "r") as h5ad_file:
+                                outputs.append({name: h5ad_file[name][()]
+                                                for name in ["X/data", "X/indices", "X/indptr", "obs", "var"]})
+                        else:
+                            with zipfile.ZipFile(output_path) as zipf:
+                                outputs.append({name.split("/", 1)[1]: zipf.read(name)
+                                                for name in zipf.namelist()})
+                        os.remove(output_path)
+
+                    if file_format == "loom":
+                        numpy.testing.assert_array_equal(outputs[0][0], outputs[1][0])
+                        self.assertEqual(outputs[0][1], outputs[1][1])
+                    elif file_format == "h5ad":
+                        for name, values in outputs[0].items():
+                            numpy.testing.assert_array_equal(values, outputs[1][name])
+                    else:
+                        for name, content in outputs[0].items():
+                            if name.endswith(".gz"):
+                                self.assertEqual(gzip.decompress(content), gzip.decompress(outputs[1][name]))
+                            else:
+                                self.assertEqual(content, outputs[1][name])
+
+    def _conversion_cellkeys_and_nnz(self, file_format, output_path):
+        """Read the cellkeys of the cell metadata rows and the number of nonzero expression
+        values from a converted matrix."""
+        if file_format == "loom":
+            with loompy.connect(output_path) as ds:
+                return list(ds.ca["CellID"]), numpy.count_nonzero(ds[:, :])
+        if file_format == "h5ad":
+            with h5py.File(output_path, "r") as h5ad_file:
+                return [key.decode() for key in h5ad_file["obs"]["index"]], len(h5ad_file["X/data"])
+
+        with tempfile.TemporaryDirectory() as extract_dir:
+            with zipfile.ZipFile(output_path) as zipf:
+                zipf.extractall(extract_dir)
+            results_dir = os.path.join(extract_dir, os.listdir(extract_dir)[0])
+
+            if file_format == "zarr":
+                root = zarr.open_group(results_dir, mode="r")
+                return list(root.cell_id[:]), numpy.count_nonzero(root.expression[:])
+            if file_format == "mtx":
+                with gzip.open(os.path.join(results_dir, "cells.tsv.gz"), "rt") as cells_file:
+                    cellkeys = [line.split("\t", 1)[0] for line in cells_file.read().splitlines()[1:]]
+                with gzip.open(os.path.join(results_dir, "matrix.mtx.gz"), "rt") as mtx_file:
+                    entries = [line for line in mtx_file.read().splitlines() if not line.startswith("%")][1:]
+                return cellkeys, len(entries)
+
+            with open(os.path.join(results_dir, "cells.csv")) as cells_file:
+                cellkeys = [line.split(",", 1)[0] for line in cells_file.read().splitlines()[1:]]
+            with open(os.path.join(results_dir, "expression.csv")) as expression_file:
+                lines = expression_file.read().splitlines()[1:]
+            self.assertEqual([line.split(",", 1)[0] for line in lines], cellkeys)
+            return cellkeys, sum(value != "0" for line in lines for value in line.split(",")[1:])
+
     def test_converter_with_file_formats(self):
         for file_format in SUPPORTED_FORMATS:
             with self.subTest(f"Converting to {file_format}"):
                 self._test_converter_with_file_format(file_format)
 
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.cache_result")
+    @mock.patch("matrix.docker.matrix_converter.MatrixConverter._publish_report")
     @mock.patch("os.remove")
     @mock.patch("os.mkdir")
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.creation_date", new_callable=mock.PropertyMock)
@@ -181,6 +650,9 @@ class TestMatrixConverter(unittest.TestCase):
     @mock.patch("s3fs.S3FileSystem.put")
     @mock.patch("scipy.io.mmwrite")
     @mock.patch("zipfile.ZipFile.write")
+    @mock.patch("matrix.docker.matrix_converter.MatrixConverter._to_parquet")
+    @mock.patch("matrix.docker.matrix_converter.MatrixConverter._to_h5ad")
+    @mock.patch("matrix.docker.matrix_converter.MatrixConverter._to_zarr")
     @mock.patch("matrix.docker.matrix_converter.MatrixConverter._to_csv")
     @mock.patch("matrix.docker.matrix_converter.MatrixConverter._to_loom")
     @mock.patch("matrix.docker.matrix_converter.MatrixConverter._to_mtx")
@@ -193,6 +665,9 @@ class TestMatrixConverter(unittest.TestCase):
                                          mock_to_mtx,
                                          mock_to_loom,
                                          mock_to_csv,
+                                         mock_to_zarr,
+                                         mock_to_h5ad,
+                                         mock_to_parquet,
                                          mock_zipfile_write,
                                          mock_mmwrite,
                                          mock_s3_put,
@@ -202,7 +677,9 @@ class TestMatrixConverter(unittest.TestCase):
                                          mock_hstack,
                                          mock_creation_date,
                                          mock_os_mkdir,
-                                         mock_os_remove):
+                                         mock_os_remove,
+                                         mock_publish_report,
+                                         mock_cache_result):
         mock_s3_fs.return_value = None
         mock_s3_map.return_value = None
         mock_creation_date.return_value = date.to_string(datetime.datetime.utcnow())
@@ -216,6 +693,12 @@ class TestMatrixConverter(unittest.TestCase):
             mock_to_csv.assert_called_once()
         elif file_format == "mtx":
             mock_to_mtx.assert_called_once()
+        elif file_format == "zarr":
+            mock_to_zarr.assert_called_once()
+        elif file_format == "h5ad":
+            mock_to_h5ad.assert_called_once()
+        elif file_format == "parquet":
+            mock_to_parquet.assert_called_once()
 
         mock_s3_put.assert_called_once()
         mock_complete_subtask_execution.assert_called_once_with(Subtask.CONVERTER)
@@ -224,3 +707,56 @@ class TestMatrixConverter(unittest.TestCase):
     def _test_unsupported_format(self):
         with self.assertRaises(SystemExit):
             main(["test_hash", "test_source_path", "target_path", "bad_format"])
+
+
+class TestMatrixConverterStreamingUpload(MatrixTestCaseUsingMockAWS):
+
+    def setUp(self):
+        super(TestMatrixConverterStreamingUpload, self).setUp()
+        self.create_s3_results_bucket()
+        self.s3_handler = S3Handler(os.environ['MATRIX_RESULTS_BUCKET'])
+
+    def test_zip_outputs_stream_to_s3(self):
+        gene_df = pandas.DataFrame({"featurename": ["A", "B", "C"]}, index=pandas.Index(["G1", "G2", "G3"]))
+        cell_df = pandas.DataFrame({"genes_detected": [1, 2]}, index=pandas.Index(["c1", "c2"]))
+
+        file_names = {
+            "mtx": ["genes.tsv.gz", "matrix.mtx.gz", "cells.tsv.gz"],
+            "csv": ["genes.csv", "expression.csv", "cells.csv"]
+        }
+        for file_format in ["mtx", "csv"]:
+            with self.subTest(f"Converting to {file_format}"):
+                s3_key = f"0/hash/test_id.{file_format}.zip"
+                args = argparse.Namespace(request_id="test_id",
+                                          target_path=f"s3://{os.environ['MATRIX_RESULTS_BUCKET']}/{s3_key}",
+                                          format=file_format,
+                                          working_dir=".")
+                matrix_converter = MatrixConverter(args)
+                matrix_converter.query_results = {
+                    QueryType.CELL: mock.Mock(manifest={"part_urls": ["A"]},
+                                              load_results=mock.Mock(return_value=cell_df)),
+                    QueryType.EXPRESSION: mock.Mock(
+                        manifest={"record_count": 2},
+                        load_slice=mock.Mock(return_value=[
+                            pandas.DataFrame({"cellkey": ["c1", "c2"],
+                                              "featurekey": ["G2", "G3"],
+                                              "exprvalue": numpy.array([1, 2], dtype="float32")})])),
+                    QueryType.FEATURE: mock.Mock(load_results=mock.Mock(return_value=gene_df))
+                }
+
+                output_path = getattr(matrix_converter, f"_to_{file_format}")()
+
+                self.assertIsNone(output_path)
+                self.assertFalse(os.path.exists(f"test_id.{file_format}.zip"))
+                self.assertFalse(os.path.exists(f"test_id.{file_format}"))
+
+                content = self.s3_handler.s3_bucket.Object(s3_key).get()['Body'].read()
+                with zipfile.ZipFile(io.BytesIO(content)) as zipf:
+                    self.assertEqual(zipf.namelist(),
+                                     [f"test_id.{file_format}/{name}" for name in file_names[file_format]])
+                    expression = zipf.read(f"test_id.{file_format}/{file_names[file_format][1]}")
+
+                if file_format == "mtx":
+                    self.assertEqual(gzip.decompress(expression).decode().splitlines()[2:], ["2 1 1.0", "3 2 2.0"])
+                else:
+                    self.assertEqual(expression.decode().splitlines(), ["cellkey,G1,G2,G3", "c1,0,1.0,0", "c2,0,0,2.0"])
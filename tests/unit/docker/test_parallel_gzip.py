@@ -0,0 +1,61 @@
+import gzip
+import io
+import os
+import unittest
+import zlib
+
+from matrix.docker.parallel_gzip import ParallelGzipFile
+
+
+class TestParallelGzipFile(unittest.TestCase):
+
+    def test_write(self):
+        data = b"1 2 3.0\n" * 1000
+        output = io.BytesIO()
+
+        with ParallelGzipFile(output, compresslevel=4, block_size=1000, threads=2) as gzip_f:
+            for i in range(0, len(data), 333):
+                gzip_f.write(data[i:i + 333])
+
+        self.assertFalse(output.closed)
+        self.assertEqual(gzip.decompress(output.getvalue()), data)
+
+    def test_write__random_input(self):
+        data = os.urandom(100000)
+        output = io.BytesIO()
+
+        with ParallelGzipFile(output, block_size=4096, threads=3) as gzip_f:
+            gzip_f.write(data)
+
+        with gzip.GzipFile(fileobj=io.BytesIO(output.getvalue())) as gzip_in:
+            self.assertEqual(gzip_in.read(), data)
+
+    def test_write__single_member(self):
+        data = b"1 2 3.0\n" * 1000
+        output = io.BytesIO()
+
+        with ParallelGzipFile(output, block_size=1000, threads=2) as gzip_f:
+            gzip_f.write(data)
+
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        self.assertEqual(decompressor.decompress(output.getvalue()), data)
+        self.assertTrue(decompressor.eof)
+        self.assertEqual(decompressor.unused_data, b"")
+
+    def test_write__empty(self):
+        output = io.BytesIO()
+
+        with ParallelGzipFile(output):
+            pass
+
+        self.assertEqual(gzip.decompress(output.getvalue()), b"")
+
+    def test_close__is_idempotent(self):
+        output = io.BytesIO()
+        gzip_f = ParallelGzipFile(output)
+        gzip_f.write(b"abc")
+
+        gzip_f.close()
+        gzip_f.close()
+
+        self.assertEqual(gzip.decompress(output.getvalue()), b"abc")
@@ -0,0 +1,22 @@
+import unittest
+
+from matrix.docker.query_concurrency import AdaptiveConcurrencyLimit
+
+
+class TestAdaptiveConcurrencyLimit(unittest.TestCase):
+
+    def test_increase_at_limit(self):
+        concurrency_limit = AdaptiveConcurrencyLimit(maximum=3)
+
+        self.assertEqual(concurrency_limit.observe(queue_seconds=0, exec_seconds=10, concurrency=1), 2)
+        self.assertEqual(concurrency_limit.observe(queue_seconds=0, exec_seconds=10, concurrency=1), 2)
+        self.assertEqual(concurrency_limit.observe(queue_seconds=0.5, exec_seconds=10, concurrency=2), 3)
+        self.assertEqual(concurrency_limit.observe(queue_seconds=0, exec_seconds=10, concurrency=3), 3)
+
+    def test_decrease_on_queue_wait(self):
+        concurrency_limit = AdaptiveConcurrencyLimit(minimum=2, maximum=8, initial=8)
+
+        self.assertEqual(concurrency_limit.observe(queue_seconds=2, exec_seconds=10, concurrency=8), 4)
+        self.assertEqual(concurrency_limit.observe(queue_seconds=2, exec_seconds=10, concurrency=4), 2)
+        self.assertEqual(concurrency_limit.observe(queue_seconds=2, exec_seconds=10, concurrency=2), 2)
+        self.assertEqual(concurrency_limit.limit, 2)
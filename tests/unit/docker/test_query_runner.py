@@ -1,9 +1,12 @@
 from unittest import mock
+import itertools
 import uuid
 import json
 import requests
 
+from matrix.docker.query_concurrency import AdaptiveConcurrencyLimit, LAST_QUERY_ID_QUERY
 from matrix.docker.query_runner import QueryRunner
+from matrix.common.aws.cloudwatch_handler import MetricName
 from matrix.common.aws.sqs_handler import SQSHandler
 from matrix.common.request.request_tracker import Subtask
 from matrix.common.exceptions import MatrixException
@@ -21,12 +24,16 @@ class TestQueryRunner(MatrixTestCaseUsingMockAWS):
         self.sqs.meta.client.purge_queue(QueueUrl="test_query_job_q_name")
         self.sqs.meta.client.purge_queue(QueueUrl="test_deadletter_query_job_q_name")
 
+        patcher = mock.patch("matrix.common.aws.cloudwatch_handler.CloudwatchHandler.put_metric_data_batch")
+        self.mock_put_metric_data_batch = patcher.start()
+        self.addCleanup(patcher.stop)
+
     @mock.patch("matrix.common.aws.s3_handler.S3Handler.load_content_from_obj_key")
     @mock.patch("matrix.common.aws.sqs_handler.SQSHandler.receive_messages_from_queue")
     def test_run__with_no_messages_in_queue(self, mock_receive_messages, mock_load_obj):
         mock_receive_messages.return_value = None
         self.query_runner.run(max_loops=1)
-        mock_receive_messages.assert_called_once_with(self.query_runner.query_job_q_url)
+        mock_receive_messages.assert_called_once_with(self.query_runner.query_job_q_url, num_messages=4)
         mock_load_obj.assert_not_called()
 
     @mock.patch("matrix.common.aws.batch_handler.BatchHandler.schedule_matrix_conversion")
@@ -46,6 +53,7 @@ class TestQueryRunner(MatrixTestCaseUsingMockAWS):
             's3_obj_key': "test_s3_obj_key",
             'type': "test_type"
         }
+        mock_transaction.return_value = []
         self.sqs_handler.add_message_to_queue("test_query_job_q_name", payload)
         mock_is_ready_for_conversion.return_value = False
 
@@ -56,6 +64,9 @@ class TestQueryRunner(MatrixTestCaseUsingMockAWS):
         mock_complete_subtask.assert_called_once_with(Subtask.QUERY)
         mock_schedule_conversion.assert_not_called()
 
+    @mock.patch("matrix.common.query.feature_table.FeatureTable.get_or_build")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.feature", new_callable=mock.PropertyMock)
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.data_version", new_callable=mock.PropertyMock)
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.s3_results_key", new_callable=mock.PropertyMock)
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.format", new_callable=mock.PropertyMock)
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.write_batch_job_id_to_db")
@@ -72,24 +83,33 @@ class TestQueryRunner(MatrixTestCaseUsingMockAWS):
                                                                      mock_schedule_conversion,
                                                                      mock_write_batch_job_id_to_db,
                                                                      mock_format,
-                                                                     mock_s3_results_key):
+                                                                     mock_s3_results_key,
+                                                                     mock_data_version,
+                                                                     mock_feature,
+                                                                     mock_get_or_build_feature_table):
         request_id = str(uuid.uuid4())
         payload = {
             'request_id': request_id,
             's3_obj_key': "test_s3_obj_key",
             'type': "test_type"
         }
+        mock_transaction.return_value = []
         self.sqs_handler.add_message_to_queue("test_query_job_q_name", payload)
         mock_is_ready_for_conversion.return_value = True
         mock_format.return_value = "test_format"
         mock_s3_results_key.return_value = "test_s3_results_key"
+        mock_data_version.return_value = 0
+        mock_feature.return_value = "gene"
+        mock_get_or_build_feature_table.return_value = "test_feature_table_url"
         mock_schedule_conversion.return_value = "123-123"
 
         self.query_runner.run(max_loops=1)
 
+        mock_get_or_build_feature_table.assert_called_once_with(self.query_runner.redshift_handler)
         mock_schedule_conversion.assert_called_once_with(request_id,
                                                          "test_format",
-                                                         "test_s3_results_key")
+                                                         "test_s3_results_key",
+                                                         "test_feature_table_url")
         mock_write_batch_job_id_to_db.assert_called_once_with("123-123")
 
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.log_error")
@@ -109,6 +129,7 @@ class TestQueryRunner(MatrixTestCaseUsingMockAWS):
             's3_obj_key': "test_s3_obj_key",
             'type': "test_type"
         }
+        mock_transaction.return_value = []
         self.sqs_handler.add_message_to_queue("test_query_job_q_name", payload)
         mock_complete_subtask.side_effect = MatrixException(status=requests.codes.not_found, title=f"Unable to find")
 
@@ -123,10 +144,118 @@ class TestQueryRunner(MatrixTestCaseUsingMockAWS):
         self.assertEqual(message_body['request_id'], request_id)
         self.assertEqual(message_body['s3_obj_key'], "test_s3_obj_key")
 
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_complete")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_ready_for_conversion")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_subtask_execution")
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.fetch_all")
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
+    @mock.patch("matrix.common.aws.s3_handler.S3Handler.load_content_from_obj_key")
+    def test_run__adapts_concurrency_to_queue_time(self,
+                                                   mock_load_obj,
+                                                   mock_transaction,
+                                                   mock_fetch_all,
+                                                   mock_complete_subtask,
+                                                   mock_is_ready_for_conversion,
+                                                   mock_is_request_complete):
+        mock_load_obj.return_value = "test_query"
+        mock_is_ready_for_conversion.return_value = False
+        mock_is_request_complete.return_value = False
+        query_ids = itertools.count(1)
+        mock_transaction.side_effect = lambda *args, **kwargs: [(next(query_ids),)]
+        self.query_runner.concurrency_limit = AdaptiveConcurrencyLimit(initial=1)
+        for idx in range(3):
+            payload = {
+                'request_id': str(uuid.uuid4()),
+                's3_obj_key': f"test_s3_obj_key_{idx}",
+                'type': "expression"
+            }
+            self.sqs_handler.add_message_to_queue("test_query_job_q_name", payload)
+
+        self.query_runner.run(max_loops=1)
+
+        mock_transaction.assert_called_once_with(["test_query", LAST_QUERY_ID_QUERY],
+                                                 return_results=True,
+                                                 read_only=True)
+        metrics = self.mock_put_metric_data_batch.call_args[0][0]
+        self.assertEqual([metric[0] for metric in metrics], [MetricName.QUERY_DURATION, MetricName.QUERY_CONCURRENCY])
+
+        with self.subTest("Queries whose statistics aren't logged yet are looked up again"):
+            mock_fetch_all.return_value = [[]]
+
+            self.query_runner._observe_query_stats()
+
+            self.assertIn("WHERE query IN (1)", mock_fetch_all.call_args[0][0][0])
+            self.assertEqual(self.query_runner.concurrency_limit.limit, 1)
+            self.assertEqual(list(self.query_runner._pending_query_stats), [1])
+
+        with self.subTest("Queries that don't wait in the WLM queue raise the limit"):
+            mock_fetch_all.return_value = [[(1, 0, 10 * 1000000)]]
+
+            self.query_runner._observe_query_stats()
+
+            self.assertEqual(self.query_runner.concurrency_limit.limit, 2)
+            self.assertEqual(self.query_runner._pending_query_stats, {})
+            metrics = self.mock_put_metric_data_batch.call_args[0][0]
+            self.assertEqual([metric[0] for metric in metrics], [MetricName.QUERY_QUEUE_TIME,
+                                                                 MetricName.QUERY_CONCURRENCY_LIMIT])
+            self.assertEqual(metrics[1][1], 2)
+
+        with self.subTest("Queries that wait in the WLM queue lower the limit"):
+            self.query_runner.run(max_loops=1)
+            mock_fetch_all.return_value = [[(2, 5 * 1000000, 10 * 1000000), (3, 5 * 1000000, 10 * 1000000)]]
+
+            self.query_runner._observe_query_stats()
+
+            self.assertEqual(mock_transaction.call_count, 3)
+            self.assertEqual(self.query_runner.concurrency_limit.limit, 1)
+            self.assertEqual(mock_complete_subtask.call_count, 3)
+
+        with self.subTest("Queries whose statistics are never logged are dropped"):
+            self.query_runner._pending_query_stats[4] = ("expression", 1, 0)
+            mock_fetch_all.return_value = [[]]
+
+            self.query_runner._observe_query_stats()
+
+            self.assertEqual(self.query_runner._pending_query_stats, {})
+
+    @mock.patch("matrix.docker.query_runner.VisibilityHeartbeat")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_complete")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_ready_for_conversion")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_subtask_execution")
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
+    @mock.patch("matrix.common.aws.s3_handler.S3Handler.load_content_from_obj_key")
+    def test_run__extends_visibility_until_deleted(self,
+                                                   mock_load_obj,
+                                                   mock_transaction,
+                                                   mock_complete_subtask,
+                                                   mock_is_ready_for_conversion,
+                                                   mock_is_request_complete,
+                                                   mock_heartbeat_class):
+        payload = {
+            'request_id': str(uuid.uuid4()),
+            's3_obj_key': "test_s3_obj_key",
+            'type': "expression"
+        }
+        self.sqs_handler.add_message_to_queue("test_query_job_q_name", payload)
+        mock_transaction.return_value = []
+        mock_is_ready_for_conversion.return_value = False
+        mock_is_request_complete.return_value = False
+        heartbeat = mock_heartbeat_class.return_value
+
+        self.query_runner.run(max_loops=1)
+
+        mock_heartbeat_class.assert_called_once_with(self.query_runner.sqs_handler, "test_query_job_q_name")
+        receipt_handle = heartbeat.add.call_args[0][0]
+        heartbeat.remove.assert_called_once_with([receipt_handle])
+        heartbeat.start.assert_called_once_with()
+        heartbeat.stop.assert_called_once_with()
+        self.assertEqual(self.sqs_handler.receive_messages_from_queue("test_query_job_q_name", 1), None)
+
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.cache_result")
     @mock.patch("matrix.common.aws.batch_handler.BatchHandler.schedule_matrix_conversion")
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_ready_for_conversion")
     @mock.patch("matrix.common.aws.s3_handler.S3Handler.copy_obj")
-    @mock.patch("matrix.common.aws.sqs_handler.SQSHandler.delete_message_from_queue")
+    @mock.patch("matrix.common.aws.sqs_handler.SQSHandler.delete_messages_from_queue")
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.s3_results_key", new_callable=mock.PropertyMock)
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.format", new_callable=mock.PropertyMock)
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.write_batch_job_id_to_db")
@@ -140,16 +269,19 @@ class TestQueryRunner(MatrixTestCaseUsingMockAWS):
                                                                    mock_write_batch_job_id_to_db,
                                                                    mock_format,
                                                                    mock_s3_results_key,
-                                                                   mock_delete_message_from_queue,
+                                                                   mock_delete_messages_from_queue,
                                                                    mock_copy_obj,
                                                                    mock_is_request_ready_for_conversion,
-                                                                   mock_schedule_matrix_conversion):
+                                                                   mock_schedule_matrix_conversion,
+                                                                   mock_cache_result):
         request_id = str(uuid.uuid4())
         payload = {
             'request_id': request_id,
             's3_obj_key': "test_s3_obj_key",
-            'type': "cell"
+            'type': "cell",
+            'deferred_queries': {"expression": "test_expression_obj_key", "feature": "test_feature_obj_key"}
         }
+        mock_transaction.return_value = []
         self.sqs_handler.add_message_to_queue("test_query_job_q_name", payload)
         mock_format.return_value = "test_format"
         mock_s3_results_key.return_value = "test_s3_results_key"
@@ -157,8 +289,100 @@ class TestQueryRunner(MatrixTestCaseUsingMockAWS):
 
         self.query_runner.run(max_loops=1)
 
-        mock_delete_message_from_queue.assert_called_once_with("test_query_job_q_name", mock.ANY)
+        mock_delete_messages_from_queue.assert_called_once_with("test_query_job_q_name", [mock.ANY])
         mock_copy_obj.assert_called_once_with("test_cached_result_key", "test_s3_results_key")
+        mock_cache_result.assert_called_once()
         mock_is_request_ready_for_conversion.assert_not_called()
         mock_write_batch_job_id_to_db.assert_not_called()
         mock_schedule_matrix_conversion.assert_not_called()
+
+        # The deferred expression and feature queries are never queued
+        self.assertEqual(self.sqs_handler.receive_messages_from_queue("test_query_job_q_name", 1), None)
+
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_ready_for_conversion")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_subtask_execution")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.lookup_cached_result")
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
+    @mock.patch("matrix.common.aws.s3_handler.S3Handler.load_content_from_obj_key")
+    def test_run__with_one_message_in_queue_and_no_cached_result(self,
+                                                                 mock_load_obj,
+                                                                 mock_transaction,
+                                                                 mock_lookup_cached_result,
+                                                                 mock_complete_subtask,
+                                                                 mock_is_request_ready_for_conversion):
+        request_id = str(uuid.uuid4())
+        payload = {
+            'request_id': request_id,
+            's3_obj_key': "test_s3_obj_key",
+            'type': "cell",
+            'deferred_queries': {"expression": "test_expression_obj_key", "feature": "test_feature_obj_key"}
+        }
+        mock_transaction.return_value = []
+        self.sqs_handler.add_message_to_queue("test_query_job_q_name", payload)
+        mock_lookup_cached_result.return_value = ""
+        mock_is_request_ready_for_conversion.return_value = False
+
+        self.query_runner.run(max_loops=1)
+
+        mock_complete_subtask.assert_called_once_with(Subtask.QUERY)
+        query_queue_messages = self.sqs_handler.receive_messages_from_queue("test_query_job_q_name", 1, num_messages=10)
+        self.assertEqual(sorted((json.loads(message['Body'])['type'], json.loads(message['Body'])['s3_obj_key'])
+                                for message in query_queue_messages),
+                         [("expression", "test_expression_obj_key"), ("feature", "test_feature_obj_key")])
+
+    @mock.patch("matrix.common.query.project_shards.ProjectShards.assemble")
+    @mock.patch("matrix.common.query.project_shards.ProjectShards.build_missing")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_ready_for_conversion")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_subtask_execution")
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
+    @mock.patch("matrix.common.aws.s3_handler.S3Handler.load_content_from_obj_key")
+    def test_run__with_one_project_union_message_in_queue(self,
+                                                          mock_load_obj,
+                                                          mock_transaction,
+                                                          mock_complete_subtask,
+                                                          mock_is_request_ready_for_conversion,
+                                                          mock_build_missing,
+                                                          mock_assemble):
+        request_id = str(uuid.uuid4())
+        payload = {
+            'request_id': request_id,
+            's3_obj_key': "test_s3_obj_key",
+            'type': "project_union"
+        }
+        shards = {'cell': [{'manifest_key': "test_cell_manifest", 'query': "test_cell_query"}],
+                  'expression': [{'manifest_key': "test_expression_manifest", 'query': "test_expression_query"}]}
+        self.sqs_handler.add_message_to_queue("test_query_job_q_name", payload)
+        mock_load_obj.return_value = json.dumps(shards)
+        mock_is_request_ready_for_conversion.return_value = False
+
+        self.query_runner.run(max_loops=1)
+
+        mock_transaction.assert_not_called()
+        mock_build_missing.assert_called_once_with(shards, self.query_runner.redshift_handler)
+        mock_assemble.assert_called_once_with(request_id, shards)
+        mock_complete_subtask.assert_called_once_with(Subtask.QUERY)
+
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_subtask_execution")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_complete")
+    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
+    @mock.patch("matrix.common.aws.s3_handler.S3Handler.load_content_from_obj_key")
+    def test_run__with_one_message_in_queue_and_request_complete(self,
+                                                                 mock_load_obj,
+                                                                 mock_transaction,
+                                                                 mock_is_request_complete,
+                                                                 mock_complete_subtask):
+        request_id = str(uuid.uuid4())
+        payload = {
+            'request_id': request_id,
+            's3_obj_key': "test_s3_obj_key",
+            'type': "expression"
+        }
+        self.sqs_handler.add_message_to_queue("test_query_job_q_name", payload)
+        mock_is_request_complete.return_value = True
+
+        self.query_runner.run(max_loops=1)
+
+        mock_load_obj.assert_not_called()
+        mock_transaction.assert_not_called()
+        mock_complete_subtask.assert_not_called()
+        self.assertEqual(self.sqs_handler.receive_messages_from_queue("test_query_job_q_name", 1), None)
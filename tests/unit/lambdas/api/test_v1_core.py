@@ -16,10 +16,20 @@ import matrix.lambdas.api.v1.core as core
 
 class TestCore(unittest.TestCase):
 
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.lookup_result_cache")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.write_request_key_to_db")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.data_version",
+                new_callable=mock.PropertyMock)
+    @mock.patch("matrix.common.request.request_coalescer.RequestCoalescer.attach")
     @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.create_request_table_entry")
     @mock.patch("matrix.common.aws.lambda_handler.LambdaHandler.invoke")
     @mock.patch("matrix.common.aws.cloudwatch_handler.CloudwatchHandler.put_metric_data")
-    def test_post_matrix_with_just_filter_ok(self, mock_cw_put, mock_lambda_invoke, mock_dynamo_create_request):
+    def test_post_matrix_with_just_filter_ok(self, mock_cw_put, mock_lambda_invoke, mock_dynamo_create_request,
+                                             mock_attach, mock_data_version, mock_write_request_key,
+                                             mock_lookup_result_cache):
+        mock_attach.side_effect = lambda request_id, request_key: request_id
+        mock_data_version.return_value = 0
+        mock_lookup_result_cache.return_value = ""
         filter_ = {"op": ">", "field": "foo", "value": 42}
         format_ = MatrixFormat.LOOM.value
 
@@ -41,10 +51,20 @@ class TestCore(unittest.TestCase):
         self.assertEqual(response[0]['status'], MatrixRequestStatus.IN_PROGRESS.value)
         self.assertEqual(response[1], requests.codes.accepted)
 
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.lookup_result_cache")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.write_request_key_to_db")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.data_version",
+                new_callable=mock.PropertyMock)
+    @mock.patch("matrix.common.request.request_coalescer.RequestCoalescer.attach")
     @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.create_request_table_entry")
     @mock.patch("matrix.common.aws.lambda_handler.LambdaHandler.invoke")
     @mock.patch("matrix.common.aws.cloudwatch_handler.CloudwatchHandler.put_metric_data")
-    def test_post_matrix_with_fields_and_feature_ok(self, mock_cw_put, mock_lambda_invoke, mock_dynamo_create_request):
+    def test_post_matrix_with_fields_and_feature_ok(self, mock_cw_put, mock_lambda_invoke, mock_dynamo_create_request,
+                                                    mock_attach, mock_data_version, mock_write_request_key,
+                                                    mock_lookup_result_cache):
+        mock_attach.side_effect = lambda request_id, request_key: request_id
+        mock_data_version.return_value = 0
+        mock_lookup_result_cache.return_value = ""
         filter_ = {"op": ">", "field": "foo", "value": 42}
         format_ = MatrixFormat.LOOM.value
 
@@ -69,6 +89,105 @@ class TestCore(unittest.TestCase):
         self.assertEqual(response[0]['status'], MatrixRequestStatus.IN_PROGRESS.value)
         self.assertEqual(response[1], requests.codes.accepted)
 
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.write_coalesced_request_id_to_db")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.lookup_result_cache")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.write_request_key_to_db")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.data_version",
+                new_callable=mock.PropertyMock)
+    @mock.patch("matrix.common.request.request_coalescer.RequestCoalescer.attach")
+    @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.create_request_table_entry")
+    @mock.patch("matrix.common.aws.lambda_handler.LambdaHandler.invoke")
+    @mock.patch("matrix.common.aws.cloudwatch_handler.CloudwatchHandler.put_metric_data")
+    def test_post_matrix_coalesced_with_in_flight_request(self, mock_cw_put, mock_lambda_invoke,
+                                                          mock_dynamo_create_request, mock_attach,
+                                                          mock_data_version, mock_write_request_key,
+                                                          mock_lookup_result_cache, mock_write_coalesced_request_id):
+        in_flight_request_id = str(uuid.uuid4())
+        mock_attach.return_value = in_flight_request_id
+        mock_data_version.return_value = 0
+        mock_lookup_result_cache.return_value = ""
+
+        body = {
+            'filter': {"op": ">", "field": "foo", "value": 42},
+            'format': MatrixFormat.LOOM.value
+        }
+        response = core.post_matrix(body)
+
+        mock_attach.assert_called_once_with(response[0]['request_id'], mock_write_request_key.call_args[0][0])
+        mock_write_coalesced_request_id.assert_called_once_with(in_flight_request_id)
+        self.assertEqual(mock_lambda_invoke.call_count, 0)
+        self.assertEqual(response[0]['status'], MatrixRequestStatus.IN_PROGRESS.value)
+        self.assertEqual(response[1], requests.codes.accepted)
+
+    @mock.patch("matrix.lambdas.api.v1.core.get_matrix")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.write_coalesced_request_id_to_db")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.lookup_result_cache")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.write_request_key_to_db")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.data_version",
+                new_callable=mock.PropertyMock)
+    @mock.patch("matrix.common.request.request_coalescer.RequestCoalescer.attach")
+    @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.create_request_table_entry")
+    @mock.patch("matrix.common.aws.lambda_handler.LambdaHandler.invoke")
+    @mock.patch("matrix.common.aws.cloudwatch_handler.CloudwatchHandler.put_metric_data")
+    def test_post_matrix_result_cache_hit(self, mock_cw_put, mock_lambda_invoke, mock_dynamo_create_request,
+                                          mock_attach, mock_data_version, mock_write_request_key,
+                                          mock_lookup_result_cache, mock_write_coalesced_request_id, mock_get_matrix):
+        cached_request_id = str(uuid.uuid4())
+        mock_data_version.return_value = 0
+        mock_lookup_result_cache.return_value = cached_request_id
+        mock_get_matrix.return_value = ({'status': MatrixRequestStatus.COMPLETE.value}, requests.codes.ok)
+
+        body = {
+            'filter': {"op": ">", "field": "foo", "value": 42},
+            'format': MatrixFormat.LOOM.value
+        }
+        response = core.post_matrix(body)
+
+        mock_write_coalesced_request_id.assert_called_once_with(cached_request_id)
+        self.assertEqual(mock_attach.call_count, 0)
+        self.assertEqual(mock_lambda_invoke.call_count, 0)
+        self.assertEqual(response[0]['status'], MatrixRequestStatus.COMPLETE.value)
+        self.assertEqual(response[1], requests.codes.ok)
+
+    @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.create_request_table_entry")
+    @mock.patch("matrix.common.aws.lambda_handler.LambdaHandler.invoke")
+    def test_post_matrix_malformed_filter(self, mock_lambda_invoke, mock_dynamo_create_request):
+        body = {
+            'filter': {"op": "and", "value": [{"op": "=", "field": "foo", "value": "bar"}]},
+            'format': MatrixFormat.LOOM.value
+        }
+        response = core.post_matrix(body)
+
+        self.assertEqual(mock_dynamo_create_request.call_count, 0)
+        self.assertEqual(mock_lambda_invoke.call_count, 0)
+        self.assertEqual(response[1], requests.codes.bad_request)
+
+    @mock.patch("matrix.common.request.request_estimator.RequestEstimator.estimate")
+    @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.create_request_table_entry")
+    @mock.patch("matrix.common.aws.lambda_handler.LambdaHandler.invoke")
+    def test_post_matrix_estimate(self, mock_lambda_invoke, mock_dynamo_create_request, mock_estimate):
+        estimate = {'cell_count': 1, 'nonzero_count': 2, 'output_bytes': {}, 'run_time_seconds': 3}
+        mock_estimate.return_value = estimate
+        filter_ = {"op": ">", "field": "foo", "value": 42}
+
+        response = core.post_matrix_estimate({'filter': filter_})
+
+        mock_estimate.assert_called_once_with(filter_, constants.DEFAULT_FIELDS)
+        self.assertEqual(mock_dynamo_create_request.call_count, 0)
+        self.assertEqual(mock_lambda_invoke.call_count, 0)
+        self.assertEqual(response, (estimate, requests.codes.ok))
+
+    @mock.patch("matrix.common.request.request_estimator.RequestEstimator.estimate")
+    def test_post_matrix_estimate_malformed_filter(self, mock_estimate):
+        body = {
+            'filter': {"op": "and", "value": [{"op": "=", "field": "foo", "value": "bar"}]},
+            'format': MatrixFormat.LOOM.value
+        }
+        response = core.post_matrix_estimate(body)
+
+        self.assertEqual(mock_estimate.call_count, 0)
+        self.assertEqual(response[1], requests.codes.bad_request)
+
     @mock.patch("matrix.common.aws.lambda_handler.LambdaHandler.invoke")
     def test_post_matrix_with_ids_ok_and_unexpected_format(self, mock_lambda_invoke):
         bundle_fqids = ["id1", "id2"]
@@ -182,6 +301,32 @@ class TestCore(unittest.TestCase):
 
         self.assertEqual(response[0]['status'], MatrixRequestStatus.COMPLETE.value)
 
+    @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.get_table_item")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_complete")
+    def test_get_matrix_coalesced_complete(self, mock_is_request_complete, mock_get_table_item):
+        request_id = str(uuid.uuid4())
+        in_flight_request_id = str(uuid.uuid4())
+        mock_is_request_complete.return_value = True
+        request_items = {
+            request_id: {RequestTableField.ERROR_MESSAGE.value: "",
+                         RequestTableField.FORMAT.value: "loom",
+                         RequestTableField.COALESCED_REQUEST_ID.value: in_flight_request_id},
+            in_flight_request_id: {RequestTableField.DATA_VERSION.value: 0,
+                                   RequestTableField.REQUEST_HASH.value: "hash",
+                                   RequestTableField.ERROR_MESSAGE.value: "",
+                                   RequestTableField.FORMAT.value: "loom",
+                                   RequestTableField.COALESCED_REQUEST_ID.value: "N/A"}
+        }
+        mock_get_table_item.side_effect = lambda table, key: request_items[key]
+
+        response = core.get_matrix(request_id)
+        self.assertEqual(response[1], requests.codes.ok)
+        self.assertEqual(response[0]['request_id'], request_id)
+        self.assertEqual(response[0]['status'], MatrixRequestStatus.COMPLETE.value)
+        self.assertEqual(response[0]['matrix_url'],
+                         f"https://s3.amazonaws.com/{os.environ['MATRIX_RESULTS_BUCKET']}/0/hash/"
+                         f"{in_flight_request_id}.loom")
+
     @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.get_table_item")
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.is_request_complete")
     def test_get_csv_matrix_complete(self, mock_is_request_complete, mock_get_table_item):
@@ -311,96 +456,47 @@ class TestCore(unittest.TestCase):
         self.assertEqual(response[1], requests.codes.ok)
         self.assertListEqual(response[0], list(constants.FEATURE_DETAIL.keys()))
 
-    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
-    def test_get_filter_detail(self, mock_transaction):
+    @mock.patch("matrix.common.field_details.get_field_detail")
+    def test_get_filter_detail(self, mock_get_field_detail):
 
         response = core.get_filter_detail("not.a.real.filter.")
         self.assertEqual(response[1], requests.codes.not_found)
+        mock_get_field_detail.assert_not_called()
 
         filter_ = 'donor_organism.human_specific.ethnicity.ontology'
-        description = constants.FILTER_DETAIL[filter_]
-
-        mock_transaction.return_value = [("abc", 123), ("def", 456), (None, 789)]
-
-        response = core.get_filter_detail(filter_)
-
-        self.assertEqual(response[1], requests.codes.ok)
-        self.assertDictEqual(
-            response[0],
-            {
-                "field_name": filter_,
-                "field_description": description,
-                "field_type": "categorical",
-                "cell_counts": {"abc": 123, "def": 456, "": 789}})
-
-        filter_ = 'genes_detected'
-        description = constants.FILTER_DETAIL[filter_]
-        mock_transaction.return_value = [(10, 100)]
-        response = core.get_filter_detail(filter_)
-
-        self.assertEqual(response[1], requests.codes.ok)
-        self.assertDictEqual(
-            response[0],
-            {
-                "field_name": filter_,
-                "field_description": description,
-                "field_type": "numeric",
-                "minimum": 10,
-                "maximum": 100})
-
-    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
-    def test_get_filter_detail_boolean(self, mock_transaction):
-        filter_ = 'emptydrops_is_cell'
-        description = constants.FILTER_DETAIL[filter_]
-
-        mock_transaction.return_value = [(True, 123), (False, 456), (None, 789)]
+        detail = {
+            "field_name": filter_,
+            "field_description": constants.FILTER_DETAIL[filter_],
+            "field_type": "categorical",
+            "cell_counts": {"abc": 123, "def": 456, "": 789}}
+        mock_get_field_detail.return_value = detail
 
         response = core.get_filter_detail(filter_)
 
         self.assertEqual(response[1], requests.codes.ok)
-        self.assertDictEqual(
-            response[0],
-            {
-                "field_name": filter_,
-                "field_description": description,
-                "field_type": "categorical",
-                "cell_counts": {"True": 123, "False": 456, "": 789}})
+        self.assertDictEqual(response[0], detail)
+        mock_get_field_detail.assert_called_once_with(filter_)
 
-    @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
-    def test_get_field(self, mock_transaction):
+    @mock.patch("matrix.common.field_details.get_field_detail")
+    def test_get_field(self, mock_get_field_detail):
         response = core.get_field_detail("not.a.real.field.")
         self.assertEqual(response[1], requests.codes.not_found)
-
-        field = 'donor_organism.human_specific.ethnicity.ontology'
-        description = constants.FIELD_DETAIL[field]
-
-        mock_transaction.return_value = [("abc", 123), ("def", 456)]
-
-        response = core.get_field_detail(field)
-
-        self.assertEqual(response[1], requests.codes.ok)
-        self.assertDictEqual(
-            response[0],
-            {
-                "field_name": field,
-                "field_description": description,
-                "field_type": "categorical",
-                "cell_counts": {"abc": 123, "def": 456}})
+        mock_get_field_detail.assert_not_called()
 
         field = 'genes_detected'
-        description = constants.FIELD_DETAIL[field]
-        mock_transaction.return_value = [(10, 100)]
+        detail = {
+            "field_name": field,
+            "field_description": constants.FIELD_DETAIL[field],
+            "field_type": "numeric",
+            "minimum": 10,
+            "maximum": 100}
+        mock_get_field_detail.return_value = detail
+
         response = core.get_field_detail(field)
 
         self.assertEqual(response[1], requests.codes.ok)
-        self.assertDictEqual(
-            response[0],
-            {
-                "field_name": field,
-                "field_description": description,
-                "field_type": "numeric",
-                "minimum": 10,
-                "maximum": 100})
+        self.assertDictEqual(response[0], detail)
+        mock_get_field_detail.assert_called_once_with(field)
 
     def test_get_feature_detail(self):
 
@@ -15,6 +15,7 @@ class TestDriver(unittest.TestCase):
         self._bundles_per_worker = 100
         self._driver = Driver(self.request_id, self._bundles_per_worker)
 
+    @mock.patch("matrix.lambdas.daemons.v0.driver.Driver._add_request_query_to_sqs")
     @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
     @mock.patch("matrix.lambdas.daemons.v0.driver.Driver._format_and_store_queries_in_s3")
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_subtask_execution")
@@ -23,10 +24,11 @@ class TestDriver(unittest.TestCase):
                           mock_set_table_field_with_value,
                           mock_complete_subtask_execution,
                           mock_store_queries_in_s3,
-                          mock_redshift_transaction):
+                          mock_redshift_transaction,
+                          mock_add_to_sqs):
         bundle_fqids = ["id1.version", "id2.version"]
         format = "test_format"
-        mock_store_queries_in_s3.return_value = []
+        mock_store_queries_in_s3.return_value = {query_type: "s3_key" for query_type in QueryType}
         mock_redshift_transaction.return_value = [[2]]
 
         self._driver.run(bundle_fqids, None, format)
@@ -36,7 +38,9 @@ class TestDriver(unittest.TestCase):
                                                                 RequestTableField.NUM_BUNDLES,
                                                                 len(bundle_fqids))
         mock_complete_subtask_execution.assert_called_once_with(Subtask.DRIVER)
+        mock_add_to_sqs.assert_called_once_with(QueryType.CELL, "s3_key", {"expression": "s3_key"})
 
+    @mock.patch("matrix.lambdas.daemons.v0.driver.Driver._add_request_query_to_sqs")
     @mock.patch("matrix.common.aws.redshift_handler.RedshiftHandler.transaction")
     @mock.patch("matrix.lambdas.daemons.v0.driver.Driver._format_and_store_queries_in_s3")
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_subtask_execution")
@@ -49,11 +53,12 @@ class TestDriver(unittest.TestCase):
                           mock_set_table_field_with_value,
                           mock_complete_subtask_execution,
                           mock_store_queries_in_s3,
-                          mock_redshift_transaction):
+                          mock_redshift_transaction,
+                          mock_add_to_sqs):
         bundle_fqids_url = "test_url"
         bundle_fqids = ["id1.version", "id2.version"]
         format = "test_format"
-        mock_store_queries_in_s3.return_value = []
+        mock_store_queries_in_s3.return_value = {query_type: "s3_key" for query_type in QueryType}
         mock_redshift_transaction.return_value = [[2]]
 
         mock_parse_download_manifest.return_value = bundle_fqids
@@ -84,7 +89,7 @@ class TestDriver(unittest.TestCase):
         bundle_fqids_url = "test_url"
         bundle_fqids = ["id1.version", "id2.version"]
         format = "test_format"
-        mock_store_queries_in_s3.return_value = []
+        mock_store_queries_in_s3.return_value = {query_type: "s3_key" for query_type in QueryType}
         mock_redshift_transaction.return_value = [[3]]
 
         mock_parse_download_manifest.return_value = bundle_fqids
@@ -116,7 +121,7 @@ class TestDriver(unittest.TestCase):
         bundle_fqids_url = "test_url"
         bundle_fqids = []
         format = "test_format"
-        mock_store_queries_in_s3.return_value = []
+        mock_store_queries_in_s3.return_value = {query_type: "s3_key" for query_type in QueryType}
         mock_redshift_transaction.return_value = [[3]]
 
         mock_parse_download_manifest.return_value = bundle_fqids
@@ -1,7 +1,9 @@
+import json
 import unittest
 import uuid
 from unittest import mock
 
+from matrix.common.aws.dynamo_handler import DynamoTable, RequestTableField
 from matrix.common.request.request_tracker import Subtask
 from matrix.common.config import MatrixInfraConfig
 from matrix.lambdas.daemons.v1.driver import Driver
@@ -32,7 +34,45 @@ class TestDriver(unittest.TestCase):
         self._driver.run(filter_, fields, feature)
 
         mock_complete_subtask_execution.assert_called_once_with(Subtask.DRIVER)
-        self.assertEqual(mock_store_content_in_s3.call_count, 3)
+        self.assertEqual(mock_store_content_in_s3.call_count, 2)
+        mock_add_to_sqs.assert_called_once_with(QueryType.CELL, "s3_key", {"expression": "s3_key"})
+
+    @mock.patch("matrix.lambdas.daemons.v1.driver.Driver.redshift_role_arn")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.data_version", new_callable=mock.PropertyMock)
+    @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.get_table_item")
+    @mock.patch("matrix.common.aws.dynamo_handler.DynamoHandler.set_table_field_with_value")
+    @mock.patch("matrix.lambdas.daemons.v1.driver.Driver._add_request_query_to_sqs")
+    @mock.patch("matrix.common.aws.s3_handler.S3Handler.store_content_in_s3")
+    @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_subtask_execution")
+    def test_run_with_project_filter(self,
+                                     mock_complete_subtask_execution,
+                                     mock_store_content_in_s3,
+                                     mock_add_to_sqs,
+                                     mock_set_table_field_with_value,
+                                     mock_get_table_item,
+                                     mock_data_version,
+                                     mock_redshift_role):
+        filter_ = {"op": "in", "field": "project.provenance.document_id", "value": ["project_a", "project_b"]}
+        fields = ["test.field1", "test.field2"]
+        feature = "gene"
+
+        mock_store_content_in_s3.return_value = "s3_key"
+        mock_redshift_role.return_value = "redshift_role"
+        mock_data_version.return_value = 1
+        mock_get_table_item.return_value = {'ProjectCellCounts': {"project_a": 10}}
+
+        self._driver.run(filter_, fields, feature)
+
+        mock_complete_subtask_execution.assert_called_once_with(Subtask.DRIVER)
+        mock_store_content_in_s3.assert_called_once_with(f"{self.request_id}/project_union", mock.ANY)
+        shards = json.loads(mock_store_content_in_s3.call_args[0][1])
+        self.assertEqual([shard['manifest_key'] for shard in shards['expression']],
+                         ["project_shards/1/project_a/expression/gene/expression_manifest"])
+        mock_set_table_field_with_value.assert_called_once_with(DynamoTable.REQUEST_TABLE,
+                                                                self.request_id,
+                                                                RequestTableField.EXPECTED_QUERY_EXECUTIONS,
+                                                                1)
+        mock_add_to_sqs.assert_called_once_with(QueryType.PROJECT_UNION, "s3_key")
 
     @mock.patch("matrix.common.aws.sqs_handler.SQSHandler.add_message_to_queue")
     @mock.patch("matrix.common.request.request_tracker.RequestTracker.complete_subtask_execution")
@@ -54,3 +94,19 @@ class TestDriver(unittest.TestCase):
             'type': "cell"
         }
         mock_add_to_queue.assert_called_once_with("query_job_q_url", payload)
+
+    @mock.patch("matrix.common.aws.sqs_handler.SQSHandler.add_message_to_queue")
+    def test___add_request_queries_to_sqs__with_deferred_queries(self, mock_add_to_queue):
+        config = MatrixInfraConfig()
+        config.set({'query_job_q_url': "query_job_q_url"})
+        self._driver.config = config
+
+        self._driver._add_request_query_to_sqs(QueryType.CELL, "test_path", {"expression": "test_expression_path"})
+
+        payload = {
+            'request_id': self.request_id,
+            's3_obj_key': "test_path",
+            'type': "cell",
+            'deferred_queries': {"expression": "test_expression_path"}
+        }
+        mock_add_to_queue.assert_called_once_with("query_job_q_url", payload)
@@ -1,7 +1,7 @@
 import os
 from unittest import mock
 
-from matrix.common.aws.dynamo_handler import DynamoHandler, DynamoTable, DeploymentTableField
+from matrix.common.aws.dynamo_handler import DataVersionTableField, DynamoHandler, DynamoTable, DeploymentTableField
 from matrix.common.exceptions import MatrixException
 from scripts.redshift.bump_data_version import bump_data_version
 from tests.unit import MatrixTestCaseUsingMockAWS
@@ -21,22 +21,44 @@ class TestBumpDataVersion(MatrixTestCaseUsingMockAWS):
         self.dynamo_handler = DynamoHandler()
         self.deployment_stage = os.environ['DEPLOYMENT_STAGE']
 
-    @mock.patch("matrix.common.v1_api_handler.V1ApiHandler.describe_filter")
-    def test_bump_data_version(self, mock_describe_filter):
+    @mock.patch("scripts.redshift.bump_data_version.MatrixRedshiftConfig")
+    @mock.patch("matrix.common.query.project_shards.ProjectShards.build_missing")
+    @mock.patch("matrix.common.query.feature_table.FeatureTable.get_or_build")
+    @mock.patch("matrix.common.field_details.FieldDetailStore.build_all")
+    def test_bump_data_version(self,
+                               mock_build_field_details,
+                               mock_get_or_build_feature_table,
+                               mock_build_missing_project_shards,
+                               mock_redshift_config):
         self.assertEqual(self._get_current_data_version(), 0)
         self.assertTrue(self._data_version_exists(0))
         self.assertFalse(self._data_version_exists(1))
 
-        mock_describe_filter.return_value = {'cell_counts': {'test_project': 1}}
+        mock_build_field_details.return_value = {'project.provenance.document_id': {'cell_counts': {'test_project': 1}}}
         bump_data_version()
 
         self.assertEqual(self._get_current_data_version(), 1)
         self.assertTrue(self._data_version_exists(0))
         self.assertTrue(self._data_version_exists(1))
+        self.assertEqual(mock_get_or_build_feature_table.call_count, 2)
+        entry = self.dynamo_handler.get_table_item(DynamoTable.DATA_VERSION_TABLE, 1)
+        self.assertEqual(entry[DataVersionTableField.PROJECT_CELL_COUNTS.value], {'test_project': 1})
 
-    @mock.patch("matrix.common.v1_api_handler.V1ApiHandler.describe_filter")
-    def test_bump_data_version_existing(self, mock_describe_filter):
-        mock_describe_filter.return_value = {'cell_counts': {'test_project': 1}}
+        shards = mock_build_missing_project_shards.call_args[0][0]
+        self.assertEqual(len(shards['cell']), 1)
+        self.assertEqual(len(shards['expression']), 1)
+        self.assertTrue(shards['expression'][0]['manifest_key'].startswith("project_shards/1/test_project/"))
+
+    @mock.patch("scripts.redshift.bump_data_version.MatrixRedshiftConfig")
+    @mock.patch("matrix.common.query.project_shards.ProjectShards.build_missing")
+    @mock.patch("matrix.common.query.feature_table.FeatureTable.get_or_build")
+    @mock.patch("matrix.common.field_details.FieldDetailStore.build_all")
+    def test_bump_data_version_existing(self,
+                                        mock_build_field_details,
+                                        mock_get_or_build_feature_table,
+                                        mock_build_missing_project_shards,
+                                        mock_redshift_config):
+        mock_build_field_details.return_value = {'project.provenance.document_id': {'cell_counts': {'test_project': 1}}}
         bump_data_version()
         self.assertEqual(self._get_current_data_version(), 1)
         self.assertTrue(self._data_version_exists(1))
@@ -22,9 +22,16 @@ class TestSetDataVersion(MatrixTestCaseUsingMockAWS):
         self.dynamo_handler = DynamoHandler()
         self.deployment_stage = os.environ['DEPLOYMENT_STAGE']
 
-    @mock.patch("matrix.common.v1_api_handler.V1ApiHandler.describe_filter")
-    def test_set_data_version(self, mock_describe_filter):
-        mock_describe_filter.return_value = {'cell_counts': {'test_project': 1}}
+    @mock.patch("scripts.redshift.bump_data_version.MatrixRedshiftConfig")
+    @mock.patch("matrix.common.query.project_shards.ProjectShards.build_missing")
+    @mock.patch("matrix.common.query.feature_table.FeatureTable.get_or_build")
+    @mock.patch("matrix.common.field_details.FieldDetailStore.build_all")
+    def test_set_data_version(self,
+                              mock_build_field_details,
+                              mock_get_or_build_feature_table,
+                              mock_build_missing_project_shards,
+                              mock_redshift_config):
+        mock_build_field_details.return_value = {'project.provenance.document_id': {'cell_counts': {'test_project': 1}}}
         bump_data_version()
 
         with self.subTest("Success"):